@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Read packet captures inside tar and zip archives without extracting them.
+
+A capture in an archive is named like a file in a directory, as zipimport
+does: bundle.tar.gz/logs/eth0.pcap. Members are pcaps or pcapngs, which
+may be compressed (see compressed_file.py), found by their first bytes.
+
+* zip and uncompressed tar members are read from their place in the
+  archive, so any number of them can be read at once.
+* Compressed tars (like .tar.gz) can only be decompressed front to back.
+  Each process keeps its place in them (see TarStream), so reading members
+  in archive order decompresses the archive once. Reading members at once
+  (like the stream engine does) decompresses the tar to a temporary file
+  once instead.
+"""
+import contextlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from pcapgraph.compressed_file import get_compression, get_magic_compression
+from pcapgraph.compressed_file import get_reader, open_capture
+from pcapgraph.read_file import get_capture_format
+
+ZIP_MAGIC = b'PK\x03\x04'
+TAR_MAGIC = b'ustar'
+TAR_MAGIC_OFFSET = 257
+# Decompressed bytes of a compressed tar that can be read again.
+REWIND_BYTES = 2**22
+READ_CHUNK_BYTES = 2**20
+# {<tar>: {<member>: (<offset of its bytes>, <size>)}} of capture members
+TAR_INDEXES = {}
+# {<compressed tar>: TarStream}
+TAR_STREAMS = {}
+
+
+def split_member(filename):
+    """Split the name of an archive member into archive and member names.
+
+    Args:
+        filename (str): Name of a file or of an archive member.
+    Returns:
+        (tuple): (<archive name>, <member name>), or (filename, '') if
+            filename isn't in an archive.
+    """
+    archive = filename
+    while not os.path.isfile(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive or not parent:
+            return filename, ''
+        archive = parent
+    if archive == filename:
+        return filename, ''
+    return archive, filename[len(archive) + 1:]
+
+
+def is_member(filename):
+    """Check whether a filename names a member of an archive.
+
+    Args:
+        filename (str): Name of a file or of an archive member.
+    Returns:
+        (bool): Whether it is in an archive.
+    """
+    return bool(split_member(filename)[1])
+
+
+def is_random_access(filename):
+    """Check whether a file can be read at the same time as other files.
+
+    Args:
+        filename (str): Name of a file or of an archive member.
+    Returns:
+        (bool): False for members of compressed tars.
+    """
+    archive, member = split_member(filename)
+    return not member or get_archive_type(archive) == 'zip' or \
+        not get_compression(archive)
+
+
+def get_archive_type(filename):
+    """Identify a tar or zip archive by its first bytes.
+
+    Compressed tars are recognized after they are decompressed.
+
+    Args:
+        filename (str): Name of file.
+    Returns:
+        (str): 'zip', 'tar' or '' if it isn't an archive.
+    """
+    with open_capture(filename) as file:
+        header = file.read(TAR_MAGIC_OFFSET + len(TAR_MAGIC))
+    if header.startswith(ZIP_MAGIC):
+        return 'zip'
+    if header[TAR_MAGIC_OFFSET:] == TAR_MAGIC:
+        return 'tar'
+    return ''
+
+
+def get_archive_members(archive):
+    """Get the names of the packet captures in an archive, in archive order.
+
+    Args:
+        archive (str): Name of a tar or zip archive.
+    Returns:
+        (list): Names of members like bundle.zip/a.pcap.
+    """
+    if get_archive_type(archive) == 'zip':
+        with zipfile.ZipFile(archive) as zip_file:
+            members = [
+                info.filename for info in zip_file.infolist()
+                if not info.is_dir() and is_zip_capture(zip_file, info)
+            ]
+    else:
+        members = list(get_tar_index(archive))
+    return [archive + '/' + member for member in members]
+
+
+def is_zip_capture(zip_file, info):
+    """Check whether a zip member is a packet capture.
+
+    Args:
+        zip_file (zipfile.ZipFile): Open archive.
+        info (zipfile.ZipInfo): Member of the archive.
+    Returns:
+        (bool): Whether the member is a pcap or pcapng.
+    """
+    with zip_file.open(info) as member_file:
+        return is_capture(member_file)
+
+
+def is_capture(member_file):
+    """Check whether a file's first bytes are a (compressed) capture's.
+
+    Args:
+        member_file (file): Binary file object with peek() at its start.
+    Returns:
+        (bool): Whether the file is a pcap or pcapng.
+    """
+    compression = get_magic_compression(member_file.peek(4)[:4])
+    if not compression:
+        return bool(get_capture_format(member_file.read(4)))
+    with get_reader(member_file, compression) as capture:
+        return bool(get_capture_format(capture.read(4)))
+
+
+def get_tar_index(archive):
+    """Find where the packet captures of a tar are, once per process.
+
+    Uncompressed tars skip over members, compressed tars are decompressed.
+
+    Args:
+        archive (str): Name of a tar, which may be compressed.
+    Returns:
+        (dict): {<member>: (<offset of its bytes>, <size>)} in tar order.
+    """
+    if archive not in TAR_INDEXES:
+        mode = 'r|' if get_compression(archive) else 'r:'
+        with open_capture(archive) as file, \
+                tarfile.open(fileobj=file, mode=mode) as tar:
+            TAR_INDEXES[archive] = {
+                info.name: (info.offset_data, info.size)
+                for info in tar
+                if info.isfile() and is_capture(tar.extractfile(info))
+            }
+    return TAR_INDEXES[archive]
+
+
+def get_member_size(filename):
+    """Get the size of an archive member.
+
+    Args:
+        filename (str): Name of an archive member.
+    Returns:
+        (int): Bytes of the member as it is in the archive.
+    """
+    archive, member = split_member(filename)
+    if get_archive_type(archive) == 'zip':
+        with zipfile.ZipFile(archive) as zip_file:
+            return zip_file.getinfo(member).file_size
+    return get_tar_index(archive)[member][1]
+
+
+@contextlib.contextmanager
+def open_member(filename):
+    """Open an archive member for reading.
+
+    Args:
+        filename (str): Name of an archive member.
+    Yields:
+        (file): Binary file object with peek() of the member's bytes.
+    Raises:
+        FileNotFoundError: If the archive has no such capture.
+    """
+    archive, member = split_member(filename)
+    archive_type = get_archive_type(archive)
+    if archive_type == 'zip':
+        with zipfile.ZipFile(archive) as zip_file:
+            if member not in zip_file.namelist():
+                raise FileNotFoundError(filename)
+            with zip_file.open(member) as member_file:
+                yield member_file
+        return
+    tar_index = get_tar_index(archive) if archive_type else {}
+    if member not in tar_index:
+        raise FileNotFoundError(filename)
+    if get_compression(archive):
+        if archive not in TAR_STREAMS:
+            TAR_STREAMS[archive] = TarStream(archive)
+        yield TAR_STREAMS[archive].open(member)
+        return
+    with tarfile.open(archive, 'r:') as tar:
+        yield tar.extractfile(member)
+
+
+class TarStream:
+    """Read the members of a compressed tar front to back.
+
+    The last REWIND_BYTES that were decompressed are kept, so a member can
+    be opened again to read its start (as when its format is checked before
+    it is read). Reading further back (as when members are read at once or
+    a member is read again) decompresses the tar to a temporary file that
+    is read from then on.
+    """
+
+    def __init__(self, archive):
+        """Index a compressed tar.
+
+        Args:
+            archive (str): Name of a compressed tar.
+        """
+        self.archive = archive
+        self.index = get_tar_index(archive)
+        self.exit_stack = contextlib.ExitStack()
+        self.capture = None
+        self.position = 0
+        self.window = bytearray()
+        self.spill_file = None
+
+    def open(self, member):
+        """Open a member of the tar.
+
+        Args:
+            member (str): Name of a capture in the tar.
+        Returns:
+            (file): Binary file object with peek() of the member's bytes.
+        """
+        offset, size = self.index[member]
+        return io.BufferedReader(TarMember(self, offset, size))
+
+    def read_at(self, offset, size):
+        """Read decompressed bytes of the tar.
+
+        Args:
+            offset (int): Offset in the decompressed tar.
+            size (int): Bytes to read, up to READ_CHUNK_BYTES.
+        Returns:
+            (bytes): Bytes read, fewer at the end of the tar.
+        """
+        if self.spill_file is None and self.capture is not None and \
+                offset < self.position - len(self.window):
+            self.spill()
+        if self.spill_file is not None:
+            self.spill_file.seek(offset)
+            return self.spill_file.read(size)
+        if self.capture is None:
+            self.capture = self.exit_stack.enter_context(
+                open_capture(self.archive))
+        while self.position < offset + size:
+            chunk = self.capture.read(
+                min(offset + size - self.position, READ_CHUNK_BYTES))
+            if not chunk:
+                break
+            self.position += len(chunk)
+            self.window += chunk
+            del self.window[:-REWIND_BYTES]
+        start = offset - (self.position - len(self.window))
+        return bytes(self.window[start:start + size])
+
+    def spill(self):
+        """Decompress the whole tar to a temporary file.
+
+        The file has no name, so it is gone once it is closed.
+        """
+        self.exit_stack.close()
+        self.spill_file = self.exit_stack.enter_context(
+            tempfile.TemporaryFile(prefix='pcapgraph-'))
+        with open_capture(self.archive) as capture:
+            shutil.copyfileobj(capture, self.spill_file, READ_CHUNK_BYTES)
+        self.capture = None
+        self.window = bytearray()
+
+
+class TarMember(io.RawIOBase):
+    """The bytes of one member of a TarStream."""
+
+    def __init__(self, tar_stream, offset, size):
+        """Start at the beginning of a member.
+
+        Args:
+            tar_stream (TarStream): Tar that the member is in.
+            offset (int): Offset of the member's bytes in the tar.
+            size (int): Size of the member.
+        """
+        super().__init__()
+        self.tar_stream = tar_stream
+        self.offset = offset
+        self.size = size
+        self.read_bytes = 0
+
+    def readable(self):
+        """Members can be read."""
+        return True
+
+    def tell(self):
+        """Get the bytes of the member read so far."""
+        return self.read_bytes
+
+    def readinto(self, buffer):
+        """Read the next bytes of the member into a buffer.
+
+        Args:
+            buffer (memoryview): Writable buffer.
+        Returns:
+            (int): Bytes read (0 at the end of the member).
+        """
+        size = min(len(buffer), self.size - self.read_bytes,
+                   READ_CHUNK_BYTES)
+        data = self.tar_stream.read_at(self.offset + self.read_bytes, size)
+        buffer[:len(data)] = data
+        self.read_bytes += len(data)
+        return len(data)
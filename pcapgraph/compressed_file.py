@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Read and write compressed packet captures as streams.
+
+Compressed files are recognized by their first bytes, not their names:
+
+* gzip (.gz): built into Python
+* zstd (.zst): needs the zstandard package. Compression uses a thread per
+  CPU.
+* lz4 (.lz4): needs the lz4 package
+
+Files are decompressed while they are read and pcaps are compressed while
+they are written, so no uncompressed copy is kept on disk. tshark reads
+compressed files and archive members (see archive.py) from a pipe that is
+fed by a thread.
+"""
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import subprocess as sp
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+COMPRESSION_MAGICS = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\x04\x22\x4d\x18': 'lz4',
+}
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+ZSTD_LEVEL = 3
+# Uncompressed bytes read to estimate how much a file is compressed.
+RATIO_SAMPLE_BYTES = 2**22
+
+
+def get_compression(filename):
+    """Identify how a file is compressed by its first bytes.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Returns:
+        (str): 'gzip', 'zstd', 'lz4' or '' if it isn't compressed.
+    """
+    with open_raw(filename) as file:
+        return get_magic_compression(file.peek(4)[:4])
+
+
+def get_magic_compression(magic):
+    """Identify a compression by the first 4 bytes of a file.
+
+    Args:
+        magic (bytes): First 4 bytes of a file.
+    Returns:
+        (str): 'gzip', 'zstd', 'lz4' or ''.
+    """
+    for compression_magic, compression in COMPRESSION_MAGICS.items():
+        if magic.startswith(compression_magic):
+            return compression
+    return ''
+
+
+def check_compression(compression):
+    """Check that the package of a compression is installed.
+
+    Args:
+        compression (str): 'gzip', 'zstd' or 'lz4'.
+    Raises:
+        ImportError: If zstandard or lz4 is needed and missing.
+    """
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError("zstd needs the zstandard package "
+                          "(pip install zstandard).")
+    if compression == 'lz4' and lz4 is None:
+        raise ImportError("lz4 needs the lz4 package (pip install lz4).")
+
+
+@contextlib.contextmanager
+def open_raw(filename):
+    """Open a file or an archive member for reading as it is stored.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Yields:
+        (file): Binary file object with peek().
+    """
+    # archive.py reads archives with this module, so it is imported late.
+    from pcapgraph import archive
+    if not archive.is_member(filename):
+        with open(filename, 'rb') as raw_file:
+            yield raw_file
+        return
+    with archive.open_member(filename) as member_file:
+        yield member_file
+
+
+def can_seek(filename):
+    """Check whether a file can be read at any offset as it is stored.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Returns:
+        (bool): True for uncompressed files and members of uncompressed
+            tars. Compressed files and zip members are decompressed again
+            to seek back.
+    """
+    from pcapgraph import archive
+    if get_compression(filename):
+        return False
+    if not archive.is_member(filename):
+        return True
+    archive_name, _ = archive.split_member(filename)
+    return archive.get_archive_type(archive_name) == 'tar' and \
+        not get_compression(archive_name)
+
+
+def get_file_size(filename):
+    """Get the size of a file or an archive member as it is stored.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Returns:
+        (int): Bytes of the file.
+    """
+    from pcapgraph import archive
+    if archive.is_member(filename):
+        return archive.get_member_size(filename)
+    return os.path.getsize(filename)
+
+
+@contextlib.contextmanager
+def open_capture(filename):
+    """Open a file for reading and decompress it if it is compressed.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Yields:
+        (file): Binary file object with peek() of the uncompressed bytes.
+    """
+    with open_raw(filename) as raw_file:
+        compression = get_magic_compression(raw_file.peek(4)[:4])
+        if not compression:
+            yield raw_file
+            return
+        with get_reader(raw_file, compression) as capture:
+            yield capture
+
+
+def get_reader(raw_file, compression):
+    """Decompress what is read from a binary stream.
+
+    Args:
+        raw_file (file): Binary file object at the start of the stream.
+        compression (str): 'gzip', 'zstd' or 'lz4'.
+    Returns:
+        (file): Binary file object of the uncompressed bytes. Closing it
+            leaves raw_file open.
+    """
+    check_compression(compression)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw_file, mode='rb')
+    if compression == 'zstd':
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            raw_file, read_across_frames=True, closefd=False))
+    return lz4.frame.LZ4FrameFile(raw_file, 'rb')
+
+
+@contextlib.contextmanager
+def open_writer(raw_file, compression):
+    """Compress what is written to a binary stream.
+
+    The compressed stream is finished on exit. raw_file stays open, so
+    several results can follow each other on stdout.
+
+    Args:
+        raw_file (file): Binary file object like a file or stdout.
+        compression (str): 'gzip', 'zstd', 'lz4' or '' for none.
+    Yields:
+        (file): Binary file object to write uncompressed bytes to.
+    """
+    if not compression:
+        yield raw_file
+        return
+    check_compression(compression)
+    if compression == 'gzip':
+        writer = gzip.GzipFile(fileobj=raw_file, mode='wb')
+    elif compression == 'zstd':
+        writer = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL, threads=-1).stream_writer(raw_file,
+                                                        closefd=False)
+    else:
+        writer = lz4.frame.LZ4FrameFile(raw_file, 'wb')
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def get_uncompressed_size(filename):
+    """Estimate the size of a file once it is decompressed.
+
+    The ratio of the first RATIO_SAMPLE_BYTES is used for the whole file.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Returns:
+        (int): Estimated bytes (the file size if it isn't compressed).
+    """
+    file_size = get_file_size(filename)
+    with open_raw(filename) as raw_file:
+        compression = get_magic_compression(raw_file.peek(4)[:4])
+        if not compression:
+            return file_size
+        with get_reader(raw_file, compression) as capture:
+            sample_bytes = len(capture.read(RATIO_SAMPLE_BYTES))
+        # Decompressors read ahead, so this underestimates a little.
+        compressed_bytes = raw_file.tell()
+    if sample_bytes < RATIO_SAMPLE_BYTES:
+        return sample_bytes
+    return int(file_size * sample_bytes / max(compressed_bytes, 1))
+
+
+def popen_tshark(filename, tshark_args, **popen_args):
+    """Start tshark reading filename, from a pipe if it is compressed.
+
+    Archive members are read from a pipe too. Two-pass analysis (-2) can't
+    read a pipe and is left out for it.
+
+    Args:
+        filename (str): Name of packet capture or of an archive member.
+        tshark_args (list): Arguments of tshark after -r <file>.
+        **popen_args: Arguments of subprocess.Popen like stdout.
+    Returns:
+        (subprocess.Popen): The tshark process.
+    """
+    from pcapgraph import archive
+    if not archive.is_member(filename) and (
+            not os.path.isfile(filename) or not get_compression(filename)):
+        # tshark reports files it can't read itself.
+        return sp.Popen(['tshark', '-r', filename, *tshark_args],
+                        **popen_args)
+    tshark_args = [arg for arg in tshark_args if arg != '-2']
+    tshark_sp = sp.Popen(['tshark', '-r', '-', *tshark_args],
+                         stdin=sp.PIPE, **popen_args)
+    # Only the thread writes to stdin, so communicate() must not close it.
+    stdin, tshark_sp.stdin = tshark_sp.stdin, None
+    threading.Thread(target=feed_pipe, args=(filename, stdin),
+                     daemon=True).start()
+    return tshark_sp
+
+
+def feed_pipe(filename, pipe):
+    """Write the decompressed bytes of a file to a pipe and close it.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+        pipe (file): Binary stdin of a process.
+    """
+    try:
+        with open_capture(filename) as capture, pipe:
+            shutil.copyfileobj(capture, pipe)
+    except BrokenPipeError:
+        pass  # The process stopped reading.
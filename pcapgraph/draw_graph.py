@@ -22,6 +22,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 import pcapgraph.manipulate_frames as mf
+from pcapgraph.compressed_file import popen_tshark
+from pcapgraph.set_result import SetResult
 
 
 def draw_graph(pcap_packets, input_files, output_fmts, exclude_empty,
@@ -30,6 +32,8 @@ def draw_graph(pcap_packets, input_files, output_fmts, exclude_empty,
 
     Args:
         pcap_packets (dict): All packets, where key is pcap filename/operation.
+            Set operations can be SetResults that are graphed without being
+            saved.
         input_files (list): List of input files that shouldn't be deleted.
         output_fmts (list): The save file type. Supported formats are dependent
             on the capabilites of the system: [png, pdf, ps, eps, and svg]. See
@@ -56,7 +60,12 @@ def draw_graph(pcap_packets, input_files, output_fmts, exclude_empty,
     for save_format in output_fmts:
         output_file(save_format, pcap_packets, exclude_empty, anonymize_names)
 
-    new_files = set(pcap_filenames) - set(input_files)
+    # Results that no output asked for were never saved.
+    unsaved_files = {
+        name for name, packets in pcap_packets.items()
+        if isinstance(packets, SetResult) and not packets.saved
+    }
+    new_files = set(pcap_filenames) - set(input_files) - unsaved_files
     remove_or_open_files(new_files, open_in_wireshark, delete_pcaps)
 
 
@@ -74,7 +83,11 @@ def output_file(save_format, pcap_packets, exclude_empty, anonymize_names):
         graph_vars = {}
         empty_files = []
         for filename in pcap_filenames:
-            graph_startstop_dict = get_graph_vars_from_file(filename)
+            if isinstance(pcap_packets[filename], SetResult):
+                graph_startstop_dict = \
+                    get_graph_vars_from_result(pcap_packets[filename])
+            else:
+                graph_startstop_dict = get_graph_vars_from_file(filename)
             filename = os.path.basename(os.path.splitext(filename)[0])
             if graph_startstop_dict:  # If it's a valid pcap
                 graph_vars[filename] = graph_startstop_dict
@@ -130,41 +143,71 @@ def get_graph_vars_from_file(filename):
     packet_count = mf.get_packet_count(filename)
 
     if packet_count:
-        start_time_cmds = [
-            'tshark', '-r', filename, '-2', '-Y', 'frame.number==1', '-T',
-            'fields', '-e', 'frame.time_epoch'
-        ]
-        end_time_cmds = [
-            'tshark', '-r', filename, '-2', '-Y',
-            'frame.number==' + str(packet_count), '-T', 'fields', '-e',
+        start_time_args = [
+            '-2', '-Y', 'frame.number==1', '-T', 'fields', '-e',
             'frame.time_epoch'
         ]
-        pcap_start_pipe = sp.Popen(
-            start_time_cmds, stdout=sp.PIPE, stderr=sp.PIPE)
-        pcap_end_pipe = sp.Popen(end_time_cmds, stdout=sp.PIPE, stderr=sp.PIPE)
+        end_time_args = [
+            '-2', '-Y', 'frame.number==' + str(packet_count), '-T', 'fields',
+            '-e', 'frame.time_epoch'
+        ]
+        pcap_start_pipe = popen_tshark(
+            filename, start_time_args, stdout=sp.PIPE, stderr=sp.PIPE)
+        pcap_end_pipe = popen_tshark(
+            filename, end_time_args, stdout=sp.PIPE, stderr=sp.PIPE)
         pcap_start = float(mf.decode_stdout(pcap_start_pipe))
         pcap_end = float(mf.decode_stdout(pcap_end_pipe))
         pcap_start_pipe.kill()
         pcap_end_pipe.kill()
 
-        tcpdump_release_time = 946684800
-        if pcap_start < tcpdump_release_time or \
-                pcap_end < tcpdump_release_time:
-            print(
-                "!!! Packets from ", filename,
-                " must have traveled via a flux capacitor because they're in"
-                " the past or the future!\n!!! Timestamps predate the "
-                "release of tcpdump or are negative."
-                "\n!!! Excluding from results.\n")
-            return {}
-
-        return {'pcap_start': pcap_start, 'pcap_end': pcap_end}
+        return get_graph_vars(filename, pcap_start, pcap_end)
     # (else) May need to raise an exception for this as it means input is bad.
     print("!!! ERROR: Packet capture", filename,
           " has no packets or cannot be read!\n")
     return {}
 
 
+def get_graph_vars_from_result(set_result):
+    """Like get_graph_vars_from_file, but for an unsaved set operation.
+
+    Args:
+        set_result (SetResult): Result of a set operation.
+    Returns:
+        (dict): Result start/stop times if it has 1+ packets.
+    """
+    time_bounds = set_result.get_time_bounds()
+    if time_bounds:
+        pcap_start, pcap_end = (timestamp / 10**9 for timestamp in time_bounds)
+        return get_graph_vars(set_result.name, pcap_start, pcap_end)
+    print("!!! ERROR: Packet capture", set_result.name,
+          " has no packets or cannot be read!\n")
+    return {}
+
+
+def get_graph_vars(filename, pcap_start, pcap_end):
+    """Check that a pcap's start and end times can be graphed.
+
+    Args:
+        filename (str): Name of file
+        pcap_start (float): Timestamp of first packet.
+        pcap_end (float): Timestamp of last packet.
+    Returns:
+        (dict): File start/stop times if they are valid.
+    """
+    tcpdump_release_time = 946684800
+    if pcap_start < tcpdump_release_time or \
+            pcap_end < tcpdump_release_time:
+        print(
+            "!!! Packets from ", filename,
+            " must have traveled via a flux capacitor because they're in"
+            " the past or the future!\n!!! Timestamps predate the "
+            "release of tcpdump or are negative."
+            "\n!!! Excluding from results.\n")
+        return {}
+
+    return {'pcap_start': pcap_start, 'pcap_end': pcap_end}
+
+
 def generate_graph(pcap_vars, empty_files, anonymize_names):
     """Generate the matplotlib graph.
 
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Estimate how much pcaps overlap from small sketches of each pcap.
+
+Each pcap is read once, in chunks of fingerprints, into:
+
+* a HyperLogLog sketch (16 KiB) that estimates its distinct frames. The
+  union of sketches is their register-wise max.
+* a Bloom filter (1 MiB) that answers whether a frame may be in it.
+
+The first pcap is read last. Its frames that are in every other pcap's Bloom
+filter are the intersection, and those in none are its difference. Frames
+only in one of the other pcaps are estimated as |union| - |union without
+that pcap|. Memory depends on the number of pcaps, not their size.
+
+Error bounds are two standard errors of the sketches (~95%), plus the
+frames that Bloom filter false positives may have misplaced.
+"""
+import math
+
+import numpy as np
+
+from pcapgraph.manipulate_frames import get_frame_fingerprint
+from pcapgraph.manipulate_frames import strip_frame
+from pcapgraph.read_file import iter_frames
+
+HLL_PRECISION = 14
+HLL_REGISTERS = 2**HLL_PRECISION
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+BLOOM_BITS = 2**23
+BLOOM_HASHES = 4
+# Standard errors in an error bound.
+ERROR_BOUND_ERRORS = 2
+CHUNK_FRAMES = 65536
+
+
+class HyperLogLog:
+    """Estimate the number of distinct fingerprints added."""
+
+    def __init__(self, registers=None):
+        """Start an empty sketch (or wrap registers of another sketch).
+
+        Args:
+            registers (np.ndarray): uint8 registers of a sketch.
+        """
+        if registers is None:
+            registers = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, fingerprints):
+        """Add fingerprints to the sketch.
+
+        The first HLL_PRECISION bits choose a register, which keeps the
+        highest position of the first set bit in the remaining bits.
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints.
+        """
+        remaining_bits = 64 - HLL_PRECISION
+        registers = (fingerprints >> np.uint64(remaining_bits)).astype(
+            np.int64)
+        remaining = fingerprints & np.uint64(2**remaining_bits - 1)
+        # Values below 2**53 are exact as floats, so frexp gives bit lengths.
+        _, bit_lengths = np.frexp(remaining.astype(np.float64))
+        ranks = (remaining_bits + 1 - bit_lengths).astype(np.uint8)
+        np.maximum.at(self.registers, registers, ranks)
+
+    def merge(self, other):
+        """Get the sketch of the union of both sketches.
+
+        Args:
+            other (HyperLogLog): Another sketch.
+        Returns:
+            (HyperLogLog): Sketch of the union.
+        """
+        return HyperLogLog(np.maximum(self.registers, other.registers))
+
+    def count(self):
+        """Estimate the number of distinct fingerprints.
+
+        Returns:
+            (float): Estimated count.
+        """
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        estimate = alpha * HLL_REGISTERS**2 / np.sum(
+            np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty_registers = np.count_nonzero(self.registers == 0)
+        # Small counts leave registers empty. Count them like a bitmap.
+        if estimate <= 2.5 * HLL_REGISTERS and empty_registers:
+            estimate = HLL_REGISTERS * math.log(
+                HLL_REGISTERS / empty_registers)
+        return float(estimate)
+
+
+class BloomFilter:
+    """Tell whether a fingerprint may have been added."""
+
+    def __init__(self):
+        """Start an empty filter."""
+        self.bits = np.zeros(BLOOM_BITS // 8, dtype=np.uint8)
+
+    @staticmethod
+    def get_positions(fingerprints):
+        """Get the bits of each fingerprint by double hashing.
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints.
+        Returns:
+            (np.ndarray): Array of shape (BLOOM_HASHES, len(fingerprints)).
+        """
+        low = fingerprints & np.uint64(2**32 - 1)
+        high = (fingerprints >> np.uint64(32)) | np.uint64(1)
+        hash_nums = np.arange(BLOOM_HASHES, dtype=np.uint64)[:, None]
+        return (low + hash_nums * high) % np.uint64(BLOOM_BITS)
+
+    def add(self, fingerprints):
+        """Add fingerprints to the filter.
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints.
+        """
+        positions = self.get_positions(fingerprints).ravel()
+        bit_masks = np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), bit_masks)
+
+    def contains(self, fingerprints):
+        """Check whether fingerprints may be in the filter.
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints.
+        Returns:
+            (np.ndarray): Boolean per fingerprint. False is never wrong.
+        """
+        positions = self.get_positions(fingerprints)
+        bits = self.bits[positions >> np.uint64(3)] >> \
+            (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=0)
+
+    def get_false_positive_rate(self):
+        """Get the chance that a fingerprint that wasn't added is found.
+
+        Returns:
+            (float): False positive rate from the bits that are set.
+        """
+        set_bits = np.unpackbits(self.bits).sum()
+        return float((set_bits / BLOOM_BITS)**BLOOM_HASHES)
+
+
+def iter_fingerprint_chunks(filename, options):
+    """Yield the fingerprints of a pcap's stripped frames in chunks.
+
+    Args:
+        filename (str): Name of packet capture.
+        options (dict): Whether to strip L2 and L3 headers.
+    Yields:
+        (np.ndarray): uint64 fingerprints of up to CHUNK_FRAMES frames.
+    """
+    fingerprints = []
+    for _, frame, linktype in iter_frames(filename):
+        fingerprints.append(
+            get_frame_fingerprint(strip_frame(frame.hex(), linktype,
+                                              options)))
+        if len(fingerprints) == CHUNK_FRAMES:
+            yield np.array(fingerprints, dtype=np.uint64)
+            fingerprints = []
+    if fingerprints:
+        yield np.array(fingerprints, dtype=np.uint64)
+
+
+def get_estimates(filenames, options):
+    """Estimate the sizes of set operations by reading each pcap once.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers.
+    Returns:
+        (dict): Estimates as (<estimate>, <error bound>) of distinct frames:
+            'union', 'intersection': Of all pcaps.
+            'only': Frames only in each pcap (its symmetric difference).
+            'frame_counts': Frames in each pcap (exact).
+    """
+    sketches = [HyperLogLog() for _ in filenames]
+    blooms = [BloomFilter() for _ in filenames[1:]]
+    frame_counts = [0] * len(filenames)
+    intersection = HyperLogLog()
+    first_only = HyperLogLog()
+    # The first pcap is read last to be checked against all other filters.
+    for pcap_index in list(range(1, len(filenames))) + [0]:
+        for fingerprints in iter_fingerprint_chunks(filenames[pcap_index],
+                                                    options):
+            frame_counts[pcap_index] += len(fingerprints)
+            sketches[pcap_index].add(fingerprints)
+            if pcap_index:
+                blooms[pcap_index - 1].add(fingerprints)
+                continue
+            in_blooms = np.array(
+                [bloom.contains(fingerprints) for bloom in blooms],
+                dtype=bool).reshape(len(blooms), len(fingerprints))
+            intersection.add(fingerprints[in_blooms.all(axis=0)])
+            first_only.add(fingerprints[~in_blooms.any(axis=0)])
+
+    union = HyperLogLog()
+    for sketch in sketches:
+        union = union.merge(sketch)
+    union_count = union.count()
+    # A frame only in the first pcap may be found in another pcap's filter.
+    missed_rate = 1 - np.prod(
+        [1 - bloom.get_false_positive_rate() for bloom in blooms])
+    estimates = {
+        'union': get_estimate(union_count, union_count),
+        'intersection': get_estimate(intersection.count(),
+                                     intersection.count()),
+        'only': [get_estimate(first_only.count(), first_only.count(),
+                              missed_rate)],
+        'frame_counts': frame_counts,
+    }
+    for pcap_index in range(1, len(filenames)):
+        others = HyperLogLog()
+        for sketch in sketches[:pcap_index] + sketches[pcap_index + 1:]:
+            others = others.merge(sketch)
+        # Both counts have errors, so the error of the difference adds up.
+        others_count = others.count()
+        estimates['only'].append(
+            get_estimate(union_count - others_count,
+                         union_count + others_count))
+    return estimates
+
+
+def get_estimate(estimate, error_base, missed_rate=0.0):
+    """Round an estimate and get its error bound.
+
+    Args:
+        estimate (float): Estimated distinct frames.
+        error_base (float): Count(s) whose sketch errors add up.
+        missed_rate (float): Fraction of frames that Bloom filter false
+            positives may have moved out of the estimate.
+    Returns:
+        (tuple): (<estimate>, <error bound>) as ints.
+    """
+    error = ERROR_BOUND_ERRORS * HLL_STANDARD_ERROR * error_base + \
+        missed_rate * estimate
+    return max(round(estimate), 0), math.ceil(error)
+
+
+def print_estimates(filenames, options):
+    """Print estimated set operation sizes and SAME % with error bounds.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers.
+    """
+    estimates = get_estimates(filenames, options)
+    row_format = "{: <12} {: <12} {: <}"
+    print(row_format.format('\nESTIMATE', '+/- ERROR', 'SET'))
+    for operation in ['union', 'intersection']:
+        print(row_format.format(*map(str, estimates[operation]), operation))
+    for pcap, only in zip(filenames, estimates['only']):
+        print(row_format.format(*map(str, only), 'only in ' + pcap))
+
+    intersection_count, intersection_error = estimates['intersection']
+    print(row_format.format('\nSAME %', '+/- ERROR', 'PCAP NAME'))
+    for pcap, frame_count in zip(filenames, estimates['frame_counts']):
+        frame_count = frame_count or 1
+        print(
+            row_format.format(
+                str(round(100 * intersection_count / frame_count)) + '%',
+                str(math.ceil(100 * intersection_error / frame_count)) + '%',
+                pcap))
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Export every frame of a comparison with its membership as columns.
+
+With --export <file>, the frame table and membership index (see
+frame_table.py and parallel_math.py) are written with one row per frame,
+so that results can be joined with flow logs in pandas or DuckDB without
+parsing pcaps again:
+
+* capture: filename of the pcap that the frame is in
+* timestamp_ns: int64 ns since the epoch
+* length: bytes of the frame as it was captured
+* fingerprint: uint64 fingerprint of the (stripped) frame, the same in
+  every pcap that saw it
+* membership: pcaps that saw the frame, bit 1 << i for the i-th pcap given.
+  Beyond 64 pcaps, the np.packbits bytes of the index (hex in CSV).
+* with --export-flows: protocol, src_ip, src_port, dst_ip and dst_port of
+  IP frames, decoded from the frames as they were captured
+
+The extension picks the format: .parquet and .arrow/.feather (Arrow IPC)
+need the pyarrow package, anything else is CSV. Rows are written
+EXPORT_BATCH_FRAMES at a time from slices of the table's arrays.
+"""
+import csv
+import os
+
+import numpy as np
+
+from pcapgraph.save_file import get_output_linktype
+from pcapgraph.top_talkers import get_five_tuple
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_BATCH_FRAMES = 2**16
+EXPORT_COLUMNS = ['capture', 'timestamp_ns', 'length', 'fingerprint',
+                  'membership']
+FLOW_COLUMNS = ['protocol', 'src_ip', 'src_port', 'dst_ip', 'dst_port']
+ARROW_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+# Pcaps whose membership bits fit in a uint64.
+MAX_BITMASK_PCAPS = 64
+
+
+def get_export_format(filename):
+    """Get the format that a file is exported as from its extension.
+
+    Args:
+        filename (str): Name of the export.
+    Returns:
+        (str): 'parquet', 'arrow' or 'csv'.
+    """
+    return ARROW_FORMATS.get(os.path.splitext(filename)[1].lower(), 'csv')
+
+
+def export_frames(pcap_math, filename, flows=False):
+    """Write every frame of the pcaps of a comparison with its membership.
+
+    Args:
+        pcap_math (PcapMath): Memory or incremental engine of the pcaps.
+        filename (str): Name of the export. Its extension picks the format.
+        flows (bool): Whether to decode the 5-tuple of each frame.
+    Raises:
+        ImportError: If the format needs pyarrow and it is missing.
+    """
+    export_format = get_export_format(filename)
+    if export_format != 'csv' and pyarrow is None:
+        raise ImportError("--export to " + export_format + " needs the "
+                          "pyarrow package (pip install pyarrow).")
+    fingerprints, _, membership = pcap_math.get_membership_index()
+    columns = EXPORT_COLUMNS + (FLOW_COLUMNS if flows else [])
+    batches = iter_batches(pcap_math.frame_table, (fingerprints, membership),
+                           len(pcap_math.filenames), pcap_math.options,
+                           flows)
+    if export_format == 'csv':
+        write_csv(filename, columns, batches, pcap_math.filenames)
+    else:
+        write_arrow(filename, columns, batches, pcap_math.filenames,
+                    export_format)
+    print("Exported", len(pcap_math.frame_table), "frames to", filename)
+
+
+def iter_batches(frame_table, index, pcap_count, options, flows=False):
+    """Get the columns of the frames of a table, EXPORT_BATCH_FRAMES at once.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps.
+        index (tuple): Fingerprints and packed membership bits of the
+            membership index (see parallel_math.index_shard).
+        pcap_count (int): Number of pcaps.
+        options (dict): Whether L2/L3 headers were stripped and the
+            'linktype' of the pcaps.
+        flows (bool): Whether to decode the 5-tuple of each frame.
+    Yields:
+        (dict): {<column>: <values>} where capture is the index of the pcap
+            and membership is packed bits beyond MAX_BITMASK_PCAPS pcaps.
+    """
+    fingerprints, membership = index
+    order = np.argsort(fingerprints, kind='stable')
+    pcap_indices = frame_table.get_pcap_indices()
+    for start in range(0, len(frame_table), EXPORT_BATCH_FRAMES):
+        end = min(start + EXPORT_BATCH_FRAMES, len(frame_table))
+        frame_fingerprints = frame_table.fingerprints[start:end]
+        rows = order[np.searchsorted(fingerprints, frame_fingerprints,
+                                     sorter=order)]
+        batch = {
+            'capture': pcap_indices[start:end],
+            'timestamp_ns': frame_table.timestamps[start:end],
+            'length': np.where(frame_table.source_offsets[start:end] >= 0,
+                               frame_table.source_lengths[start:end],
+                               np.diff(frame_table.offsets[start:end + 1])),
+            'fingerprint': frame_fingerprints,
+            'membership': get_membership_masks(membership[rows], pcap_count),
+        }
+        if flows:
+            batch.update(get_flow_columns(frame_table, start, end, options))
+        yield batch
+
+
+def get_membership_masks(membership, pcap_count):
+    """Turn packed membership bits into bitmasks.
+
+    Args:
+        membership (np.ndarray): Packed membership bits of rows.
+        pcap_count (int): Number of pcaps.
+    Returns:
+        (np.ndarray): uint64 masks with bit 1 << i set for the i-th pcap,
+            or membership itself beyond MAX_BITMASK_PCAPS pcaps.
+    """
+    if pcap_count > MAX_BITMASK_PCAPS:
+        return membership
+    members = np.unpackbits(membership, axis=1, count=pcap_count)
+    bits = np.left_shift(np.uint64(1), np.arange(pcap_count, dtype=np.uint64))
+    return (members.astype(np.uint64) * bits).sum(axis=1, dtype=np.uint64)
+
+
+def get_flow_columns(frame_table, start, end, options):
+    """Decode the 5-tuple of frames start to end of a table.
+
+    Frames are decoded as they were captured if the table has their source
+    (see FrameTable.source_names), else as they were compared.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps.
+        start (int): First frame.
+        end (int): Frame after the last frame.
+        options (dict): Options as in iter_batches.
+    Returns:
+        (dict): {<flow column>: [<value or None>, ...]}
+    """
+    frame_nums = np.arange(start, end)
+    known = frame_table.source_offsets[start:end] >= 0
+    linktypes = np.where(known, frame_table.linktypes[start:end],
+                         get_output_linktype(options))
+    captured = known & bool(frame_table.source_names)
+    captured_frames = frame_table.iter_captured_frames(
+        frame_nums[captured].tolist())
+    compared_frames = frame_table.iter_frames_at(
+        frame_nums[~captured].tolist())
+    columns = {column: [] for column in FLOW_COLUMNS}
+    for is_captured, linktype in zip(captured.tolist(), linktypes.tolist()):
+        frame = next(captured_frames if is_captured else compared_frames)
+        five_tuple = get_five_tuple(frame.hex(), linktype) or (None, ) * 5
+        for column, value in zip(FLOW_COLUMNS, five_tuple):
+            columns[column].append(value)
+    captured_frames.close()
+    compared_frames.close()
+    return columns
+
+
+def write_csv(filename, columns, batches, filenames):
+    """Write batches of columns as CSV with a header row.
+
+    Args:
+        filename (str): Name of the CSV.
+        columns (list): Names of the columns.
+        batches (iterable): Columns of frames (see iter_batches).
+        filenames (list): Filename of each pcap.
+    """
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for batch in batches:
+            values = [get_column_values(batch, column, filenames)
+                      for column in columns]
+            writer.writerows(zip(*values))
+
+
+def get_column_values(batch, column, filenames):
+    """Get the values of a column of a batch as Python objects.
+
+    Args:
+        batch (dict): Columns of frames (see iter_batches).
+        column (str): Name of the column.
+        filenames (list): Filename of each pcap.
+    Returns:
+        (list): Values, with pcap filenames and hex of packed bits.
+    """
+    values = batch[column]
+    if column == 'capture':
+        return [filenames[pcap_index] for pcap_index in values.tolist()]
+    if isinstance(values, np.ndarray) and values.ndim == 2:
+        return [row.tobytes().hex() for row in values]
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return values
+
+
+def get_arrow_schema(columns, pcap_count):
+    """Get the Arrow types of the exported columns.
+
+    Args:
+        columns (list): Names of the columns.
+        pcap_count (int): Number of pcaps.
+    Returns:
+        (pyarrow.Schema): Schema of the export.
+    """
+    types = {
+        'capture': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        'timestamp_ns': pyarrow.int64(),
+        'length': pyarrow.int64(),
+        'fingerprint': pyarrow.uint64(),
+        'membership': pyarrow.uint64()
+        if pcap_count <= MAX_BITMASK_PCAPS else pyarrow.binary(),
+        'protocol': pyarrow.uint8(),
+        'src_ip': pyarrow.string(),
+        'src_port': pyarrow.uint16(),
+        'dst_ip': pyarrow.string(),
+        'dst_port': pyarrow.uint16(),
+    }
+    return pyarrow.schema([(column, types[column]) for column in columns])
+
+
+def get_record_batch(batch, schema, filenames):
+    """Convert a batch of columns to Arrow.
+
+    Args:
+        batch (dict): Columns of frames (see iter_batches).
+        schema (pyarrow.Schema): Schema of the export.
+        filenames (list): Filename of each pcap.
+    Returns:
+        (pyarrow.RecordBatch): Batch of the export.
+    """
+    arrays = []
+    for field in schema:
+        values = batch[field.name]
+        if field.name == 'capture':
+            arrays.append(pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(values.astype(np.int32)),
+                pyarrow.array(filenames, pyarrow.string())))
+        elif field.type == pyarrow.binary():
+            arrays.append(pyarrow.array(
+                [row.tobytes() for row in values], pyarrow.binary()))
+        else:
+            arrays.append(pyarrow.array(values, field.type))
+    return pyarrow.record_batch(arrays, schema=schema)
+
+
+def write_arrow(filename, columns, batches, filenames, export_format):
+    """Write batches of columns as a Parquet or Arrow IPC file.
+
+    Args:
+        filename (str): Name of the export.
+        columns (list): Names of the columns.
+        batches (iterable): Columns of frames (see iter_batches).
+        filenames (list): Filename of each pcap.
+        export_format (str): 'parquet' or 'arrow'.
+    """
+    schema = get_arrow_schema(columns, len(filenames))
+    if export_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(filename, schema)
+    else:
+        writer = pyarrow.ipc.new_file(filename, schema)
+    with writer:
+        for batch in batches:
+            writer.write_table(pyarrow.Table.from_batches(
+                [get_record_batch(batch, schema, filenames)]))
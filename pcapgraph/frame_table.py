@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Store every frame of every pcap in flat arrays that processes can share.
+
+Frame strings are large and pickling them to every worker process copies
+them once per worker. A FrameTable keeps all frames as fixed-type arrays:
+
+* payload: uint8 bytes of all frames, back to back
+* offsets: int64 start of each frame in payload (plus the end of the last)
+* timestamps: int64 ns timestamp of each frame
+* fingerprints: uint64 fingerprint of each frame
+* pcap_offsets: int64 first frame of each pcap (plus the frame count)
+* source_offsets: int64 offset of each frame as it was captured in its
+  (decompressed) pcap, or -1 if unknown (see read_file.iter_frame_sources)
+* source_lengths: int64 length of each frame as it was captured
+* linktypes: int64 linktype of each frame as it was captured
+
+Frames stripped of L2/L3 headers are compared and saved as raw IP. The
+source fields point at the frames as they were captured, so that results
+can be saved with their MACs, VLAN tags and IPs without a second copy of
+every frame (see FrameTable.iter_frames_at).
+
+With multiprocessing.shared_memory (Python 3.8+), each array lives in a
+shared memory segment. Workers attach to the segments by name from a small
+handle and get read-only NumPy views of the same physical memory. Without
+it, the handle carries the arrays themselves.
+"""
+import heapq
+import itertools
+import os
+import weakref
+
+import numpy as np
+
+from pcapgraph.read_file import FrameReader
+from pcapgraph.read_file import format_timestamp
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+FRAME_TABLE_FIELDS = {
+    'payload': np.uint8,
+    'offsets': np.int64,
+    'timestamps': np.int64,
+    'fingerprints': np.uint64,
+    'pcap_offsets': np.int64,
+    'source_offsets': np.int64,
+    'source_lengths': np.int64,
+    'linktypes': np.int64,
+}
+# Frames whose source is looked up at once when saving original frames.
+SOURCE_CHUNK_FRAMES = 2**16
+
+
+def release_segments(segments):
+    """Close and remove shared memory segments. Used as a finalizer.
+
+    Args:
+        segments (list): SharedMemory objects created by this process.
+    """
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass  # A view is still alive. Unlinking frees it once it's gone.
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def iter_chunks(items, size):
+    """Split an iterable into lists.
+
+    Args:
+        items (iterable): Items to split.
+        size (int): Items per list (fewer in the last one).
+    Yields:
+        (list): Next items.
+    """
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class FrameTable:
+    """Frames of all pcaps in flat (optionally shared memory) arrays.
+
+    The process that creates a shared table owns its segments and removes
+    them when the table is garbage collected or release() is called.
+    Tables attached with FrameTable.attach only close their views.
+    """
+
+    def __init__(self, sizes, shared=False):
+        """Allocate an empty frame table.
+
+        Args:
+            sizes (dict): {'payload': <bytes>, 'frames': <frame count>,
+                'pcaps': <pcap count>}
+            shared (bool): Whether to allocate in shared memory (if the
+                platform supports it).
+        """
+        shapes = {
+            'payload': sizes['payload'],
+            'offsets': sizes['frames'] + 1,
+            'timestamps': sizes['frames'],
+            'fingerprints': sizes['frames'],
+            'pcap_offsets': sizes['pcaps'] + 1,
+            'source_offsets': sizes['frames'],
+            'source_lengths': sizes['frames'],
+            'linktypes': sizes['frames'],
+        }
+        self.segments = {}
+        self.arrays = {}
+        for field, dtype in FRAME_TABLE_FIELDS.items():
+            nbytes = shapes[field] * np.dtype(dtype).itemsize
+            if shared and shared_memory:
+                # Segments can't be 0 bytes.
+                segment = shared_memory.SharedMemory(
+                    create=True, size=max(nbytes, 1))
+                self.segments[field] = segment
+                self.arrays[field] = np.ndarray(
+                    shapes[field], dtype=dtype, buffer=segment.buf)
+            else:
+                self.arrays[field] = np.zeros(shapes[field], dtype=dtype)
+        self.source_offsets[:] = -1
+        # Filenames of the pcaps, set if frames are saved as captured.
+        self.source_names = []
+        self.pivot_index = ()
+        self.finalizer = weakref.finalize(self, release_segments,
+                                          list(self.segments.values()))
+
+    @classmethod
+    def attach(cls, handle):
+        """Get read-only views of a table from its handle (see get_handle).
+
+        Args:
+            handle (dict): {<field>: (<segment name>, <shape>)} or
+                {<field>: <array>} for tables that are not shared.
+        Returns:
+            (FrameTable): Table whose arrays are read-only.
+        """
+        frame_table = cls.__new__(cls)
+        frame_table.segments = {}
+        frame_table.arrays = {}
+        frame_table.source_names = []
+        frame_table.pivot_index = ()
+        for field, dtype in FRAME_TABLE_FIELDS.items():
+            if isinstance(handle[field], np.ndarray):
+                array = handle[field].view()
+            else:
+                name, shape = handle[field]
+                segment = shared_memory.SharedMemory(name=name)
+                frame_table.segments[field] = segment
+                array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            array.flags.writeable = False
+            frame_table.arrays[field] = array
+        frame_table.finalizer = weakref.finalize(
+            frame_table, FrameTable.close_segments,
+            list(frame_table.segments.values()))
+        return frame_table
+
+    @staticmethod
+    def close_segments(segments):
+        """Close attached segments without removing them."""
+        for segment in segments:
+            try:
+                segment.close()
+            except BufferError:
+                pass
+
+    def get_handle(self):
+        """Get a small, picklable description of the table for workers.
+
+        Returns:
+            (dict): Argument of FrameTable.attach.
+        """
+        handle = {}
+        for field, array in self.arrays.items():
+            if field in self.segments:
+                handle[field] = (self.segments[field].name, array.shape)
+            else:
+                handle[field] = array
+        return handle
+
+    def release(self):
+        """Free the table. Its arrays must not be used afterwards."""
+        self.arrays = {}
+        self.finalizer()
+
+    @property
+    def payload(self):
+        """uint8 bytes of all frames."""
+        return self.arrays['payload']
+
+    @property
+    def offsets(self):
+        """int64 start of each frame in payload."""
+        return self.arrays['offsets']
+
+    @property
+    def timestamps(self):
+        """int64 timestamps in ns."""
+        return self.arrays['timestamps']
+
+    @property
+    def fingerprints(self):
+        """uint64 fingerprints."""
+        return self.arrays['fingerprints']
+
+    @property
+    def pcap_offsets(self):
+        """int64 first frame of each pcap."""
+        return self.arrays['pcap_offsets']
+
+    @property
+    def source_offsets(self):
+        """int64 offset of each frame as captured, -1 if unknown."""
+        return self.arrays['source_offsets']
+
+    @property
+    def source_lengths(self):
+        """int64 length of each frame as captured."""
+        return self.arrays['source_lengths']
+
+    @property
+    def linktypes(self):
+        """int64 linktype of each frame as captured."""
+        return self.arrays['linktypes']
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def get_frame(self, frame_num):
+        """Get a frame as an ASCII hex frame string.
+
+        Args:
+            frame_num (int): Position of frame in the table.
+        Returns:
+            (str): ASCII hex of the frame.
+        """
+        start, end = self.offsets[frame_num:frame_num + 2]
+        return self.payload[start:end].tobytes().hex()
+
+    def get_source_frames(self, frame_nums):
+        """Get the frames that are saved as captured in place of frames.
+
+        A frame that is also in the pivot pcap (the first) is saved as the
+        pivot captured it, so that every frame of a result has the pivot's
+        MACs, VLAN tags and IPs where possible.
+
+        Args:
+            frame_nums (np.ndarray): Positions of frames in the table.
+        Returns:
+            (np.ndarray): int64 position of the frame with the same
+                fingerprint in the pivot pcap, or the frame itself.
+        """
+        if not self.pivot_index:
+            pivot_end = self.pcap_offsets[1] if len(self.pcap_offsets) > 1 \
+                else 0
+            order = np.argsort(self.fingerprints[:pivot_end], kind='stable')
+            self.pivot_index = (self.fingerprints[order], order)
+        pivot_fingerprints, order = self.pivot_index
+        frame_nums = np.asarray(frame_nums, dtype=np.int64)
+        if not len(order):
+            return frame_nums
+        fingerprints = self.fingerprints[frame_nums]
+        positions = np.searchsorted(pivot_fingerprints, fingerprints)
+        positions = np.minimum(positions, len(order) - 1)
+        in_pivot = pivot_fingerprints[positions] == fingerprints
+        return np.where(in_pivot, order[positions], frame_nums)
+
+    def get_original_linktype(self, frame_nums):
+        """Get the linktype that frames share as they were captured.
+
+        Args:
+            frame_nums (np.ndarray): Positions of frames in the table.
+        Returns:
+            (int): Linktype, or None if the table has no source_names, a
+                frame's source is unknown or the linktypes differ.
+        """
+        if not self.source_names or not len(frame_nums):
+            return None
+        source_frames = self.get_source_frames(frame_nums)
+        if (self.source_offsets[source_frames] < 0).any():
+            return None
+        linktypes = np.unique(self.linktypes[source_frames])
+        return int(linktypes[0]) if len(linktypes) == 1 else None
+
+    def iter_frames_at(self, frame_nums, original=False):
+        """Yield the bytes of frames.
+
+        Args:
+            frame_nums (iterable): Positions of frames in the table.
+            original (bool): Whether to read the frames as they were
+                captured (see get_source_frames) from source_names instead.
+        Yields:
+            (bytes): Each frame.
+        """
+        offsets = self.offsets
+        payload = self.payload
+        if not original:
+            for frame_num in frame_nums:
+                start, end = offsets[frame_num:frame_num + 2]
+                yield payload[start:end].tobytes()
+            return
+        yield from self.iter_captured_frames(itertools.chain.from_iterable(
+            self.get_source_frames(chunk).tolist()
+            for chunk in iter_chunks(frame_nums, SOURCE_CHUNK_FRAMES)))
+
+    def iter_captured_frames(self, frame_nums):
+        """Yield frames as they were captured, read from source_names.
+
+        Args:
+            frame_nums (iterable): Positions of frames in the table whose
+                source_offsets are known.
+        Yields:
+            (bytes): Each frame.
+        """
+        with FrameReader(self.source_names) as frame_reader:
+            for chunk in iter_chunks(frame_nums, SOURCE_CHUNK_FRAMES):
+                chunk = np.array(chunk, dtype=np.int64)
+                pcap_indices = np.searchsorted(
+                    self.pcap_offsets, chunk, side='right') - 1
+                for pcap_index, offset, length in zip(
+                        pcap_indices.tolist(),
+                        self.source_offsets[chunk].tolist(),
+                        self.source_lengths[chunk].tolist()):
+                    yield frame_reader.read(pcap_index, offset, length)
+
+    def get_pcap_indices(self):
+        """Get the index of the pcap of every frame.
+
+        Returns:
+            (np.ndarray): int64 pcap index per frame.
+        """
+        return np.repeat(
+            np.arange(len(self.pcap_offsets) - 1),
+            np.diff(self.pcap_offsets))
+
+
+class FrameSelection:
+    """Frames at frame_nums of a FrameTable.
+
+    Can be passed to save.save_pcap like a list of (frame, timestamp) pairs.
+    Frame strings are only made while iterating. If the table knows where
+    the frames were captured (see FrameTable.get_original_linktype), they
+    are saved as captured with original_linktype.
+    """
+
+    def __init__(self, frame_table, frame_nums):
+        """Select frames of a table.
+
+        Args:
+            frame_table (FrameTable): Table of all frames.
+            frame_nums (np.ndarray): Positions of the frames in the table.
+        """
+        self.frame_table = frame_table
+        self.frame_nums = np.sort(frame_nums)
+        self.original_linktype = \
+            frame_table.get_original_linktype(self.frame_nums)
+
+    def __len__(self):
+        return len(self.frame_nums)
+
+    def __iter__(self):
+        """Yield frames as (<frame>, <timestamp>) in table order."""
+        timestamps = self.frame_table.timestamps
+        for frame_num in self.frame_nums.tolist():
+            yield self.frame_table.get_frame(frame_num), \
+                format_timestamp(int(timestamps[frame_num]))
+
+    def iter_records(self):
+        """Yield frames as (<timestamp ns>, <frame bytes>) in table order.
+
+        save.save_pcap writes these without converting them to hex. If
+        original_linktype is set, frames are as they were captured.
+        """
+        frame_nums = self.frame_nums.tolist()
+        yield from zip(
+            self.frame_table.timestamps[self.frame_nums].tolist(),
+            self.frame_table.iter_frames_at(
+                frame_nums, self.original_linktype is not None))
+
+    def get_linktypes(self):
+        """Get the linktypes that the selected frames were captured with.
+
+        Returns:
+            (list): Sorted linktypes.
+        """
+        return np.unique(
+            self.frame_table.linktypes[self.frame_nums]).tolist()
+
+    def iter_linktype_records(self):
+        """Yield records as they are with the linktype of each frame.
+
+        Yields:
+            (tuple): (<timestamp ns>, <frame bytes>, <linktype>) in the order
+                of iter_records.
+        """
+        yield from zip(self.frame_table.timestamps[self.frame_nums].tolist(),
+                       self.frame_table.iter_frames_at(
+                           self.frame_nums.tolist()),
+                       self.frame_table.linktypes[self.frame_nums].tolist())
+
+    def get_frames(self):
+        """Get the frame strings of the selection.
+
+        Returns:
+            (list): [<frame>, ...]
+        """
+        return [
+            self.frame_table.get_frame(frame_num)
+            for frame_num in self.frame_nums.tolist()
+        ]
+
+    def get_time_bounds(self):
+        """Get the first and last timestamp of the selection.
+
+        Returns:
+            (tuple): (<first ns>, <last ns>) or () if nothing is selected.
+        """
+        if not len(self.frame_nums):
+            return ()
+        timestamps = self.frame_table.timestamps[self.frame_nums]
+        return int(timestamps.min()), int(timestamps.max())
+
+
+class MergedFrames(FrameSelection):
+    """Frames of a FrameTable in timestamp order, with the pcaps they are in.
+
+    Records are made by a heap k-way merge of the selected frames of each
+    pcap, so they are chronological without sorting the result. Each frame
+    is saved with the pcap it was taken from as its pcapng interface and a
+    comment that names every pcap it was seen in.
+    """
+
+    chronological = True
+
+    def __init__(self, frame_table, frame_nums, membership, source_names):
+        """Select frames of a table with their membership bits.
+
+        Args:
+            frame_table (FrameTable): Table of all frames.
+            frame_nums (np.ndarray): Positions of the frames in the table.
+            membership (np.ndarray): Packed membership bits of each frame
+                (see parallel_math.index_shard), in the order of frame_nums.
+            source_names (list): Filename of each pcap of the table.
+        """
+        super().__init__(frame_table, frame_nums)
+        self.membership = membership[np.argsort(frame_nums, kind='stable')]
+        self.source_names = [os.path.basename(name) for name in source_names]
+
+    def iter_merged(self):
+        """Merge the selected frames of each pcap by timestamp.
+
+        Frames with the same timestamp are in table order, like a stable
+        sort of the whole selection.
+
+        Returns:
+            (iterator): (<timestamp ns>, <frame num>, <pcap index>, <row>)
+                where row is the frame's index in the selection.
+        """
+        timestamps = self.frame_table.timestamps
+        bounds = np.searchsorted(self.frame_nums,
+                                 self.frame_table.pcap_offsets).tolist()
+        sources = []
+        for pcap_index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            rows = np.arange(start, end)
+            pcap_times = timestamps[self.frame_nums[rows]]
+            order = np.argsort(pcap_times, kind='stable')
+            sources.append(
+                zip(pcap_times[order].tolist(),
+                    self.frame_nums[rows[order]].tolist(),
+                    [pcap_index] * len(rows), rows[order].tolist()))
+        return heapq.merge(*sources)
+
+    def iter_records(self):
+        """Yield frames as (<timestamp ns>, <frame bytes>) by timestamp."""
+        for (timestamp, _, _, _), frame in self.iter_merged_frames():
+            yield timestamp, frame
+
+    def iter_linktype_records(self):
+        """Yield records with the linktype of each frame, by timestamp."""
+        linktypes = self.frame_table.linktypes
+        for (timestamp, frame_num, _, _), frame in self.iter_merged_frames():
+            yield timestamp, frame, int(linktypes[frame_num])
+
+    def get_interfaces(self):
+        """Get the pcapng interfaces of frames with several linktypes.
+
+        Returns:
+            (list): Sorted (<pcap index>, <linktype>) of the selected frames.
+        """
+        pcap_indices = np.searchsorted(self.frame_table.pcap_offsets,
+                                       self.frame_nums, side='right') - 1
+        interfaces = np.unique(np.stack(
+            [pcap_indices, self.frame_table.linktypes[self.frame_nums]]),
+                               axis=1)
+        return [tuple(interface) for interface in interfaces.T.tolist()]
+
+    def iter_merged_frames(self):
+        """Yield what iter_merged does with the bytes of each frame.
+
+        Yields:
+            (tuple): (<iter_merged tuple>, <frame bytes>)
+        """
+        merged, merged_frame_nums = itertools.tee(self.iter_merged())
+        yield from zip(merged, self.frame_table.iter_frames_at(
+            (frame_num for _, frame_num, _, _ in merged_frame_nums),
+            self.original_linktype is not None))
+
+    def iter_annotated_records(self, interfaces=None):
+        """Yield records with the pcaps that saw each frame, by timestamp.
+
+        Args:
+            interfaces (list): (<pcap index>, <linktype>) of each pcapng
+                interface (see get_interfaces), or None for an interface
+                per pcap.
+        Yields:
+            (tuple): (<timestamp ns>, <frame bytes>, <interface>, <comment>)
+        """
+        comments = {}
+        interface_ids = {
+            interface: interface_id
+            for interface_id, interface in enumerate(interfaces or [])
+        }
+        linktypes = self.frame_table.linktypes
+        for (timestamp, frame_num, pcap_index, row), frame in \
+                self.iter_merged_frames():
+            members = self.membership[row].tobytes()
+            if members not in comments:
+                member_bits = np.unpackbits(
+                    self.membership[row], count=len(self.source_names))
+                comments[members] = 'Seen in ' + ', '.join(
+                    self.source_names[source]
+                    for source in np.flatnonzero(member_bits).tolist())
+            if interfaces is not None:
+                pcap_index = interface_ids[(pcap_index,
+                                            int(linktypes[frame_num]))]
+            yield timestamp, frame, pcap_index, comments[members]
@@ -17,9 +17,20 @@
 import sys
 import os
 
+from .archive import get_archive_members, get_archive_type
+from .compressed_file import COMPRESSION_EXTENSIONS, get_compression
+from .compressed_file import open_capture
 from .generate_example_pcaps import generate_example_pcaps
+from .read_file import get_capture_format
 from . import __version__
 
+# Extensions of captures in formats other than pcap/pcapng, which are told
+# by their first bytes instead (see is_packet_capture).
+PCAP_EXTENSIONS = [
+    '.pcapng', '.pcap', '.cap', '.dmp', '.5vw', '.TRC0', '.TRC1', '.enc',
+    '.trc', '.fdc', '.syc', '.bfr', '.tr1', '.snoop'
+]
+
 
 def parse_cli_args(args):
     """Parse args with docopt. Return a list of filenames
@@ -44,6 +55,12 @@ def parse_cli_args(args):
     has_set_operation = args['--symmetric-difference'] or args['--union'] or \
         args['--difference'] or args['--inverse-bounded'] or \
         args['--bounded-intersection'] or args['--intersection']
+    if args['--multiset-union'] not in ('max', 'sum'):
+        raise SyntaxError("\nERROR: --multiset-union must be max or sum.")
+    if not args['--workers'].isdigit():
+        raise SyntaxError("\nERROR: --workers must be 0 or more.")
+    if args['--compress'] not in [None, *COMPRESSION_EXTENSIONS]:
+        raise SyntaxError("\nERROR: --compress must be gzip, zstd or lz4.")
     pcap_out = 'pcap' in args['--output'] or 'pcapng' in args['--output']
     if pcap_out and not has_set_operation:
         raise SyntaxError("\nERROR: --output pcap/pcapng needs "
@@ -68,17 +85,15 @@ def parse_cli_args(args):
 def get_filenames_from_directories(directories):
     """Get all the files from all provided directories.
 
-    This function is not recursive and searches one deep.
+    This function is not recursive and searches one deep. Archives are
+    replaced by the packet captures in them, like in get_filenames. Archives
+    without any are skipped.
 
     Args:
         directories (list): List of user-inputted directories.
     Returns:
         (list): Filenames of all packet captures in specified directories.
     """
-    pcap_extensions = [
-        '.pcapng', '.pcap', '.cap', '.dmp', '.5vw', '.TRC0', '.TRC1', '.enc',
-        '.trc', '.fdc', '.syc', '.bfr', '.tr1', '.snoop'
-    ]
     system = sys.platform
     cwd = os.getcwd() + '/'
     filenames = []
@@ -95,9 +110,13 @@ def get_filenames_from_directories(directories):
             print("ERROR: Directory", dir_string, "not found!")
             sys.exit()
         for file in os.listdir(dir_string):
-            for pcap_ext in pcap_extensions:
-                if file.endswith(pcap_ext):
-                    filenames.append(directory + '/' + file)
+            filename = directory + '/' + file
+            if not os.path.isfile(filename):
+                continue
+            if get_archive_type(filename):
+                filenames.extend(get_archive_members(filename))
+            elif is_packet_capture(filename):
+                filenames.append(filename)
 
     return filenames
 
@@ -105,15 +124,13 @@ def get_filenames_from_directories(directories):
 def get_filenames(files):
     """Return a validated list of filenames.
 
+    Archives are replaced by the packet captures in them (see archive.py).
+
     Args:
         files (list): List of file params entered by user
     Returns:
         (list): List of files validated to be packet captures.
     """
-    pcap_extensions = [
-        '.pcapng', '.pcap', '.cap', '.dmp', '.5vw', '.TRC0', '.TRC1', '.enc',
-        '.trc', '.fdc', '.syc', '.bfr', '.tr1', '.snoop'
-    ]
     cwd = os.getcwd() + '/'
     filenames = []
     for filename in files:
@@ -123,11 +140,58 @@ def get_filenames(files):
         if not os.path.isfile(file_string):
             print("ERROR: File", file_string, "not found!")
             sys.exit()
-        file_ext = os.path.splitext(filename)[1]
-        if file_ext not in pcap_extensions:
+        if get_archive_type(file_string):
+            members = get_archive_members(filename)
+            if not members:
+                print("ERROR:", filename, "has no packet captures!")
+                sys.exit()
+            filenames.extend(members)
+            continue
+        if not is_packet_capture(file_string):
             print("ERROR:", filename, "is not a valid packet capture!")
-            print("Valid packet capture extensions:", pcap_extensions)
+            print("Packet captures are pcap/pcapng files (maybe compressed)"
+                  " or have one of the extensions", PCAP_EXTENSIONS)
             sys.exit()
         filenames.append(filename)
 
     return filenames
+
+
+def is_packet_capture(filename):
+    """Check whether a file is a packet capture.
+
+    pcap and pcapng files are told by their first bytes once decompressed,
+    whatever they are named (like trace.bin). Other formats are told by
+    their extension (see get_capture_extension).
+
+    Args:
+        filename (str): Name of a file.
+    Returns:
+        (bool): Whether the file is a packet capture.
+    """
+    try:
+        with open_capture(filename) as capture:
+            if get_capture_format(capture.peek(4)[:4]):
+                return True
+    except ImportError:
+        # A compression whose package is missing. Go by its name.
+        pass
+    return get_capture_extension(filename) in PCAP_EXTENSIONS
+
+
+def get_capture_extension(filename):
+    """Get the extension of a packet capture that may be compressed.
+
+    Whether the file is compressed is told by its first bytes, so a
+    compression extension is only skipped if the file is compressed.
+
+    Args:
+        filename (str): Name of a file like a.pcap or a.pcap.gz
+    Returns:
+        (str): Extension before any compression extension like '.pcap'
+    """
+    name, file_ext = os.path.splitext(filename)
+    if file_ext in COMPRESSION_EXTENSIONS.values() and \
+            get_compression(filename):
+        file_ext = os.path.splitext(name)[1]
+    return file_ext
@@ -0,0 +1,689 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Keep a comparison of pcaps on disk and update it as pcaps come and go.
+
+With --state <dir>, each pcap is read and fingerprinted once. Its stripped
+frames are saved in <dir> with a membership index of every pcap in the
+comparison (like parallel_math's, plus how often each frame occurs). When a
+later run adds pcaps, only those pcaps are read. Their fingerprints are
+looked up in the index by binary search and the ones it doesn't have are
+appended to it before it is sorted once. A pcap that is no longer given is
+dropped by deleting its membership bit. A pcap whose size or modification
+time changed is dropped and read again. Only the index and the pcaps that
+changed are loaded to update the comparison. Saved frames are loaded when
+results need them, and only from the pcaps that have the frames a result
+selects.
+
+index.npz and comparison.json are written to temporary files that are then
+renamed over them, so an interrupted run doesn't leave a partial file.
+
+Files in <dir>:
+
+* comparison.json: options and the pcaps in the comparison with their
+  frame counts
+* index.npz: sorted fingerprints, their counts and packed membership bits
+  with one column per pcap in comparison.json order
+* <n>.npz: frames of one pcap (see read_capture)
+"""
+import json
+import os
+
+import numpy as np
+
+from pcapgraph.archive import split_member
+from pcapgraph.frame_table import FRAME_TABLE_FIELDS
+from pcapgraph.frame_table import FrameSelection
+from pcapgraph.frame_table import FrameTable
+from pcapgraph.frame_table import MergedFrames
+from pcapgraph.manipulate_frames import strip_frame
+from pcapgraph.manipulate_frames import get_frame_fingerprint
+from pcapgraph.manipulate_frames import is_stripped
+from pcapgraph.pcap_math import MOST_COMMON_FRAMES
+from pcapgraph.pcap_math import PcapMath
+from pcapgraph.read_file import iter_frame_sources
+from pcapgraph.sampling import is_sampled
+from pcapgraph.set_result import SetResult
+
+STATE_VERSION = 3
+MANIFEST_NAME = 'comparison.json'
+INDEX_NAME = 'index.npz'
+# Arrays of a saved pcap (see read_capture) that go in a FrameTable.
+FRAME_FIELDS = ['payload', 'offsets', 'timestamps', 'fingerprints',
+                'source_offsets', 'source_lengths', 'linktypes']
+# Intermediates of PcapMath that only need the membership index.
+INCREMENTAL_INTERMEDIATES = ['membership-index', 'intersection', 'complements']
+
+
+def read_capture(filename, options):
+    """Read the stripped, sampled frames of a pcap into arrays to save.
+
+    Args:
+        filename (str): Name of packet capture.
+        options (dict): Whether to strip L2 and L3 headers and the 'sample'
+            rate.
+    Returns:
+        (dict): Arrays of the pcap:
+            payload, offsets, timestamps, fingerprints, source_offsets,
+                source_lengths, linktypes: Like a FrameTable with only
+                this pcap.
+            unique (np.ndarray): Sorted unique fingerprints (uint64).
+            first, last (np.ndarray): Position of the first and last frame
+                with each unique fingerprint.
+            counts (np.ndarray): Occurrences of each unique fingerprint.
+    """
+    frames = []
+    timestamps = []
+    fingerprints = []
+    sources = []
+    for timestamp, frame, linktype, source_offset in \
+            iter_frame_sources(filename):
+        frame_raw = strip_frame(frame.hex(), linktype, options)
+        if not is_sampled(frame_raw, options):
+            continue
+        frames.append(bytes.fromhex(frame_raw))
+        timestamps.append(timestamp)
+        fingerprints.append(get_frame_fingerprint(frame_raw))
+        sources.append((source_offset, len(frame), linktype))
+    sources = np.array(sources, dtype=np.int64).reshape(-1, 3)
+    fingerprints = np.array(fingerprints, dtype=np.uint64)
+    unique, first, counts = np.unique(
+        fingerprints, return_index=True, return_counts=True)
+    # Reversed so that np.unique finds the last frame of each fingerprint.
+    _, reversed_last = np.unique(fingerprints[::-1], return_index=True)
+    offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frame) for frame in frames])
+    return {
+        'payload': np.frombuffer(b''.join(frames), dtype=np.uint8),
+        'offsets': offsets,
+        'timestamps': np.array(timestamps, dtype=np.int64),
+        'fingerprints': fingerprints,
+        'source_offsets': sources[:, 0],
+        'source_lengths': sources[:, 1],
+        'linktypes': sources[:, 2],
+        'unique': unique,
+        'first': first,
+        'last': len(fingerprints) - 1 - reversed_last,
+        'counts': counts.astype(np.uint64),
+    }
+
+
+def select_capture_rows(capture, rows):
+    """Keep only some frames of a saved pcap.
+
+    Args:
+        capture (dict): FRAME_FIELDS arrays of a pcap (see read_capture), or
+            None if no rows are kept.
+        rows (np.ndarray): Sorted positions of the frames to keep.
+    Returns:
+        (dict): FRAME_FIELDS arrays with only those frames.
+    """
+    if not len(rows):
+        selected = {
+            field: np.zeros(0, dtype=FRAME_TABLE_FIELDS[field])
+            for field in FRAME_FIELDS
+        }
+        selected['offsets'] = np.zeros(1, dtype=np.int64)
+        return selected
+    selected = {
+        field: capture[field][rows]
+        for field in FRAME_FIELDS if field not in ('payload', 'offsets')
+    }
+    starts = capture['offsets'][rows]
+    lengths = capture['offsets'][rows + 1] - starts
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    selected['payload'] = capture['payload'][
+        np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], lengths)]
+    selected['offsets'] = offsets
+    return selected
+
+
+def split_rows(rows, pcap_offsets):
+    """Split positions of frames of several pcaps by pcap.
+
+    Args:
+        rows (np.ndarray): Sorted positions of frames.
+        pcap_offsets (np.ndarray): First frame of each pcap (see
+            FrameTable.pcap_offsets).
+    Returns:
+        (list): Positions of the frames within each pcap, per pcap.
+    """
+    bounds = np.searchsorted(rows, pcap_offsets)
+    return [
+        rows[start:end] - pcap_offset
+        for start, end, pcap_offset in zip(bounds, bounds[1:], pcap_offsets)
+    ]
+
+
+def get_capture_table(captures, source_names=()):
+    """Put the frames of saved pcaps in one FrameTable.
+
+    Args:
+        captures (list): Arrays of each pcap (see read_capture).
+        source_names (list): Filenames of the pcaps if frames are saved as
+            they were captured (see FrameTable.source_names).
+    Returns:
+        (FrameTable): Frames in capture order, pcap by pcap.
+    """
+    payload_sizes = [len(capture['payload']) for capture in captures]
+    frame_counts = [len(capture['timestamps']) for capture in captures]
+    frame_table = FrameTable({
+        'payload': sum(payload_sizes),
+        'frames': sum(frame_counts),
+        'pcaps': len(captures)
+    })
+    payload_starts = np.cumsum([0] + payload_sizes)
+    frame_table.payload[:] = np.concatenate(
+        [capture['payload'] for capture in captures])
+    frame_table.offsets[:-1] = np.concatenate([
+        capture['offsets'][:-1] + payload_start
+        for capture, payload_start in zip(captures, payload_starts)
+    ])
+    frame_table.offsets[-1] = payload_starts[-1]
+    frame_table.timestamps[:] = np.concatenate(
+        [capture['timestamps'] for capture in captures])
+    for field in ['fingerprints', 'source_offsets', 'source_lengths',
+                  'linktypes']:
+        frame_table.arrays[field][:] = np.concatenate(
+            [capture[field] for capture in captures])
+    frame_table.pcap_offsets[1:] = np.cumsum(frame_counts)
+    frame_table.source_names = list(source_names)
+    return frame_table
+
+
+class ComparisonState:
+    """Membership index and frames of the pcaps of a comparison, on disk.
+
+    Rows of the index are sorted by fingerprint so that the rows of a pcap
+    are found by binary search. membership has one bit per pcap in
+    self.captures order (np.packbits order).
+    """
+
+    def __init__(self, state_dir, options):
+        """Load the comparison in state_dir (if there is one).
+
+        A comparison made with other strip options or sample rate is
+        started over.
+
+        Args:
+            state_dir (str): Directory of the comparison.
+            options (dict): Whether to strip L2 and L3 headers and the
+                'sample' rate.
+        """
+        self.state_dir = state_dir
+        self.options = {
+            'strip-l2': options['strip-l2'],
+            'strip-l3': options['strip-l3']
+        }
+        # Comparisons of all frames keep the options they were saved with.
+        if options.get('sample', 1) > 1:
+            self.options['sample'] = options['sample']
+        # [{'name', 'size', 'mtime_ns', 'frames', 'file'}, ...]
+        self.captures = []
+        self.next_file_num = 0
+        # Files of removed pcaps, deleted once the comparison is saved.
+        self.removed_files = []
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.uint64)
+        self.membership = np.zeros((0, 0), dtype=np.uint8)
+        self.load()
+
+    def load(self):
+        """Read the comparison from self.state_dir."""
+        manifest_name = os.path.join(self.state_dir, MANIFEST_NAME)
+        if not os.path.isfile(manifest_name):
+            return
+        with open(manifest_name) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['version'] != STATE_VERSION or \
+                manifest['options'] != self.options:
+            for capture in manifest['captures']:
+                self.remove_file(capture['file'])
+            return
+        self.captures = manifest['captures']
+        self.next_file_num = manifest['next_file_num']
+        with np.load(os.path.join(self.state_dir, INDEX_NAME)) as index:
+            self.fingerprints = index['fingerprints']
+            self.counts = index['counts']
+            self.membership = index['membership']
+
+    def save(self):
+        """Write the comparison to self.state_dir.
+
+        The index is replaced before the manifest, which is what makes the
+        new pcaps part of the comparison. Files of removed pcaps are deleted
+        afterwards.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        index_name = os.path.join(self.state_dir, INDEX_NAME)
+        with open(index_name + '.tmp', 'wb') as index_file:
+            np.savez(
+                index_file,
+                fingerprints=self.fingerprints,
+                counts=self.counts,
+                membership=self.membership)
+        manifest = {
+            'version': STATE_VERSION,
+            'options': self.options,
+            'captures': self.captures,
+            'next_file_num': self.next_file_num,
+        }
+        manifest_name = os.path.join(self.state_dir, MANIFEST_NAME)
+        with open(manifest_name + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(index_name + '.tmp', index_name)
+        os.replace(manifest_name + '.tmp', manifest_name)
+        for capture_file in self.removed_files:
+            self.remove_file(capture_file)
+        self.removed_files = []
+
+    def update(self, filenames):
+        """Make the comparison consist of filenames and save it.
+
+        Args:
+            filenames (list): List of filenames.
+        Returns:
+            (list): Filenames that had to be read.
+        """
+        wanted = {get_capture_key(filename) for filename in filenames}
+        for capture in list(self.captures):
+            if (capture['name'], capture['size'],
+                    capture['mtime_ns']) not in wanted:
+                self.remove(capture['name'])
+        known_names = {capture['name'] for capture in self.captures}
+        added = []
+        for filename in filenames:
+            if os.path.abspath(filename) not in known_names:
+                known_names.add(os.path.abspath(filename))
+                added.append(filename)
+        self.add(added)
+        self.save()
+        return added
+
+    def add(self, filenames):
+        """Read pcaps and merge their fingerprints into the index.
+
+        Only the new pcaps are read. Existing rows get their membership bits
+        and unseen fingerprints are appended, then the index is sorted once.
+
+        Args:
+            filenames (list): Names of packet captures.
+        """
+        added = []  # [(<column>, <unique>, <counts>), ...]
+        for filename in filenames:
+            capture = read_capture(filename, self.options)
+            os.makedirs(self.state_dir, exist_ok=True)
+            capture_file = str(self.next_file_num) + '.npz'
+            self.next_file_num += 1
+            np.savez(os.path.join(self.state_dir, capture_file), **capture)
+            added.append(
+                (len(self.captures), capture['unique'], capture['counts']))
+            name, size, mtime_ns = get_capture_key(filename)
+            self.captures.append({
+                'name': name,
+                'size': size,
+                'mtime_ns': mtime_ns,
+                'frames': len(capture['timestamps']),
+                'file': capture_file
+            })
+        if not added:
+            return
+
+        unique = np.unique(np.concatenate([row[1] for row in added]))
+        rows = np.searchsorted(self.fingerprints, unique)
+        known = rows < len(self.fingerprints)
+        known[known] = self.fingerprints[rows[known]] == unique[known]
+        row_count = len(self.fingerprints) + int((~known).sum())
+        membership = np.zeros((row_count, (len(self.captures) + 7) // 8),
+                              dtype=np.uint8)
+        membership[:len(self.membership), :self.membership.shape[1]] = \
+            self.membership
+        fingerprints = np.concatenate([self.fingerprints, unique[~known]])
+        # Two sorted runs, which a stable (merge) sort joins in linear time.
+        order = np.argsort(fingerprints, kind='stable')
+        self.fingerprints = fingerprints[order]
+        self.counts = np.concatenate([
+            self.counts,
+            np.zeros(row_count - len(self.counts), dtype=np.uint64)
+        ])[order]
+        self.membership = membership[order]
+        for column, capture_unique, capture_counts in added:
+            rows = np.searchsorted(self.fingerprints, capture_unique)
+            self.counts[rows] += capture_counts
+            self.membership[rows, column // 8] |= \
+                np.uint8(0x80 >> column % 8)
+
+    def remove(self, name):
+        """Drop a pcap from the comparison without reading any pcap.
+
+        Args:
+            name (str): Absolute name of the pcap.
+        """
+        column = self.get_columns([name])[0]
+        capture = self.load_capture(name, ['unique', 'counts'])
+        rows = np.searchsorted(self.fingerprints, capture['unique'])
+        self.counts[rows] -= capture['counts']
+        members = np.unpackbits(
+            self.membership, axis=1, count=len(self.captures))
+        members = np.delete(members, column, axis=1)
+        # Frames that only this pcap had are no longer in the comparison.
+        remaining = self.counts > 0
+        self.fingerprints = self.fingerprints[remaining]
+        self.counts = self.counts[remaining]
+        self.membership = np.packbits(members[remaining], axis=1)
+        self.removed_files.append(self.captures.pop(column)['file'])
+
+    def remove_file(self, capture_file):
+        """Delete the saved frames of a pcap."""
+        try:
+            os.remove(os.path.join(self.state_dir, capture_file))
+        except FileNotFoundError:
+            pass
+
+    def get_columns(self, filenames):
+        """Get the membership column of each pcap.
+
+        Args:
+            filenames (list): Names of pcaps in the comparison.
+        Returns:
+            (list): Column of each pcap.
+        """
+        columns = {
+            capture['name']: column
+            for column, capture in enumerate(self.captures)
+        }
+        return [columns[os.path.abspath(name)] for name in filenames]
+
+    def get_frame_counts(self, filenames):
+        """Get the number of saved frames of each pcap.
+
+        Args:
+            filenames (list): Names of pcaps in the comparison.
+        Returns:
+            (list): Frame count of each pcap.
+        """
+        return [
+            self.captures[column]['frames']
+            for column in self.get_columns(filenames)
+        ]
+
+    def load_capture(self, filename, fields):
+        """Load saved arrays of a pcap (see read_capture).
+
+        Only the arrays in fields are read from the pcap's file.
+
+        Args:
+            filename (str): Name of a pcap in the comparison.
+            fields (list): Names of the arrays to load.
+        Returns:
+            (dict): {<field>: <array>, ...}
+        """
+        column = self.get_columns([filename])[0]
+        capture_file = os.path.join(self.state_dir,
+                                    self.captures[column]['file'])
+        with np.load(capture_file) as capture:
+            return {field: capture[field] for field in fields}
+
+
+def get_capture_key(filename):
+    """Get what identifies a version of a pcap.
+
+    Members of an archive change with the archive.
+
+    Args:
+        filename (str): Name of packet capture or of an archive member.
+    Returns:
+        (tuple): (<absolute name>, <size>, <modification time in ns>)
+    """
+    archive, member = split_member(filename)
+    stat = os.stat(archive)
+    name = os.path.abspath(archive)
+    if member:
+        name += '/' + member
+    return name, stat.st_size, stat.st_mtime_ns
+
+
+class IncrementalPcapMath(PcapMath):
+    """Do set operations like PcapMath from a comparison saved on disk.
+
+    Only pcaps that are new to the comparison in options['state'] are read
+    in __init__. The membership index is assembled from the comparison's
+    index and the unique fingerprints of each pcap. Results and prints
+    only load the saved frames they select (see load_frames).
+    Bounded intersections and multisets need every frame of each pcap in
+    order, so they are not supported.
+    """
+
+    def __init__(self, filenames, options):
+        """Bring the comparison up to date with filenames.
+
+        Args:
+            filenames (list): List of filenames.
+            options (dict): Whether to strip L2 and L3 headers and the
+                'state' directory of the comparison.
+        """
+        # pylint: disable=super-init-not-called
+        self.filenames = filenames
+        self.exclude_empty = False
+        self.options = options
+        self.capture_table = None
+        self.membership_index = ()
+        self.intersection_frames = None
+        self.complements = []
+        self.state = ComparisonState(options['state'], options)
+        self.added_filenames = self.state.update(filenames)
+
+    def get_set_results(self, args):
+        """Do the set operations requested by CLI flags without saving them.
+
+        Args:
+            args (dict): Dict of all arguments (including set args).
+        Returns:
+            (list): SetResults of all operations, in the order of the flags.
+        Raises:
+            SyntaxError: If a bounded operation is requested.
+        """
+        if args['--bounded-intersection'] or args['--inverse-bounded']:
+            raise SyntaxError("\nERROR: Bounded intersections (-be) cannot "
+                              "be used with --state.")
+        return super().get_set_results(args)
+
+    @property
+    def frame_table(self):
+        """FrameTable of self.filenames, loaded when it is first used."""
+        if self.capture_table is None:
+            self.capture_table = get_capture_table(
+                [
+                    self.state.load_capture(filename, FRAME_FIELDS)
+                    for filename in self.filenames
+                ], self.filenames if is_stripped(self.options) else ())
+        return self.capture_table
+
+    def select_frames(self, frame_nums):
+        """Select frames, loading only them from the comparison.
+
+        Args:
+            frame_nums (np.ndarray): Positions of the frames among the frames
+                of self.filenames (see get_pcap_offsets).
+        Returns:
+            (FrameSelection): The frames.
+        """
+        return FrameSelection(*self.load_frames(frame_nums))
+
+    def load_frames(self, frame_nums, originals=True):
+        """Load saved frames into a FrameTable of their own.
+
+        Only the pcaps that have one of the frames are read. If frames are
+        saved as they were captured, the pivot's first frame with each
+        fingerprint is loaded too (see FrameTable.get_source_frames).
+
+        Args:
+            frame_nums (np.ndarray): Positions of the frames among the frames
+                of self.filenames (see get_pcap_offsets).
+            originals (bool): Whether the frames may be saved as captured.
+        Returns:
+            (tuple): (<FrameTable>, <position of each frame in it>)
+        """
+        pcap_offsets = self.get_pcap_offsets()
+        frame_nums = np.asarray(frame_nums, dtype=np.int64)
+        rows = np.unique(frame_nums)
+        captures = self.load_captures(split_rows(rows, pcap_offsets), {})
+        source_names = ()
+        if originals and is_stripped(self.options) and len(rows):
+            source_names = self.filenames
+            fingerprints = np.concatenate([
+                captures[pcap_index]['fingerprints'][pcap_rows]
+                for pcap_index, pcap_rows in enumerate(
+                    split_rows(rows, pcap_offsets)) if len(pcap_rows)
+            ])
+            rows = np.union1d(rows, self.get_pivot_frames(fingerprints))
+            self.load_captures(split_rows(rows, pcap_offsets), captures)
+        frame_table = get_capture_table([
+            select_capture_rows(captures.get(pcap_index), pcap_rows)
+            for pcap_index, pcap_rows in enumerate(
+                split_rows(rows, pcap_offsets))
+        ], source_names)
+        return frame_table, np.searchsorted(rows, frame_nums)
+
+    def load_captures(self, rows_by_pcap, captures):
+        """Load the frames of the pcaps that have rows.
+
+        Args:
+            rows_by_pcap (list): Positions of frames per pcap (see
+                split_rows).
+            captures (dict): {<pcap index>: <FRAME_FIELDS arrays>, ...} of
+                pcaps that are already loaded.
+        Returns:
+            (dict): captures with the pcaps that have rows added.
+        """
+        for pcap_index, pcap_rows in enumerate(rows_by_pcap):
+            if len(pcap_rows) and pcap_index not in captures:
+                captures[pcap_index] = self.state.load_capture(
+                    self.filenames[pcap_index], FRAME_FIELDS)
+        return captures
+
+    def get_pivot_frames(self, fingerprints):
+        """Get the pivot's first frame with each fingerprint.
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints of frames.
+        Returns:
+            (np.ndarray): Positions of the frames that the pivot has.
+        """
+        pivot = self.state.load_capture(self.filenames[0], ['unique', 'first'])
+        if not len(pivot['unique']):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(pivot['unique'], fingerprints),
+                               len(pivot['unique']) - 1)
+        in_pivot = pivot['unique'][positions] == fingerprints
+        return pivot['first'][positions[in_pivot]].astype(np.int64)
+
+    def get_pcap_offsets(self):
+        """Get the first frame of each pcap without loading frames.
+
+        Returns:
+            (np.ndarray): Like FrameTable.pcap_offsets.
+        """
+        return np.cumsum([0] + self.state.get_frame_counts(self.filenames))
+
+    def get_intermediate_tasks(self):
+        """Get the intermediates that only need the membership index."""
+        tasks = super().get_intermediate_tasks()
+        return {name: tasks[name] for name in INCREMENTAL_INTERMEDIATES}
+
+    def get_membership_index(self):
+        """Get the membership index of self.filenames from the comparison.
+
+        Rows are the comparison's, with columns in self.filenames order.
+        Like PcapMath, each row refers to the last frame with its
+        fingerprint, which is in the last pcap that has it.
+
+        Returns:
+            (tuple): fingerprints, last_frames, membership (np.ndarray)
+        """
+        if self.membership_index:
+            return self.membership_index
+        members = np.unpackbits(
+            self.state.membership, axis=1,
+            count=len(self.state.captures))[:, self.state.get_columns(
+                self.filenames)]
+        fingerprints = self.state.fingerprints
+        last_pcaps = len(self.filenames) - 1 - \
+            members[:, ::-1].argmax(axis=1)
+        last_frames = np.empty(len(fingerprints), dtype=np.int64)
+        pcap_offsets = self.get_pcap_offsets()
+        for pcap_index, filename in enumerate(self.filenames):
+            rows = np.flatnonzero(last_pcaps == pcap_index)
+            if not len(rows):
+                continue
+            capture = self.state.load_capture(filename, ['unique', 'last'])
+            positions = np.searchsorted(capture['unique'], fingerprints[rows])
+            last_frames[rows] = pcap_offsets[pcap_index] + \
+                capture['last'][positions]
+        self.membership_index = (fingerprints, last_frames,
+                                 np.packbits(members, axis=1))
+        return self.membership_index
+
+    def get_union(self):
+        """Get the union and print the 10 most common frames.
+
+        Returns:
+            (SetResult): Union of all pcaps.
+        """
+        _, last_frames, membership = self.get_membership_index()
+        self.print_10_most_common_frames(
+            self.get_most_common_frames(membership))
+        frame_table, frame_nums = self.load_frames(last_frames)
+        return SetResult('union.pcap',
+                         MergedFrames(frame_table, frame_nums, membership,
+                                      self.filenames),
+                         self.options)
+
+    def get_most_common_frames(self, membership):
+        """Get the frames that occur most often across all pcaps.
+
+        Ties are in order of first appearance, like collections.Counter.
+
+        Args:
+            membership (np.ndarray): Packed membership bits of the rows.
+        Returns:
+            (dict): {<frame>: <count>, ...} of the MOST_COMMON_FRAMES most
+                common frames.
+        """
+        rows = np.flatnonzero(self.state.counts > 1)
+        counts = self.state.counts[rows].astype(np.int64)
+        members = np.unpackbits(
+            membership[rows], axis=1, count=len(self.filenames))
+        first_pcaps = members.argmax(axis=1)
+        first_frames = np.empty(len(rows), dtype=np.int64)
+        pcap_offsets = self.get_pcap_offsets()
+        for pcap_index, filename in enumerate(self.filenames):
+            pcap_rows = np.flatnonzero(first_pcaps == pcap_index)
+            if not len(pcap_rows):
+                continue
+            capture = self.state.load_capture(filename, ['unique', 'first'])
+            positions = np.searchsorted(
+                capture['unique'], self.state.fingerprints[rows[pcap_rows]])
+            first_frames[pcap_rows] = pcap_offsets[pcap_index] + \
+                capture['first'][positions]
+        most_common = np.lexsort(
+            (first_frames, -counts))[:MOST_COMMON_FRAMES]
+        frame_table, frame_nums = self.load_frames(first_frames[most_common],
+                                                   originals=False)
+        return {
+            frame_table.get_frame(int(frame_num)): int(count)
+            for frame_num, count in zip(frame_nums,
+                                        counts[most_common].tolist())
+        }
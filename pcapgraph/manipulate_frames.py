@@ -46,24 +46,47 @@ hex of a packet.
 """
 
 import subprocess as sp
+import concurrent.futures
+import os
+import hashlib
 import random
 import json
 
+import numpy as np
 
-def parse_pcaps(pcaps):
+from pcapgraph.archive import is_random_access
+from pcapgraph.compressed_file import popen_tshark
+from pcapgraph.frame_table import FrameTable
+from pcapgraph.parallel_math import get_worker_count
+from pcapgraph.parallel_math import SHARDS_PER_WORKER
+from pcapgraph.read_file import iter_frame_sources
+from pcapgraph.read_file import parse_timestamp
+from pcapgraph.sampling import is_sampled
+
+# {<pcap>: rows of get_frame_sources}
+FRAME_SOURCES = {}
+
+
+def parse_pcaps(pcaps, workers=1):
     """Given pcaps, return all frames and their timestamps.
 
+    With more than one worker, that many tshark processes read pcaps at
+    once. Members of compressed tars are read in order (see archive.py), so
+    they are read one at a time.
+
     Args:
         pcaps (list): A list of pcap filenames
+        workers (int): Number of tshark processes (0 for one per CPU).
     Returns:
         pcap_json_list (list): All the packet data in json format.
             [{<pcap>: {PCAP JSON}}, ...]
     """
-    pcap_json_list = []
-    for pcap in pcaps:
-        pcap_json_list.append(get_pcap_as_json(pcap))
-
-    return pcap_json_list
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(pcaps) <= 1 or \
+            not all(is_random_access(pcap) for pcap in pcaps):
+        return [get_pcap_as_json(pcap) for pcap in pcaps]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(get_pcap_as_json, pcaps))
 
 
 def get_flat_frame_dict(pcap_json_list):
@@ -105,6 +128,177 @@ def get_frame_list_by_pcap(pcap_json_dict):
     return pcap_frame_list
 
 
+def get_frame_count_table(frame_table):
+    """Count how many times each unique frame occurs in each pcap.
+
+    Unlike get_flat_frame_dict, repeated frames (retransmissions, keepalives,
+    broadcast storms) are not collapsed. Frames are told apart by their
+    fingerprints and only the pcaps that have a frame get a count for it.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps.
+    Returns:
+        (tuple):
+            first_frames (np.ndarray): int64 position in the table of the
+                first occurrence of each unique frame, in order first seen.
+                The frame id of a frame is its index in first_frames.
+            frame_ids, pcap_ids, counts (np.ndarray): int64 frame id, pcap
+                index and occurrences of each frame in each pcap that has
+                it, sorted by frame id and pcap index.
+            frame_order (np.ndarray): int64 positions in the table sorted
+                like counts, then in capture order. The occurrences of
+                counts[k] start at frame_order[counts[:k].sum()].
+    """
+    _, first_frames, inverse = np.unique(
+        frame_table.fingerprints, return_index=True, return_inverse=True)
+    first_order = np.argsort(first_frames)
+    ranks = np.empty(len(first_order), dtype=np.int64)
+    ranks[first_order] = np.arange(len(first_order))
+    frame_ids = ranks[inverse.ravel()]
+    pcap_indices = frame_table.get_pcap_indices()
+    frame_order = np.lexsort((pcap_indices, frame_ids))
+
+    pcap_count = max(len(frame_table.pcap_offsets) - 1, 1)
+    keys = frame_ids[frame_order] * pcap_count + pcap_indices[frame_order]
+    entry_starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    counts = np.diff(np.append(entry_starts, len(keys)))
+    entry_keys = keys[entry_starts]
+    return first_frames[first_order].astype(np.int64), \
+        entry_keys // pcap_count, entry_keys % pcap_count, counts, frame_order
+
+
+def get_frame_table(pcap_json_dict, workers=1, keep_sources=False,
+                    find_sources=False):
+    """Put every frame of every pcap in a FrameTable.
+
+    With more than one worker, the table is in shared memory and workers
+    fingerprint its frames in place instead of being sent frame strings.
+
+    Args:
+        pcap_json_dict (dict): List of Pcap JSONs.
+        workers (int): Number of worker processes (0 for one per CPU).
+        keep_sources (bool): Whether to find where each frame is in its
+            pcap, so that results are saved as the frames were captured.
+        find_sources (bool): Whether to find where each frame is and its
+            linktype without saving results as captured, so that frames
+            with different linktypes are saved with their own.
+    Returns:
+        (FrameTable): Frames in capture order, pcap by pcap.
+    """
+    pcap_sizes = [len(pcap) for pcap in pcap_json_dict.values()]
+    # Sized from the hex lengths, so frames are written in place.
+    frame_lengths = [
+        len(get_frame_from_json(frame)) // 2
+        for pcap in pcap_json_dict.values() for frame in pcap
+    ]
+    workers = get_worker_count(workers, len(frame_lengths))
+    frame_table = FrameTable(
+        {'payload': sum(frame_lengths), 'frames': len(frame_lengths),
+         'pcaps': len(pcap_sizes)},
+        shared=workers > 1)
+    frame_table.offsets[1:] = np.cumsum(frame_lengths)
+    frame_table.pcap_offsets[1:] = np.cumsum(pcap_sizes)
+    del frame_lengths
+    payload = frame_table.payload
+    offsets = frame_table.offsets.tolist()
+    timestamps = []
+    frame_num = 0
+    for pcap in pcap_json_dict.values():
+        for frame in pcap:
+            payload[offsets[frame_num]:offsets[frame_num + 1]] = \
+                np.frombuffer(bytes.fromhex(get_frame_from_json(frame)),
+                              dtype=np.uint8)
+            timestamps.append(parse_timestamp(
+                frame['_source']['layers']['frame']['frame.time_epoch']))
+            frame_num += 1
+    frame_table.timestamps[:] = timestamps
+    if (keep_sources or find_sources) and pcap_json_dict:
+        sources = np.concatenate([
+            get_json_frame_sources(filename, pcap)
+            for filename, pcap in pcap_json_dict.items()
+        ])
+        frame_table.source_offsets[:] = sources[:, 0]
+        frame_table.source_lengths[:] = sources[:, 1]
+        frame_table.linktypes[:] = sources[:, 2]
+    if keep_sources:
+        frame_table.source_names = list(pcap_json_dict)
+
+    handle = frame_table.get_handle()
+    if workers <= 1:
+        frame_table.fingerprints[:] = \
+            get_table_fingerprints(handle, 0, len(frame_table))
+        return frame_table
+    bounds = np.linspace(0, len(frame_table),
+                         workers * SHARDS_PER_WORKER + 1).astype(int)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        fingerprint_chunks = pool.map(get_table_fingerprints,
+                                      [handle] * (len(bounds) - 1),
+                                      bounds[:-1], bounds[1:])
+        frame_table.fingerprints[:] = np.concatenate(list(fingerprint_chunks))
+    return frame_table
+
+
+def get_frame_sources(filename):
+    """Find where every frame of a pcap is, once per process.
+
+    Args:
+        filename (str): Name of packet capture.
+    Returns:
+        (np.ndarray): int64 rows of (<offset>, <length>, <linktype>) in
+            frame number order (see read_file.iter_frame_sources).
+    """
+    if filename not in FRAME_SOURCES:
+        FRAME_SOURCES[filename] = np.array([
+            (offset, len(frame), linktype)
+            for _, frame, linktype, offset in iter_frame_sources(filename)
+        ], dtype=np.int64).reshape(-1, 3)
+    return FRAME_SOURCES[filename]
+
+
+def get_json_frame_sources(filename, pcap_json):
+    """Find where the frames of a pcap's JSON are in the pcap.
+
+    Args:
+        filename (str): Name of packet capture.
+        pcap_json (list): JSON of the pcap's frames (maybe sampled).
+    Returns:
+        (np.ndarray): int64 rows of (<offset>, <length>, <linktype>) per
+            frame (see get_frame_sources). If the frames of the pcap can't
+            be matched to its JSON, offsets and lengths are -1 and the
+            linktype is that of the pcap's first frame.
+    """
+    if not pcap_json:
+        return np.zeros((0, 3), dtype=np.int64)
+    pcap_sources = get_frame_sources(filename)
+    frame_numbers = np.array([
+        int(frame['_source']['layers']['frame']['frame.number'])
+        for frame in pcap_json
+    ], dtype=np.int64)
+    if len(frame_numbers) and frame_numbers.max() > len(pcap_sources):
+        sources = np.full((len(pcap_json), 3), -1, dtype=np.int64)
+        sources[:, 2] = pcap_sources[0, 2] if len(pcap_sources) else 1
+        return sources
+    return pcap_sources[frame_numbers - 1]
+
+
+def get_table_fingerprints(frame_table_handle, start, end):
+    """Fingerprint frames start to end of a FrameTable. Runs in workers.
+
+    Args:
+        frame_table_handle (dict): See FrameTable.get_handle.
+        start (int): First frame.
+        end (int): Frame after the last frame.
+    Returns:
+        (np.ndarray): uint64 fingerprints of the frames.
+    """
+    frame_table = FrameTable.attach(frame_table_handle)
+    fingerprints = np.empty(end - start, dtype=np.uint64)
+    for frame_num in range(start, end):
+        fingerprints[frame_num - start] = \
+            get_frame_fingerprint(frame_table.get_frame(frame_num))
+    return fingerprints
+
+
 def get_pcap_frame_dict(pcaps):
     """Like get_flat_frame_dict, but with pcapname as key to each frame list
 
@@ -157,8 +351,8 @@ def get_pcap_as_json(pcap):
     """
     if not isinstance(pcap, str):
         raise TypeError("Filename must be string!\n" + str(pcap)[:120] + '...')
-    get_json_cmds = ['tshark', '-r', pcap, '-x', '-T', 'json']
-    pcap_json_pipe = sp.Popen(get_json_cmds, stdout=sp.PIPE)
+    pcap_json_pipe = popen_tshark(pcap, ['-x', '-T', 'json'],
+                                  stdout=sp.PIPE)
     pcap_json_raw = pcap_json_pipe.communicate()[0]
     pcap_json_pipe.kill()
     pcap_json_list = []
@@ -168,50 +362,132 @@ def get_pcap_as_json(pcap):
 
 
 def strip_layers(filenames, options):
-    """Get the PCAP JSON dict stripped per options.
+    """Get the PCAP JSON dict stripped and sampled per options.
 
     strip-l3:
         Replace layer 3 fields src/dst IP, ttl, checksum with dummy values
     strip-l2:
         Remove all layer 2 fields like FCS, source/dest MAC, VLAN tag...
+        (see strip_frame, which every engine strips frames with)
+    sample:
+        Keep only the frames in the sample (see sampling.py)
 
     Args:
         filenames (list): List of filenames.
-        options (dict): Whether to strip L2 and L3 headers.
+        options (dict): Whether to strip L2 and L3 headers, the 'sample'
+            rate and the number of 'workers' that read pcaps.
     Returns:
         (dict): The modified packet dict
     """
     pcap_json_dict = {}
-    for file in filenames:
-        pcap_json = parse_pcaps([file])[0]
-        if options['strip-l3']:
-            for index, packet in enumerate(pcap_json):
-                ip_raw = packet['_source']['layers']['ip_raw']
-                frame_raw = packet['_source']['layers']['frame_raw']
-                # Sometimes, these values will be a list instead of a string.
-                if isinstance(ip_raw, list):
-                    ip_raw = ip_raw[0]
-                if isinstance(frame_raw, list):
-                    frame_raw = frame_raw[0]
-                homogenized_packet = get_homogenized_packet(ip_raw)
-                pcap_json[index]['_source']['layers']['frame_raw'] = \
-                    homogenized_packet + frame_raw.split(ip_raw)[1]
-        elif options['strip-l2']:
-            for index, packet in enumerate(pcap_json):
-                eth_raw = packet['_source']['layers']['eth_raw']
-                if isinstance(eth_raw, list):
-                    eth_raw = eth_raw[0]  # Correct to string if list
-                eth_len = len(eth_raw)
-                frame_raw = packet['_source']['layers']['frame_raw']
-                if isinstance(frame_raw, list):
-                    frame_raw = frame_raw[0]  # Correct to string if list
-                pcap_json[index]['_source']['layers']['frame_raw'] = \
-                    frame_raw[eth_len:]
-        pcap_json_dict[file] = pcap_json
+    pcap_json_list = parse_pcaps(filenames, options.get('workers', 1))
+    for file, pcap_json in zip(filenames, pcap_json_list):
+        if is_stripped(options):
+            strip_pcap_json(file, pcap_json, options)
+        pcap_json_dict[file] = [
+            packet for packet in pcap_json
+            if is_sampled(get_frame_from_json(packet), options)
+        ]
 
     return pcap_json_dict
 
 
+def strip_pcap_json(filename, pcap_json, options):
+    """Strip the frames of a pcap's JSON in place with strip_frame.
+
+    The linktype of each frame is read from the pcap, so that the frames
+    are stripped exactly like the frames that other engines read directly.
+
+    Args:
+        filename (str): Name of packet capture.
+        pcap_json (list): JSON of the pcap's frames.
+        options (dict): Whether to strip L2 and L3 headers.
+    """
+    linktypes = get_json_frame_sources(filename, pcap_json)[:, 2].tolist()
+    for packet, linktype in zip(pcap_json, linktypes):
+        packet['_source']['layers']['frame_raw'] = \
+            strip_frame(get_frame_from_json(packet), linktype, options)
+
+
+def is_stripped(options):
+    """Check whether frames are compared without some of their headers.
+
+    Args:
+        options (dict): Whether to strip L2 and L3 headers.
+    Returns:
+        (bool): Whether 'strip-l2' or 'strip-l3' is set.
+    """
+    return bool(options.get('strip-l2') or options.get('strip-l3'))
+
+
+def strip_frame(frame_raw, linktype, options):
+    """Strip a single frame per options.
+
+    Every engine strips frames with this function (strip_layers through
+    strip_pcap_json), so that they fingerprint the same frames alike. The
+    L2 header length is derived from the linktype and VLAN tags, and the
+    IPv4 header length from its IHL field.
+
+    Args:
+        frame_raw (str): ASCII hex of the frame.
+        linktype (int): pcap linktype of the frame (1 = Ethernet).
+        options (dict): Whether to strip L2 and L3 headers.
+    Returns:
+        (str): The frame with headers removed/homogenized per options.
+    """
+    if not options['strip-l2'] and not options['strip-l3']:
+        return frame_raw
+    l2_len = get_l2_header_len(frame_raw, linktype)
+    if l2_len is None:
+        return frame_raw  # Unknown L2 header
+    ip_frame = frame_raw[l2_len:]
+    if options['strip-l3'] and ip_frame[:1] == '4':
+        ip_header_len = int(ip_frame[1:2], 16) * 8
+        ip_raw = ip_frame[:ip_header_len]
+        return get_homogenized_packet(ip_raw) + ip_frame[ip_header_len:]
+    return ip_frame
+
+
+def get_l2_header_len(frame_raw, linktype):
+    """Get the length of a frame's L2 header from its linktype.
+
+    Args:
+        frame_raw (str): ASCII hex of the frame.
+        linktype (int): pcap linktype of the frame (1 = Ethernet).
+    Returns:
+        (int): Length in hex chars (0 for raw IP) or None if the linktype's
+            header is unknown.
+    """
+    ethertype_vlan = ('8100', '88a8', '9100')
+    raw_ip_linktypes = (12, 14, 101)
+    linux_sll_linktype = 113
+    if linktype == 1:
+        l2_len = 28  # Ethernet header in hex chars, up to the ethertype.
+        while frame_raw[l2_len - 4:l2_len] in ethertype_vlan:
+            l2_len += 8
+        return l2_len
+    if linktype == linux_sll_linktype:
+        return 32
+    if linktype in raw_ip_linktypes:
+        return 0
+    return None
+
+
+def get_frame_fingerprint(frame_raw):
+    """Get a 64 bit fingerprint of a frame.
+
+    Fingerprints stand in for frame strings where only identity matters, such
+    as in the windows, partitions and indexes of the larger engines.
+
+    Args:
+        frame_raw (str): ASCII hex of the frame.
+    Returns:
+        (int): Unsigned 64 bit fingerprint.
+    """
+    digest = hashlib.blake2b(frame_raw.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
 def get_homogenized_packet(ip_raw):
     """Change an IPw4 packet's fields to the same, homogenized values.
 
@@ -284,11 +560,9 @@ def get_packet_count(filename):
     Returns:
         packet_count (int): How many packets were in that pcap
     """
-    packet_count_cmds = ['-r', filename, '-2']
-
-    pcap_text_pipe = sp.Popen(['tshark', *packet_count_cmds],
-                              stdout=sp.PIPE,
-                              stderr=sp.PIPE)
+    pcap_text_pipe = popen_tshark(filename, ['-2'],
+                                  stdout=sp.PIPE,
+                                  stderr=sp.PIPE)
     pcap_text = decode_stdout(pcap_text_pipe)
     pcap_text_pipe.kill()
     # Split text like so in order that we capture 1-line text with no newline
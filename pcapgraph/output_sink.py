@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Send the pcaps of set operations to a directory, a pipe or Wireshark.
+
+A sink is chosen with --sink:
+
+* a directory: each result is saved as a pcap in it (default: the CWD),
+  --workers at a time
+* -: results are written to stdout, to be piped into tshark or editcap
+* a named pipe (FIFO): results are written to it like stdout
+* wireshark: each result is fed to its own `wireshark -k -i -`
+
+Only directories keep a file of a result. A pipe carries one pcap, so
+several results need pcapng, whose sections can follow each other.
+"""
+import os
+import stat
+import subprocess as sp
+import sys
+
+from pcapgraph.set_result import save_results
+
+
+class OutputSink:
+    """Save results as pcaps in a directory."""
+
+    keeps_files = True
+
+    def __init__(self, target='.', workers=1):
+        """Save results in target.
+
+        Args:
+            target (str): Existing directory.
+            workers (int): Results saved at once (0 for one per CPU).
+        """
+        self.target = target
+        self.workers = workers
+
+    def write_results(self, set_results):
+        """Save every result, workers at a time.
+
+        Args:
+            set_results (list): SetResults of the run.
+        """
+        save_results(set_results, '' if self.target == '.' else self.target,
+                     self.workers)
+
+
+class StreamSink(OutputSink):
+    """Write results back to back to stdout or a named pipe."""
+
+    keeps_files = False
+
+    def __init__(self, target):
+        """Write results to target.
+
+        stdout is taken when the sink is made, so that it still refers to
+        the pipe if prints are redirected to stderr later.
+
+        Args:
+            target (str): '-' for stdout or the path of a named pipe.
+        """
+        super().__init__(target)
+        self.stdout = sys.stdout.buffer if target == '-' else None
+
+    def write_results(self, set_results):
+        """Write every result to the stream.
+
+        Args:
+            set_results (list): SetResults of the run.
+        Raises:
+            SyntaxError: If several results would be written as pcap.
+        """
+        check_stream_results(set_results)
+        if self.stdout:
+            for set_result in set_results:
+                set_result.write(self.stdout)
+            self.stdout.flush()
+            return
+        # Opening a named pipe waits until a reader opens it too.
+        with open(self.target, 'wb') as pipe:
+            for set_result in set_results:
+                set_result.write(pipe)
+
+
+class WiresharkSink(OutputSink):
+    """Feed each result to Wireshark's stdin without saving it."""
+
+    keeps_files = False
+
+    def __init__(self):
+        """Start a Wireshark per result when results are written."""
+        super().__init__('wireshark')
+
+    def write_results(self, set_results):
+        """Start a Wireshark for every result and write the result to it.
+
+        Args:
+            set_results (list): SetResults of the run.
+        """
+        for set_result in set_results:
+            print("Opening", set_result.name, "in wireshark.")
+            wireshark_sp = sp.Popen(['wireshark', '-k', '-i', '-'],
+                                    stdin=sp.PIPE)
+            with wireshark_sp.stdin:
+                set_result.write(wireshark_sp.stdin)
+
+
+def check_stream_results(set_results):
+    """Check that results can share one stream.
+
+    Args:
+        set_results (list): SetResults of the run.
+    Raises:
+        SyntaxError: If several results would be written as pcap.
+    """
+    if len(set_results) > 1 and not set_results[0].options['pcapng']:
+        raise SyntaxError("\nERROR: A pipe can only hold one pcap. Use "
+                          "--output pcapng to write " +
+                          str(len(set_results)) + " results to it.")
+
+
+def get_sink(target, workers=1):
+    """Get the sink of --sink.
+
+    Args:
+        target (str): A directory, '-', a named pipe or 'wireshark'.
+        workers (int): Results that a directory sink saves at once.
+    Returns:
+        (OutputSink): Sink that writes results there.
+    Raises:
+        SyntaxError: If target is none of these.
+    """
+    if target == 'wireshark':
+        return WiresharkSink()
+    if target == '-' or os.path.exists(target) and stat.S_ISFIFO(
+            os.stat(target).st_mode):
+        return StreamSink(target)
+    if os.path.isdir(target):
+        return OutputSink(target, workers)
+    raise SyntaxError("\nERROR: --sink must be a directory, -, a named pipe "
+                      "or wireshark, not " + target + ".")
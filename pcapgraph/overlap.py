@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare every pair of pcaps exactly to map where traffic flows.
+
+For pcaps A and B with unique frame sets |A| and |B|:
+
+* common: |A & B|
+* jaccard: |A & B| / |A | B|
+* containment of A in B: |A & B| / |A|, the share of A's frames that B saw
+
+All pairs come from one pass over the membership index (see
+parallel_math.get_overlap_counts). Percentages of samples (--sample) come
+with their 95% confidence interval.
+"""
+import csv
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from pcapgraph.sampling import get_confidence_interval
+from pcapgraph.sampling import get_percent_text
+
+# Pcap names are not shown on larger heatmaps.
+MAX_HEATMAP_LABELS = 50
+# Counts are written in the cells of smaller heatmaps.
+MAX_ANNOTATED_PCAPS = 12
+
+
+def get_overlap_ratios(overlap_counts):
+    """Get the Jaccard index and containment of every pair of pcaps.
+
+    Args:
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+    Returns:
+        (tuple): jaccard, containment (np.ndarray). containment[a, b] is the
+            share of pcap a's unique frames that are in pcap b. Pcaps without
+            frames have 0 for both.
+    """
+    unique_counts = np.diag(overlap_counts)
+    union_counts = unique_counts[:, None] + unique_counts[None, :] - \
+        overlap_counts
+    jaccard = overlap_counts / np.maximum(union_counts, 1)
+    containment = overlap_counts / np.maximum(unique_counts, 1)[:, None]
+    return jaccard, containment
+
+
+def get_overlap_rows(filenames, overlap_counts, options):
+    """Get one row per ordered pair of pcaps.
+
+    Args:
+        filenames (list): List of filenames.
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+        options (dict): 'sample' rate N of 1/N.
+    Returns:
+        (list): [(<pcap a>, <pcap b>, <common frames>, <jaccard %>,
+            <% of a in b>), ...]. For a sample, each % is followed by the
+            low and high % of its confidence interval.
+    """
+    unique_counts = np.diag(overlap_counts)
+    rows = []
+    for first in range(len(filenames)):
+        for second in range(len(filenames)):
+            common_count = int(overlap_counts[first, second])
+            union_count = int(unique_counts[first] + unique_counts[second] -
+                              common_count)
+            row = [filenames[first], filenames[second], common_count]
+            for total in [union_count, int(unique_counts[first])]:
+                row.append(round(100 * common_count / (total or 1), 1))
+                if options.get('sample', 1) > 1:
+                    row.extend(
+                        round(100 * bound, 1) for bound in
+                        get_confidence_interval(common_count, total))
+            rows.append(tuple(row))
+    return rows
+
+
+def make_overlap_text(filenames, overlap_counts, options):
+    """Make the text of the overlap of each pair of pcaps.
+
+    Args:
+        filenames (list): List of filenames.
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+        options (dict): 'sample' rate N of 1/N.
+    Returns:
+        (str): Unique frames of each pcap, then one line per pair with the
+            share of each pcap's frames in the other.
+    """
+    result_string = "{: <10} {: <}".format('\nFRAMES', 'PCAP NAME')
+    unique_counts = np.diag(overlap_counts)
+    for filename, unique_count in zip(filenames, unique_counts):
+        result_string += "\n{: <10} {: <}".format(str(unique_count),
+                                                  filename)
+    # Confidence intervals of samples need wider columns.
+    percent_format = "{: <16} " if options.get('sample', 1) > 1 else \
+        "{: <10} "
+    row_format = "{: <10} " + percent_format * 3 + "{: <}"
+    result_string += '\n' + row_format.format(
+        '\nCOMMON', 'JACCARD', 'A IN B', 'B IN A', 'PCAP A  PCAP B')
+    for first in range(len(filenames)):
+        for second in range(first + 1, len(filenames)):
+            common_count = overlap_counts[first, second]
+            union_count = unique_counts[first] + unique_counts[second] - \
+                common_count
+            result_string += '\n' + row_format.format(
+                str(common_count),
+                get_percent_text(common_count, union_count, options),
+                get_percent_text(common_count, unique_counts[first],
+                                 options),
+                get_percent_text(common_count, unique_counts[second],
+                                 options),
+                filenames[first] + '  ' + filenames[second])
+    return result_string
+
+
+def write_overlap_csv(filenames, overlap_counts, options, csv_name):
+    """Write the overlap of every ordered pair of pcaps as CSV.
+
+    Args:
+        filenames (list): List of filenames.
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+        options (dict): 'sample' rate N of 1/N.
+        csv_name (str): Name of the CSV file.
+    """
+    header = ['pcap_a', 'pcap_b', 'common_frames']
+    for percent_column in ['jaccard_percent', 'a_in_b_percent']:
+        header.append(percent_column)
+        if options.get('sample', 1) > 1:
+            header.extend(
+                [percent_column + '_low', percent_column + '_high'])
+    with open(csv_name, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(header)
+        writer.writerows(get_overlap_rows(filenames, overlap_counts, options))
+
+
+def draw_overlap_heatmap(filenames, overlap_counts):
+    """Draw the share of each pcap's frames (rows) seen by each pcap.
+
+    Args:
+        filenames (list): List of filenames.
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+    """
+    pcap_count = len(filenames)
+    _, containment = get_overlap_ratios(overlap_counts)
+    plt.figure(figsize=(10, 8))
+    plt.imshow(100 * containment, cmap='viridis', vmin=0, vmax=100)
+    plt.colorbar(label='% of row pcap frames in column pcap')
+    if pcap_count <= MAX_HEATMAP_LABELS:
+        labels = [os.path.basename(filename) for filename in filenames]
+        plt.xticks(range(pcap_count), labels, rotation=90, fontsize=7)
+        plt.yticks(range(pcap_count), labels, fontsize=7)
+    if pcap_count <= MAX_ANNOTATED_PCAPS:
+        for first in range(pcap_count):
+            for second in range(pcap_count):
+                text_color = 'black' if containment[first, second] > 0.6 \
+                    else 'white'
+                plt.text(second, first, str(overlap_counts[first, second]),
+                         ha='center', va='center', color=text_color,
+                         fontsize=8)
+    plt.title('Frames in common between pcaps')
+    plt.tight_layout()
+
+
+def output_overlap(filenames, overlap_counts, options, output_fmts):
+    """Print the overlap of each pair of pcaps and draw their heatmap.
+
+    Args:
+        filenames (list): List of filenames.
+        overlap_counts (np.ndarray): See parallel_math.get_overlap_counts.
+        options (dict): 'sample' rate N of 1/N.
+        output_fmts (list): 'txt', 'csv' and/or image formats (see
+            draw_graph). Without any, the heatmap is shown on screen.
+    """
+    overlap_text = make_overlap_text(filenames, overlap_counts, options)
+    print(overlap_text)
+    image_fmts = [fmt for fmt in output_fmts if fmt not in ['txt', 'csv']]
+    if 'txt' in output_fmts:
+        with open('pcap_overlap.txt', 'w') as file:
+            file.write(overlap_text)
+        print("Text file successfully created!")
+    if 'csv' in output_fmts:
+        write_overlap_csv(filenames, overlap_counts, options,
+                          'pcap_overlap.csv')
+        print("CSV file successfully created!")
+    if image_fmts or not output_fmts:
+        draw_overlap_heatmap(filenames, overlap_counts)
+    for save_format in image_fmts:
+        plt.savefig('pcap_overlap.' + save_format, format=save_format)
+        print(save_format, "file successfully created in ", os.getcwd(),
+              "!")
+    if not output_fmts:
+        plt.show()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Build the membership index of all pcaps on multiple cores.
+
+The membership index has one row per unique frame fingerprint and one bit per
+pcap that has the frame. Every set operation is a selection of rows:
+
+* intersection: rows with every bit set
+* difference/symmetric difference of pcap N: rows with only bit N set
+* union: every row
+* overlap of each pair of pcaps: rows with both bits set
+
+Identical frames have identical fingerprints, so partitioning fingerprints by
+value into shards lets each shard be indexed on its own core. Frames are
+partitioned once and each worker only receives the frame numbers of its
+shard. Gathering the shards is a concatenation. Workers read the frames from
+a shared memory FrameTable (see frame_table.py), so no frames are pickled.
+"""
+import concurrent.futures
+import os
+
+import numpy as np
+
+from pcapgraph.frame_table import FrameTable
+
+# More shards than workers evens out shards of different sizes.
+SHARDS_PER_WORKER = 4
+# Below this many frames, starting processes costs more than it saves.
+MIN_PARALLEL_FRAMES = 200000
+
+
+def get_worker_count(workers, frame_count):
+    """Get the number of worker processes worth starting.
+
+    Args:
+        workers (int): Requested worker processes (0 for one per CPU).
+        frame_count (int): Number of frames to process.
+    Returns:
+        (int): Worker processes to use. 1 means work in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if frame_count < MIN_PARALLEL_FRAMES:
+        return 1
+    return workers
+
+
+def get_shard_frames(frame_table, shard_count):
+    """Partition the frames of a table into shards by fingerprint.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps.
+        shard_count (int): Number of shards.
+    Returns:
+        (list): int64 frame numbers of each shard in table order.
+    """
+    shard_ids = frame_table.fingerprints % np.uint64(shard_count)
+    order = np.argsort(shard_ids, kind='stable')
+    shard_starts = np.searchsorted(shard_ids[order],
+                                   np.arange(1, shard_count, dtype=np.uint64))
+    return np.split(order.astype(np.int64), shard_starts)
+
+
+def index_shard(frame_table_handle, frame_nums=None):
+    """Build the membership index of the frames in one shard.
+
+    The frame table is attached read-only, so workers only receive the
+    small handle and share the creating process's frame memory.
+
+    Args:
+        frame_table_handle (dict): See FrameTable.get_handle.
+        frame_nums (np.ndarray): Frame numbers of the shard in table order
+            (see get_shard_frames), or None for every frame.
+    Returns:
+        (tuple):
+            fingerprints (np.ndarray): Unique fingerprints (uint64).
+            last_frames (np.ndarray): Position in the frame table of the
+                last frame with each fingerprint. Like get_flat_frame_dict,
+                the last frame's timestamp is the one that is used.
+            membership (np.ndarray): uint8 array of shape
+                (len(fingerprints), ceil(num_pcaps / 8)) with the bit of each
+                pcap that has the fingerprint set (np.packbits order).
+    """
+    frame_table = FrameTable.attach(frame_table_handle)
+    pcap_count = len(frame_table.pcap_offsets) - 1
+    if frame_nums is None:
+        frame_nums = np.arange(len(frame_table))
+    # Reversed so that np.unique finds the last frame of each fingerprint.
+    frame_nums = frame_nums[::-1]
+    fingerprints, last_rows, rows = np.unique(
+        frame_table.fingerprints[frame_nums],
+        return_index=True,
+        return_inverse=True)
+    pcap_indices = np.searchsorted(
+        frame_table.pcap_offsets, frame_nums, side='right') - 1
+    members = np.zeros((len(fingerprints), pcap_count), dtype=bool)
+    members[rows.ravel(), pcap_indices] = True
+    return fingerprints, frame_nums[last_rows], np.packbits(members, axis=1)
+
+
+def get_membership_index(frame_table, workers=1):
+    """Build the membership index of all pcaps, sharded over workers.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps (see
+            manipulate_frames.get_frame_table).
+        workers (int): Number of worker processes (0 for one per CPU).
+    Returns:
+        (tuple): fingerprints, last_frames, membership (see index_shard).
+    """
+    workers = get_worker_count(workers, len(frame_table))
+    handle = frame_table.get_handle()
+    if workers <= 1:
+        return index_shard(handle)
+
+    shard_frames = get_shard_frames(frame_table,
+                                    workers * SHARDS_PER_WORKER)
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        shard_indexes = list(
+            pool.map(index_shard, [handle] * len(shard_frames),
+                     shard_frames))
+    return tuple(
+        np.concatenate([index[part] for index in shard_indexes])
+        for part in range(3))
+
+
+def get_member_rows(membership, pcap_count, pcap_indices):
+    """Select rows of frames that are in exactly the pcaps in pcap_indices.
+
+    Args:
+        membership (np.ndarray): Packed membership bits (see index_shard).
+        pcap_count (int): Number of pcaps in the index.
+        pcap_indices (list): Indices of pcaps the frames must be in (only).
+    Returns:
+        (np.ndarray): Boolean array that selects the matching rows.
+    """
+    pattern = np.zeros(pcap_count, dtype=bool)
+    pattern[list(pcap_indices)] = True
+    packed_pattern = np.packbits(pattern)
+    return (membership == packed_pattern).all(axis=1)
+
+
+def get_overlap_counts(membership, pcap_count):
+    """Count the frames that each pair of pcaps has in common.
+
+    Rows with the same membership bits are counted together, so the matrix
+    is one product over the distinct memberships instead of an intersection
+    per pair.
+
+    Args:
+        membership (np.ndarray): Packed membership bits (see index_shard).
+        pcap_count (int): Number of pcaps in the index.
+    Returns:
+        (np.ndarray): int64 array of shape (pcap_count, pcap_count) with the
+            number of unique frames in both pcaps. The diagonal has the
+            number of unique frames in each pcap.
+    """
+    patterns, pattern_counts = np.unique(
+        membership, axis=0, return_counts=True)
+    members = np.unpackbits(
+        patterns, axis=1, count=pcap_count).astype(np.int64)
+    return members.T @ (members * pattern_counts[:, None])
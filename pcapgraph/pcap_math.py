@@ -13,16 +13,40 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Do algebraic operations on sets like union, intersect, difference."""
-import collections
+import heapq
 import os
 import time
 
+import numpy as np
+
 from pcapgraph.manipulate_frames import strip_layers
-from pcapgraph.manipulate_frames import get_flat_frame_dict
-from pcapgraph.manipulate_frames import get_frame_list_by_pcap
-from pcapgraph.manipulate_frames import get_frame_from_json
+from pcapgraph.manipulate_frames import get_frame_count_table
+from pcapgraph.manipulate_frames import get_frame_table
+from pcapgraph.manipulate_frames import is_stripped
+from pcapgraph.frame_table import FrameSelection
+from pcapgraph.frame_table import MergedFrames
+from pcapgraph.parallel_math import get_membership_index
+from pcapgraph.parallel_math import get_member_rows
+from pcapgraph.parallel_math import get_overlap_counts
+from pcapgraph.scheduler import run_graph
+from pcapgraph.sampling import get_percent_text
 from pcapgraph.save_file import convert_to_pcaptext
-import pcapgraph.save_file as save
+from pcapgraph.set_result import SetResult
+from pcapgraph.set_result import save_results
+
+# Shared intermediates (see PcapMath.get_intermediate_tasks) of each operation
+OPERATION_INTERMEDIATES = {
+    '--difference': ['complements'],
+    '--intersection': ['intersection'],
+    '--symmetric-difference': ['complements'],
+    '--union': ['frame-count-table'],
+    '--bounded-intersection': ['bounded-pcaps'],
+    '--inverse-bounded': ['bounded-pcaps', 'intersection'],
+}
+MULTISET_OPERATIONS = [
+    '--difference', '--intersection', '--symmetric-difference'
+]
+MOST_COMMON_FRAMES = 10
 
 
 class PcapMath:
@@ -30,6 +54,19 @@ class PcapMath:
 
     For multiple set operations, files are read in only once in __init__.
     Use different PcapMath objects if input files are different.
+
+    Set operations select frames from one membership index of all pcaps that
+    is built once, on options['workers'] processes (see parallel_math.py).
+    Workers share one copy of the frames in a FrameTable (see frame_table.py).
+    Intermediates like the intersection and the frames unique to each pcap
+    are computed once and shared by all operations that need them.
+
+    With options['multiset'] set, operations respect how many times each frame
+    occurs (bag semantics) instead of collapsing repeated frames:
+
+    * intersection: minimum count across pcaps
+    * difference: minuend count minus the counts of all other pcaps
+    * union: maximum count across pcaps ('max') or total count ('sum')
     """
 
     def __init__(self, filenames, options):
@@ -40,21 +77,24 @@ class PcapMath:
 
         Args:
             filenames (list): List of filenames.
-            options (dict): Whether to strip L2 and L3 headers.
+            options (dict): Whether to strip L2 and L3 headers, whether
+                to use multiset semantics ('max' or 'sum' union) and the
+                number of 'workers' for set operations.
         """
         self.filenames = filenames
         self.pcap_json_dict = strip_layers(filenames, options)
-        pcap_json_list = [*self.pcap_json_dict.values()]
-        self.frame_timestamp_dict = get_flat_frame_dict(pcap_json_list)
-        self.frame_list_by_pcap = []
+        self.frame_count_table = ()
+        self.frame_table = None
+        self.membership_index = ()
+        self.intersection_frames = None
+        self.complements = []
+        self.intersection_bound_nums = ()
+        self.bounded_pcaps = []
         self.exclude_empty = False
         self.options = options
 
     def parse_set_args(self, args):
-        """Call the appropriate method per CLI flags.
-
-        difference, union, intersect consist of {<op>: {frame: timestamp, ...}}
-        bounded_intersect consists of {pcap: {frame: timestamp, ...}, ...}
+        """Call the appropriate method per CLI flags and save the results.
 
         Args:
             args (dict): Dict of all arguments (including set args).
@@ -62,101 +102,138 @@ class PcapMath:
             filenames (list): List of all files, including ones generated
                 by set operations.
         """
-        new_files = []
-        bounded_filelist = []
-        intersect_file = ''
+        # Put filenames in a different place in memory so it is not altered.
+        filenames = list(self.filenames)
+        filenames.extend(self.save_results(self.get_set_results(args)))
+        return filenames
+
+    def save_results(self, set_results):
+        """Save results as pcaps on options['workers'] threads.
+
+        Args:
+            set_results (list): SetResults to save.
+        Returns:
+            (list(str)): Filenames of the saved pcaps.
+        """
+        return save_results(set_results,
+                            workers=self.options.get('workers', 1))
+
+    def get_set_results(self, args):
+        """Do the set operations requested by CLI flags without saving them.
+
+        difference, union, intersect consist of one result and
+        symmetric difference and the bounded intersections of one per pcap.
+
+        Args:
+            args (dict): Dict of all arguments (including set args).
+        Returns:
+            (list): SetResults of all operations, in the order of the flags.
+        """
+        set_results = []
         self.exclude_empty = args['--exclude-empty']
+        self.prepare_intermediates(args)
         if args['--difference']:
-            generated_file = self.difference_pcap()
-            # As long as the difference exists.
-            if generated_file:
-                new_files.append(generated_file)
+            set_results.append(self.get_difference())
         if args['--intersection']:
-            intersect_file = self.intersect_pcap()
-            new_files.append(intersect_file)
+            intersection = self.get_intersection()
+            if len(intersection) or not self.exclude_empty:
+                set_results.append(intersection)
         if args['--symmetric-difference']:
-            generated_filelist = self.symmetric_difference_pcap()
-            new_files.extend(generated_filelist)
+            set_results.extend(self.get_symmetric_difference())
         if args['--union']:
-            generated_file = self.union_pcap()
-            new_files.append(generated_file)
+            set_results.append(self.get_union())
 
         if args['--bounded-intersection']:
-            bounded_filelist = self.bounded_intersect_pcap()
-            new_files.extend(bounded_filelist)
+            set_results.extend(self.get_bounded_intersections())
         if args['--inverse-bounded']:
-            if not intersect_file:
-                intersect_file = self.intersect_pcap()
-            generated_filelist = self.inverse_bounded_intersect_pcap(
-                bounded_filelist=bounded_filelist,
-                intersect_file=intersect_file)
-            if not args['--intersection']:
-                os.remove(intersect_file)
-            new_files.extend(generated_filelist)
+            set_results.extend(self.get_inverse_bounded_intersections())
 
-        # Put filenames in a different place in memory so it is not altered.
-        filenames = list(self.filenames)
-        filenames.extend(new_files)
-        return filenames
+        # Differences are None if empty and excluded with -x.
+        return [result for result in set_results if result is not None]
+
+    def prepare_intermediates(self, args):
+        """Compute the intermediates that the requested operations share.
+
+        Each intermediate is computed once, after the ones it depends on
+        (see scheduler.run_graph).
+
+        Args:
+            args (dict): Dict of all arguments (including set args).
+        """
+        targets = []
+        for flag, intermediates in OPERATION_INTERMEDIATES.items():
+            if args[flag]:
+                targets.extend(intermediates)
+            if args[flag] and flag in MULTISET_OPERATIONS and \
+                    self.options.get('multiset'):
+                targets.append('frame-count-table')
+        tasks = self.get_intermediate_tasks()
+        run_graph(tasks, [target for target in targets if target in tasks])
+
+    def get_intermediate_tasks(self):
+        """Get the intermediates of set operations as a DAG of tasks.
+
+        Every task is a getter that caches its result, so operations can
+        call it again for free.
+
+        Returns:
+            (dict): {<name>: (<function>, [<dependency name>, ...]), ...}
+        """
+        return {
+            'frame-count-table':
+            (self.get_frame_count_table, ['membership-index']),
+            'membership-index': (self.get_membership_index, []),
+            'intersection':
+            (self.get_intersection_frames, ['membership-index']),
+            'complements': (self.get_complements, ['membership-index']),
+            'intersection-bounds':
+            (self.get_minmax_common_frames, ['intersection']),
+            'bounded-pcaps':
+            (self.get_bounded_pcaps, ['intersection-bounds']),
+        }
 
     def union_pcap(self):
         """Given sets A = (1, 2, 3), B = (2, 3, 4), A + B = (1, 2, 3, 4).
 
-        About:
-            This method uses tshark to get identifying information on
-            pcaps and then mergepcap to save the combined pcap.
-
         Returns:
             (string): Name of generated pcap.
         """
-        raw_packet_list = []
-        for pcap in self.pcap_json_dict.values():
-            for frame in pcap:
-                raw_frame = get_frame_from_json(frame)
-                raw_packet_list.append(raw_frame)
+        return self.get_union().save()
 
-        self.print_10_most_common_frames(raw_packet_list)
+    def get_union(self):
+        """Get the union and print the 10 most common frames.
 
-        union_frame_dict = {}
-        for frame in raw_packet_list:
-            union_frame_dict[frame] = self.frame_timestamp_dict[frame]
-        save.save_pcap(
-            pcap_dict=union_frame_dict,
-            name='union.pcap',
-            options=self.options)
+        Returns:
+            (SetResult): Union of all pcaps.
+        """
+        first_frames = self.get_frame_count_table()[0]
+        self.print_10_most_common_frames(get_most_common_frames(
+            self.frame_table, first_frames, self.get_frame_counts('sum')))
+
+        if self.options.get('multiset'):
+            union_frames = self.get_multiset_frames(
+                self.get_frame_counts(self.options['multiset']))
+        else:
+            _, last_frames, membership = self.get_membership_index()
+            union_frames = MergedFrames(self.frame_table, last_frames,
+                                        membership, self.filenames)
 
-        return 'union.pcap'
+        return SetResult('union.pcap', union_frames, self.options)
 
     @staticmethod
-    def print_10_most_common_frames(raw_frame_list):
+    def print_10_most_common_frames(frame_counts):
         """After doing a packet union, find/print the 10 most common packets.
 
-        This is a work in progress and may eventually use this bash:
-
-        <packets> | text2pcap - - | tshark -r - -o 'gui.column.format:"No.",
-        "%m","VLAN","%q","Src MAC","%uhs","Dst MAC","%uhd","Src IP","%us",
-        "Dst IP","%ud","Protocol","%p","Src port","%uS","Dst port","%uD"'
-
-        Alternatively, just use the existing information in pcap_dict.
-
-        The goal is to print
-        frame#, VLAN, src/dst MAC, src/dst IP, L4 src/dst ports, protocol
-
-        This should likely be its own CLI flag in future.
+        Use --top-talkers to count frames, flows or hosts without a union.
 
         Args:
-            raw_frame_list (list): List of raw frames
+            frame_counts (dict): Occurrences across all pcaps per raw frame
+                {<frame>: <count>, ...}, in order of first appearance.
         """
-        packet_stats = collections.Counter(raw_frame_list)
         # It's not a common frame if it is only seen once.
-        packet_stats = {k: v for k, v in packet_stats.items() if v > 1}
-        sorted_packets = sorted(
-            packet_stats, key=packet_stats.__getitem__, reverse=True)
-        counter = 0
-        for packet in sorted_packets:
-            counter += 1
-            if counter == 10:
-                break
+        packet_stats = {k: v for k, v in frame_counts.items() if v > 1}
+        for packet in heapq.nlargest(MOST_COMMON_FRAMES, packet_stats,
+                                     key=packet_stats.__getitem__):
             packet_text = convert_to_pcaptext(packet)
 
             print("Count: {: <7}\n{: <}".format(packet_stats[packet],
@@ -171,34 +248,49 @@ class PcapMath:
         Returns:
             (str): Fileame of generated pcap.
         """
-        # Generate intersection set of frames
-        if not self.frame_list_by_pcap:
-            self.frame_list_by_pcap = \
-                get_frame_list_by_pcap(self.pcap_json_dict)
-        frame_list = self.frame_list_by_pcap
-        frame_intersection = set(frame_list[0]).intersection(*frame_list[1:])
+        intersection = self.get_intersection()
+        intersection.save()
+        return intersection.name if len(intersection) else ''
+
+    def get_intersection(self):
+        """Get the intersection and print how much of each pcap is in it.
 
-        # Print intersection output like in docstring
+        Returns:
+            (SetResult): Intersection of all pcaps.
+        """
+        frame_intersection = self.get_intersection_frames()
         intersection_count = len(frame_intersection)
-        print("{: <12} {: <}".format('\nSAME %', 'PCAP NAME'))
-        for pcap in self.filenames:
-            same_percent = str(
-                round(100 * (intersection_count / len(frame_list[0])))) + '%'
-            print("{: <12} {: <}".format(same_percent, pcap))
-
-        intersect_frame_dict = {}
-        for frame in frame_intersection:
-            intersect_frame_dict[frame] = self.frame_timestamp_dict[frame]
-        save.save_pcap(
-            pcap_dict=intersect_frame_dict,
-            name='intersect.pcap',
-            options=self.options)
-
-        if frame_intersection:
-            return 'intersect.pcap'
-        print('WARNING! Intersection between ', self.filenames,
-              ' contains no packets!')
-        return ''
+        self.print_same_percent(intersection_count,
+                                np.diff(self.get_pcap_offsets()).tolist())
+
+        if self.options.get('multiset'):
+            intersect_frames = self.get_multiset_frames(
+                self.get_frame_counts('min'))
+        else:
+            intersect_frames = frame_intersection
+
+        if not intersection_count:
+            print('WARNING! Intersection between ', self.filenames,
+                  ' contains no packets!')
+        return SetResult('intersect.pcap', intersect_frames, self.options)
+
+    def print_same_percent(self, intersection_count, frame_counts):
+        """Print how much of each pcap is in the intersection.
+
+        For a sample (options['sample']), each percentage is followed by its
+        95% confidence interval.
+
+        Args:
+            intersection_count (int): Number of frames in the intersection.
+            frame_counts (list): Number of frames in each pcap.
+        """
+        row_format = "{: <18} {: <}" if self.options.get('sample', 1) > 1 \
+            else "{: <12} {: <}"
+        print(row_format.format('\nSAME %', 'PCAP NAME'))
+        for pcap, frame_count in zip(self.filenames, frame_counts):
+            print(row_format.format(
+                get_percent_text(intersection_count, frame_count,
+                                 self.options), pcap))
 
     def difference_pcap(self, pivot_index=0):
         """Given sets A = (1, 2, 3), B = (2, 3, 4), C = (3, 4, 5), A-B-C = (1).
@@ -209,41 +301,230 @@ class PcapMath:
         Returns:
             (string): Name of generated pcap.
         """
-        pcap_json_list = [*self.pcap_json_dict.values()]
-        minuend_pcap_json = pcap_json_list[pivot_index]
+        difference = self.get_difference(pivot_index)
+        return difference.save() if difference is not None else ''
+
+    def get_difference(self, pivot_index=0):
+        """Get the difference with pivot_index as the minuend.
+
+        Args:
+            pivot_index [int]: Specify minuend by index of filename in list
+
+        Returns:
+            (SetResult): Difference or None if it is empty and excluded.
+        """
+        if self.options.get('multiset'):
+            pivot_counts = self.get_frame_counts(pivot_index)
+            diff_counts = 2 * pivot_counts - self.get_frame_counts('sum')
+            diff_frames = self.get_multiset_frames(
+                np.clip(diff_counts, 0, None), pivot_index=pivot_index)
+        else:
+            # Frames only in the minuend have the minuend's timestamps.
+            diff_frames = self.get_complements()[pivot_index]
+
+        return self.get_difference_result(diff_frames, pivot_index)
+
+    def get_membership_index(self):
+        """Get the (fingerprints, first frames, membership) index of all pcaps.
+
+        The frame table and index are built once per set of input files. See
+        parallel_math.index_shard for the format.
+
+        Returns:
+            (tuple): fingerprints, last_frames, membership (np.ndarray)
+        """
+        if not self.membership_index:
+            workers = self.options.get('workers', 1)
+            self.frame_table = get_frame_table(
+                self.pcap_json_dict, workers, is_stripped(self.options),
+                find_sources=True)
+            self.membership_index = get_membership_index(
+                self.frame_table, workers)
+        return self.membership_index
+
+    def get_overlap_counts(self):
+        """Get the unique frames that each pair of pcaps has in common.
+
+        Returns:
+            (np.ndarray): See parallel_math.get_overlap_counts.
+        """
+        _, _, membership = self.get_membership_index()
+        return get_overlap_counts(membership, len(self.filenames))
+
+    def get_intersection_frames(self):
+        """Get the frames that are in all pcaps (computed once).
+
+        Returns:
+            (FrameSelection): Frames that are in every pcap.
+        """
+        if self.intersection_frames is None:
+            self.intersection_frames = \
+                self.get_frames_only_in(range(len(self.filenames)))
+        return self.intersection_frames
+
+    def get_complements(self):
+        """Get the frames unique to each pcap (computed once).
+
+        These are the differences that have each pcap as the minuend.
+
+        Returns:
+            (list): FrameSelection of each pcap.
+        """
+        if not self.complements:
+            self.complements = [
+                self.get_frames_only_in([pcap_index])
+                for pcap_index in range(len(self.filenames))
+            ]
+        return self.complements
+
+    def get_frames_only_in(self, pcap_indices):
+        """Get the frames that are in exactly the pcaps at pcap_indices.
+
+        All pcaps gives the intersection. One pcap gives its difference with
+        all other pcaps.
+
+        Args:
+            pcap_indices (iterable): Indices of pcaps in self.filenames.
+        Returns:
+            (FrameSelection): Frames that are in those pcaps and no others.
+        """
+        _, last_frames, membership = self.get_membership_index()
+        member_rows = get_member_rows(membership, len(self.filenames),
+                                      pcap_indices)
+        return self.select_frames(last_frames[member_rows])
+
+    def select_frames(self, frame_nums):
+        """Select frames of the frame table.
+
+        Args:
+            frame_nums (np.ndarray): Positions of the frames in the table.
+        Returns:
+            (FrameSelection): The frames.
+        """
+        return FrameSelection(self.frame_table, frame_nums)
+
+    def get_pcap_offsets(self):
+        """Get the first frame of each pcap.
+
+        Returns:
+            (np.ndarray): Like FrameTable.pcap_offsets.
+        """
+        self.get_membership_index()
+        return self.frame_table.pcap_offsets
+
+    def get_difference_result(self, diff_frames, pivot_index, name=''):
+        """Wrap the difference that has the pcap at pivot_index as minuend.
+
+        Args:
+            diff_frames (dict|list): Frames of the difference (see
+                save.save_pcap).
+            pivot_index [int]: Index of the minuend's filename in list
+            name (str): Filename of the result. Defaults to diff_<minuend>.
+        Returns:
+            (SetResult): Difference or None if it is empty and excluded.
+        """
         minuend_name = self.filenames[pivot_index]
-        # pcap json list - minuend json. With index 0, remove 1st pcap json.
-        diff_pcap_json_list = pcap_json_list[:pivot_index] + \
-            pcap_json_list[pivot_index+1:]
-
-        minuend_frame_dict = get_flat_frame_dict([minuend_pcap_json])
-        minuend_frame_list = list(minuend_frame_dict.keys())
-        diff_frame_dict = get_flat_frame_dict(diff_pcap_json_list)
-        diff_frame_list = list(diff_frame_dict.keys())
-        packet_diff = set(minuend_frame_list).difference(set(diff_frame_list))
-
-        diff_frame_dict = {}
-        for frame in packet_diff:
-            # Minuend frame dict should have all values we care about.
-            diff_frame_dict[frame] = minuend_frame_dict[frame]
-        diff_filename = 'diff_' + os.path.basename(minuend_name)
-        # Save only if there are packets or -x flag is not used.
-        if not packet_diff:
+        diff_filename = name or 'diff_' + os.path.basename(minuend_name)
+        # Keep only if there are packets or -x flag is not used.
+        if not diff_frames:
             print('WARNING! ' + minuend_name +
                   ' difference contains no packets!')
-        if packet_diff or not self.exclude_empty:
-            # If the file already exists, choose a different name.
-            unique_diff_name = diff_filename
-            while os.path.isfile(unique_diff_name):
-                unique_diff_name = diff_filename[:-5] + '-' + \
-                                   str(int(time.time())) + '.pcap'
-            save.save_pcap(
-                pcap_dict=diff_frame_dict,
-                name=unique_diff_name,
-                options=self.options)
-            return unique_diff_name
-
-        return ''
+            if self.exclude_empty:
+                return None
+        # If the file already exists, choose a different name.
+        unique_diff_name = diff_filename
+        while not name and os.path.isfile(unique_diff_name):
+            unique_diff_name = diff_filename[:-5] + '-' + \
+                               str(int(time.time())) + '.pcap'
+        return SetResult(unique_diff_name, diff_frames, self.options)
+
+    def get_frame_count_table(self):
+        """Get the occurrence table of all pcaps' frames.
+
+        The table is built once per set of input files. See
+        manipulate_frames.get_frame_count_table for the format.
+
+        Returns:
+            (tuple): first_frames, frame_ids, pcap_ids, counts, frame_order
+        """
+        if not self.frame_count_table:
+            self.get_membership_index()
+            self.frame_count_table = get_frame_count_table(self.frame_table)
+        return self.frame_count_table
+
+    def get_frame_counts(self, reduction):
+        """Combine the occurrences of each unique frame in all pcaps.
+
+        Args:
+            reduction (str|int): 'sum', 'max' or 'min' of the occurrences
+                in every pcap (a frame missing from a pcap occurs 0 times),
+                or the index of a pcap for its occurrences.
+        Returns:
+            (np.ndarray): int64 occurrences per frame id.
+        """
+        first_frames, frame_ids, pcap_ids, counts, _ = \
+            self.get_frame_count_table()
+        frame_counts = np.zeros(len(first_frames), dtype=np.int64)
+        if isinstance(reduction, int):
+            in_pcap = pcap_ids == reduction
+            frame_counts[frame_ids[in_pcap]] = counts[in_pcap]
+            return frame_counts
+        if not len(counts):
+            return frame_counts
+        group_starts = np.flatnonzero(np.diff(frame_ids, prepend=-1))
+        reduce_counts = {
+            'sum': np.add, 'max': np.maximum, 'min': np.minimum
+        }[reduction].reduceat
+        frame_counts = reduce_counts(counts, group_starts)
+        if reduction == 'min':
+            pcap_counts = np.diff(np.append(group_starts, len(counts)))
+            pcap_count = len(self.frame_table.pcap_offsets) - 1
+            frame_counts[pcap_counts < pcap_count] = 0
+        return frame_counts
+
+    def get_multiset_frames(self, result_counts, pivot_index=0):
+        """Select the frames of a multiset result in the frame table.
+
+        Occurrences are taken from the pivot pcap. If the pivot has fewer
+        occurrences than required (union), the pcap with the most occurrences
+        of that frame is used and for a 'sum' union, the occurrences of all
+        pcaps are used. Each pcap's occurrences are taken in capture order.
+
+        Args:
+            result_counts (np.ndarray): Result count per frame id.
+            pivot_index (int): Index of pcap whose occurrences are preferred.
+        Returns:
+            (FrameSelection): Selected frames, with repeated frames.
+        """
+        first_frames, frame_ids, pcap_ids, counts, frame_order = \
+            self.get_frame_count_table()
+        # Where the occurrences of each count start in frame_order
+        count_starts = np.cumsum(counts) - counts
+        group_starts = np.flatnonzero(np.diff(frame_ids, prepend=-1))
+        pivot_counts = np.zeros(len(first_frames), dtype=np.int64)
+        pivot_starts = np.zeros(len(first_frames), dtype=np.int64)
+        in_pivot = pcap_ids == pivot_index
+        pivot_counts[frame_ids[in_pivot]] = counts[in_pivot]
+        pivot_starts[frame_ids[in_pivot]] = count_starts[in_pivot]
+        max_counts = self.get_frame_counts('max')
+        # The first pcap with the most occurrences of each frame
+        is_max = counts == max_counts[frame_ids]
+        _, first_max = np.unique(frame_ids[is_max], return_index=True)
+        max_starts = count_starts[np.flatnonzero(is_max)[first_max]]
+
+        frame_nums = np.flatnonzero(result_counts)
+        result_counts = result_counts[frame_nums].astype(np.int64)
+        starts = np.where(
+            pivot_counts[frame_nums] >= result_counts,
+            pivot_starts[frame_nums],
+            np.where(max_counts[frame_nums] >= result_counts,
+                     max_starts[frame_nums],
+                     count_starts[group_starts[frame_nums]]))
+        # Take result_counts frames from each start.
+        result_ends = np.cumsum(result_counts)
+        positions = np.arange(result_ends[-1] if len(result_ends) else 0) + \
+            np.repeat(starts - result_ends + result_counts, result_counts)
+        return FrameSelection(self.frame_table, frame_order[positions])
 
     def symmetric_difference_pcap(self):
         """For sets A = (1, 2, 3), B = (2, 3, 4), C = (3, 4, 5), A△B△C = (1, 5)
@@ -255,15 +536,35 @@ class PcapMath:
         Returns:
             (list(str)): Filenames of generated pcaps.
         """
-        generated_filelist = []
+        return self.save_results(self.get_symmetric_difference())
+
+    def get_symmetric_difference(self):
+        """Get the frames unique to each pcap.
+
+        Returns:
+            (list(SetResult)): Symmetric difference of each pcap.
+        """
+        symdiffs = []
         for index, file in enumerate(self.filenames):
-            diff_filename = self.difference_pcap(pivot_index=index)
-            if diff_filename:  # If diff file has packets.
-                symdiff_filename = 'symdiff_' + os.path.basename(file)
-                os.replace(diff_filename, symdiff_filename)
-                generated_filelist.append(symdiff_filename)
+            symdiff = self.difference_symdiff(index, file)
+            if symdiff is not None:
+                symdiffs.append(symdiff)
+
+        return symdiffs
 
-        return generated_filelist
+    def difference_symdiff(self, pivot_index, file):
+        """Get the difference of one pcap named like a symmetric difference.
+
+        Args:
+            pivot_index [int]: Specify minuend by index of filename in list
+            file (str): Filename of the minuend.
+        Returns:
+            (SetResult): Difference or None if it is empty and excluded.
+        """
+        difference = self.get_difference(pivot_index=pivot_index)
+        if difference is not None:
+            difference.name = 'symdiff_' + os.path.basename(file)
+        return difference
 
     def bounded_intersect_pcap(self):
         """Create a packet capture intersection out of two files using ip.ids.
@@ -274,92 +575,101 @@ class PcapMath:
         Returns:
             (list(string)): Filenames of generated pcaps.
         """
-        # Init vars
+        return self.save_results(self.get_bounded_intersections())
+
+    def get_bounded_intersections(self):
+        """Get the bounded intersection of each pcap.
+
+        Returns:
+            (list(SetResult)): Bounded intersection of each pcap.
+        """
         bounded_pcaps = self.get_bounded_pcaps()
-        names = []  # Names of all generated pcaps
-        for index, _ in enumerate(bounded_pcaps):
-            names.append('bounded_intersect-simul' + str(index + 1) + '.pcap')
-            save.save_pcap(
-                pcap_dict=bounded_pcaps[index],
-                name=names[index],
-                options=self.options)
-
-        return names
-
-    def inverse_bounded_intersect_pcap(self,
-                                       bounded_filelist=False,
-                                       intersect_file=False):
+        return [
+            SetResult('bounded_intersect-simul' + str(index + 1) + '.pcap',
+                      bounded_frames, self.options)
+            for index, bounded_frames in enumerate(bounded_pcaps)
+        ]
+
+    def inverse_bounded_intersect_pcap(self):
         """Inverse of bounded intersection = (bounded intersect) - (intersect)
 
-        Args:
-            bounded_filelist (list): List of existing bounded pcaps generated
-                by bounded_intersect_pcap()
-            intersect_file (string): Location of intersect file.
         Returns:
             (list(string)): Filenames of generated pcaps.
         """
-        generated_filelist = []
-        has_bounded_intersect_flag = False
-        if not bounded_filelist:
-            # Don't generate twice if flags -be are used
-            # Note that this runs after bounded_intersect if it would be run
-            bounded_filelist = self.bounded_intersect_pcap()
-            has_bounded_intersect_flag = True
-        backup_filenames = self.filenames
-        for index, bi_file in enumerate(bounded_filelist):
-            self.filenames = [bounded_filelist[index], intersect_file]
-            self.pcap_json_dict = strip_layers(self.filenames, self.options)
-            pcap_json_list = [*self.pcap_json_dict.values()]
-            self.frame_timestamp_dict = get_flat_frame_dict(pcap_json_list)
-            difference_file = self.difference_pcap()
-            if difference_file:
-                generated_filelist.append(difference_file)
-            if has_bounded_intersect_flag:
-                # Do not keep bounded-intersect files if they are not necessary
-                os.remove(bi_file)
-        # Intersect is only used for comparison, so delete it when done.
-        self.filenames = backup_filenames
-        return generated_filelist
+        return self.save_results(self.get_inverse_bounded_intersections())
+
+    def get_inverse_bounded_intersections(self):
+        """Get (bounded intersect) - (intersect) of each pcap.
+
+        Nothing is saved: the bounded intersections and the intersection are
+        compared in memory.
+
+        Returns:
+            (list(SetResult)): Inverse bounded intersection of each pcap.
+        """
+        intersect_nums = self.get_intersection_frames().frame_nums
+        inverse_bounded = []
+        for bounded in self.get_bounded_intersections():
+            # Both select the last frame of each fingerprint, so frame
+            # numbers of the same frame are equal.
+            bounded_nums = bounded.frames.frame_nums
+            diff_frames = FrameSelection(
+                self.frame_table,
+                bounded_nums[~np.isin(bounded_nums, intersect_nums)])
+            minuend_name = bounded.name
+            if not diff_frames:
+                print('WARNING! ' + minuend_name +
+                      ' difference contains no packets!')
+                if self.exclude_empty:
+                    continue
+            inverse_bounded.append(
+                SetResult('diff_' + minuend_name, diff_frames, self.options))
+
+        return inverse_bounded
 
     def get_bounded_pcaps(self):
-        """Get the pcap frame list for bounded_intersect_pcap
+        """Get the frames of each pcap for bounded_intersect_pcap
 
         Create a bounding box around each packet capture where the bounds are
-        the min and max packets in the intersection.
+        the min and max packets in the intersection. Bounds are found by
+        fingerprint in the frame table, so each pcap is scanned once.
 
         Returns:
-            bounded_pcaps (list): A list of frame_dicts
+            bounded_pcaps (list): FrameSelection of each pcap (computed once)
+        Raises:
+            IndexError: If a bound is not in a pcap.
         """
-        min_frame, max_frame = self.get_minmax_common_frames()
+        if self.bounded_pcaps:
+            return self.bounded_pcaps
+        self.get_minmax_common_frames()
+        fingerprints, last_frames, _ = self.get_membership_index()
+        order = np.argsort(fingerprints, kind='stable')
+        table_fingerprints = self.frame_table.fingerprints
+        min_fingerprint, max_fingerprint = \
+            table_fingerprints[list(self.intersection_bound_nums)]
+        pcap_offsets = self.frame_table.pcap_offsets.tolist()
 
         bounded_pcaps = []
-        # Each frame_list corresponds to one pcap.
-        for frame_list in self.frame_list_by_pcap:
-            min_frame_index = -1
-            max_frame_index = -1
-            for frame in frame_list:
-                if frame == min_frame:
-                    min_frame_index = frame_list.index(frame)
-                    break
-            if min_frame_index == -1:
+        for start, end in zip(pcap_offsets, pcap_offsets[1:]):
+            pcap_fingerprints = table_fingerprints[start:end]
+            # Each bound is the first frame in the pcap that matches it.
+            min_rows = np.flatnonzero(pcap_fingerprints == min_fingerprint)
+            if not len(min_rows):
                 print("ERROR: Bounding minimum packet not found!")
                 raise IndexError
-            for frame in reversed(frame_list):
-                if frame == max_frame:
-                    max_frame_index = frame_list.index(frame)
-                    break
-            if max_frame_index == -1:
+            max_rows = np.flatnonzero(pcap_fingerprints == max_fingerprint)
+            if not len(max_rows):
                 print("ERROR: Bounding maximum packet not found!")
                 raise IndexError
-
-            bounded_frame_list = \
-                frame_list[min_frame_index:max_frame_index + 1]
-            bounded_pcap_with_timestamps = {}
-            for frame in bounded_frame_list:
-                bounded_pcap_with_timestamps[frame] = \
-                    self.frame_timestamp_dict[frame]
-            bounded_pcaps.append(bounded_pcap_with_timestamps)
-
+            bounded_fingerprints = np.unique(
+                pcap_fingerprints[min_rows[0]:max_rows[0] + 1])
+            # Like get_flat_frame_dict, the last frame's timestamp is used.
+            rows = order[np.searchsorted(fingerprints, bounded_fingerprints,
+                                         sorter=order)]
+            bounded_pcaps.append(
+                FrameSelection(self.frame_table, last_frames[rows]))
+
+        self.bounded_pcaps = bounded_pcaps
         return bounded_pcaps
 
     def get_minmax_common_frames(self):
@@ -372,30 +682,49 @@ class PcapMath:
         Raises:
             assert: If intersection is empty.
         """
-        # Generate intersection set of frames
-        if not self.frame_list_by_pcap:
-            self.frame_list_by_pcap = \
-                get_frame_list_by_pcap(self.pcap_json_dict)
-        frame_list = self.frame_list_by_pcap
-        frame_intersection = set(frame_list[0]).intersection(*frame_list[1:])
-
-        # Set may reorder packets, so search for first/last.
-        unix_32bit_end_of_time = 4294967296
-        time_min = unix_32bit_end_of_time
-        time_max = 0
-        max_frame = ''
-        min_frame = ''
-        for frame in frame_intersection:
-            frame_time = float(self.frame_timestamp_dict[frame])
-            if frame_time > time_max:
-                time_max = frame_time
-                max_frame = frame
-            if frame_time < time_min:
-                time_min = frame_time
-                min_frame = frame
-
-        # If min/max frames are '', that likely means the intersection is empty
-        assert max_frame != ''
-        assert min_frame != ''
-
-        return min_frame, max_frame
+        if not self.intersection_bound_nums:
+            intersection = self.get_intersection_frames()
+            # If the intersection is empty, there are no min/max frames.
+            assert len(intersection)
+
+            timestamps = self.frame_table.timestamps[intersection.frame_nums]
+            self.intersection_bound_nums = (
+                int(intersection.frame_nums[timestamps.argmin()]),
+                int(intersection.frame_nums[timestamps.argmax()]))
+        min_num, max_num = self.intersection_bound_nums
+        return self.frame_table.get_frame(min_num), \
+            self.frame_table.get_frame(max_num)
+
+
+def get_most_common_frames(frame_table, first_frames, total_counts):
+    """Get the repeated frames that occur most often across all pcaps.
+
+    Only the most common frames are sorted, not all of them. Ties are in
+    order of first appearance, like collections.Counter.
+
+    Args:
+        frame_table (FrameTable): Frames of all pcaps.
+        first_frames (np.ndarray): Position of the first occurrence of each
+            unique frame in order first seen (see
+            manipulate_frames.get_frame_count_table).
+        total_counts (np.ndarray): Occurrences of each unique frame across
+            all pcaps.
+    Returns:
+        (dict): {<frame>: <count>, ...} of up to MOST_COMMON_FRAMES frames
+            that occur more than once.
+    """
+    candidates = np.flatnonzero(total_counts > 1)
+    if len(candidates) > MOST_COMMON_FRAMES:
+        threshold = np.partition(total_counts[candidates],
+                                 -MOST_COMMON_FRAMES)[-MOST_COMMON_FRAMES]
+        above = candidates[total_counts[candidates] > threshold]
+        # The first frames with the lowest count that makes the top.
+        tied = candidates[total_counts[candidates] == threshold]
+        candidates = np.sort(
+            np.concatenate([above,
+                            tied[:MOST_COMMON_FRAMES - len(above)]]))
+    most_common = candidates[np.argsort(-total_counts[candidates],
+                                        kind='stable')]
+    return {frame_table.get_frame(int(first_frames[common])):
+            int(total_counts[common])
+            for common in most_common}
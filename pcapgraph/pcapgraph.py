@@ -18,7 +18,16 @@
 USAGE:
   ::
 
-    pcapgraph [-abdeisuvwx23] (<file>)... [--output <format>]...
+    pcapgraph [-abdeimsuvwx23] (<file>)... [--output <format>]...
+              [--writer <writer>] [--sink <sink>] [--compress <codec>]
+              [--split-size <size>] [--split-interval <seconds>]
+              [--multiset-union <mode>] [--estimate] [--similarity]
+              [--overlap] [--sample <rate>]
+              [--top-talkers <k> [--top-by <key>]]
+              [--export <file> [--export-flows]]
+              [--stream [--max-skew <seconds>]]
+              [--max-memory <size>] [--engine <engine>] [--workers <n>]
+              [--state <dir>] [--cache <dir> [--cache-size <size>]]
     pcapgraph (-V | --version)
     pcapgraph (-h | --help)
 
@@ -47,22 +56,89 @@ OPTIONS:
                             (see Set Operations > union).
       -i, --intersection    All packets that are shared by all packet captures
                             (see Set Operations > intersection).
+      -m, --multiset        Count repeated packets instead of collapsing them
+                            (see Set Operations > multiset).
+      --multiset-union <mode>
+                            With -m, union takes the max or sum of counts.
+                            [default: max]
+      --estimate            Only print the estimated sizes of -disu results
+                            and SAME % with error bounds. Reads each pcap
+                            once into a few MB of sketches.
+      --similarity          Only list which pcaps saw the same traffic, most
+                            similar first, and draw a clustered heatmap.
+      --overlap             Only print the frames that each pair of pcaps
+                            has in common and draw them as a heatmap. Save
+                            them with -o txt, csv or an image format.
+      --top-talkers <k>     Only print the k frames, flows or hosts seen
+                            most often across all pcaps.
+      --top-by <key>        With --top-talkers, count frames as frame,
+                            flow (5-tuple), mac or ip (source address).
+                            [default: frame]
+      --export <file>       Only write every frame with the pcaps that saw
+                            it to <file> as Parquet, Arrow or CSV (see
+                            export).
+      --export-flows        With --export, add the 5-tuple of IP frames.
+
+    ENGINE OPTIONS:
+      --sample <rate>       Only compare the frames in a 1/N sample like
+                            1/64 that is the same in every pcap (see
+                            sampling). [default: 1]
+      --engine <engine>     How to do set operations: memory, spill, stream,
+                            or auto to choose by estimated memory use.
+                            [default: auto]
+      --stream              Shortcut for --engine stream. Do set operations
+                            (-disu) in one pass over time-ordered pcaps
+                            instead of loading them. Memory depends on the
+                            max skew, not pcap size.
+      --max-skew <seconds>  With --stream, max time between the same packet
+                            being seen by different pcaps. [default: 2]
+      --max-memory <size>   Memory budget like 512M or 4G (default: 80% of
+                            available memory). If the pcaps are estimated to
+                            need more, set operations (-disu) are done in
+                            hash partitions on disk.
+      --workers <n>         Processes that read pcaps with tshark and index
+                            frames for set operations, and threads that
+                            save their pcaps. 0 uses one per CPU.
+                            [default: 1]
+      --state <dir>         Keep the fingerprints and membership index of
+                            the pcaps in <dir>. Later runs (-disu) only read
+                            pcaps that were added or changed.
+      --cache <dir>         Reuse the results of a run with the same pcap
+                            contents, flags and pcapgraph version from <dir>.
+      --cache-size <size>   With --cache, the size that <dir> is kept under
+                            by removing the least recently used results.
+                            [default: 1G]
 
     OUTPUT OPTIONS:
       -a, --anonymize       Anonymize packet capture file names with fictional
                             place names and devices.
       -o, --output <format>
                             Output results as a file with format type.
-      -w                    Open pcaps in Wireshark after creation.
-                            (shortcut for --output pcap --output wireshark)
+      -w                    Feed pcaps to Wireshark without saving them.
+                            (shortcut for --sink wireshark)
+      --sink <sink>         Where pcaps of set operations go: a directory,
+                            - (stdout), a named pipe or wireshark (see
+                            sinks). [default: .]
+      --compress <codec>    Compress pcaps as they are written with gzip,
+                            zstd or lz4 (see compression).
+      --split-size <size>   Save pcaps in parts of up to <size> like 512M
+                            (see splitting).
+      --split-interval <seconds>
+                            Save pcaps in parts of <seconds> of traffic.
+      --writer <writer>     How to save pcaps: native writes frames with ns
+                            timestamps and their linktype, text2pcap uses
+                            text2pcap (us timestamps).
+                            [default: native]
       -x, --exclude-empty   eXclude empty pcaps generated by a set operation
                             from being saved. Exclude empty input pcaps from
                             being graphed.
-      -2, --strip-l2        Remove layer2 bits and encode raw IP packets.
-                            Use if pcaps track flows across layer 3 boundaries
-                            or L2 frame formats differ between pcaps (e.g. An
-                            AP will have Ethernet/Wi-Fi interfaces that encode
-                            802.3/802.11 frames).
+      -2, --strip-l2        Compare packets without their layer2 bits.
+                            Results keep the frames as the first pcap
+                            captured them (or another pcap if it lacks one).
+                            Use if pcaps track flows across layer 3
+                            boundaries or L2 frame formats differ between
+                            pcaps (e.g. An AP will have Ethernet/Wi-Fi
+                            interfaces that encode 802.3/802.11 frames).
       -3, --strip-l3        Remove IP header and encode dummy ethernet/IP
                             headers. Use if pcaps track flows across IPv4 NAT.
                             -3 implies -2. This flag is IPv4 only as IPv6
@@ -78,9 +154,13 @@ INPUT:
 
     One or more files or directories. When PcapGraph detects a
     directory, it will go one level deep to find packet captures.
-    This program can read all files that can be read by tshark.
+    This program can read all files that can be read by tshark, also
+    when they are compressed with gzip, zstd or lz4 (like a.pcap.zst).
 
     packet capture:
+        pcap and pcapng files are found by their first bytes (once
+        decompressed), whatever they are named (like trace.bin). Other
+        formats are found by their extension:
         `pcapng, pcap, cap, dmp, 5vw, TRC0, TRC1,
         enc, trc, fdc, syc, bfr, tr1, snoop`
 
@@ -93,19 +173,24 @@ OUTPUT:
 
       ``matplotlib.pyplot.gcf().canvas.get_supported_filetypes()``
 
-    `pcap`, `pcapng`, and `wireshark` require a set operation for there
-    to be a file to save/open. `generate-pcaps` creates the pcaps simul1
-    through 3 used in documentation.
+    `pcap`, `pcapng`, `-` and `wireshark` require a set operation for there
+    to be a file to save/open. `-` and `wireshark` are shortcuts of the
+    same --sink. `generate-pcaps` creates the pcaps simul1
+    through 3 used in documentation. A pcapng union has an interface per
+    input pcap and a comment on each packet naming the pcaps that saw it.
+    Results with frames of several linktypes (inputs with different
+    linktypes and no -2/-3) have an interface per linktype, so they need
+    `pcapng`.
 
     IMAGE:
         `eps, jpeg, jpg, pdf, pgf, png,
         ps, raw, rgba, svg, svgz, tif, tiff`
 
     TEXT:
-        `txt`
+        `txt, csv (--overlap only)`
 
     PACKET CAPTURE:
-        `pcap, pcapng, generate-pcaps, wireshark`
+        `pcap, pcapng, generate-pcaps, wireshark, -`
 
 EXAMPLE USE CASES:
   1. Gut check whether a group of pcaps were taken at the same time
@@ -155,13 +240,8 @@ EXAMPLE USE CASES:
       values. strip-l3 replaces all l3 fields that would change with generic
       values. Export this traffic as pcap to review in wireshark.
 
-      Note that traffic will look like the following in wireshark:
-
-      ::
-
-        <RAW IP>  10.0.0.1 ->  10.0.0.2  ICMP echo reply    DATA1
-        <RAW IP>  10.0.0.1 ->  10.0.0.2  UDP  16298 -> 53   DATA2
-        <RAW IP>  10.0.0.1 ->  10.0.0.2  TCP  28274 -> 80   DATA3
+      The frames are saved as file1.pcap captured them, with its MACs, VLAN
+      tags and IPs.
 
   4. Difference between traffic on a switchport and the uplink
       ::
@@ -209,7 +289,7 @@ SET OPERATIONS:
     1. Find all unique packets by their ASCII hexdump value.
     2. Strip L2 and L3 headers if those options are specified
     3. Apply the operation and generate a list of packets.
-    4. Reencode the packets in a pcap using text2pcap.
+    4. Encode the packets in a pcap (see --writer).
 
     difference:
         Remove all packets that are present in one pcap from another.
@@ -234,6 +314,115 @@ SET OPERATIONS:
         Finds which packets are unique to each packet capture in a given time
         frame and saves each as a packet capture.
 
+    engines:
+        By default, pcapgraph estimates the memory a set operation needs from
+        the size and first frames of each pcap and loads them if they fit
+        (memory). Otherwise, frames are hash partitioned on disk (spill).
+        Both produce the same result. Any engine other than memory is
+        reported on stderr, and -v reports memory too.
+        With --workers, the memory engine shards frames by fingerprint so
+        that each process indexes its own shard.
+
+    incremental:
+        With --state, the comparison is saved in a directory. Adding a pcap
+        to the next run only reads that pcap and merges it into the saved
+        index. Pcaps that are left out are removed from the comparison.
+
+    cache:
+        With --cache, results and the pcaps saved from them are kept in a
+        directory under a hash of the pcaps' contents, the flags, the engine
+        and the version. Repeating a run only hashes the pcaps. Damaged
+        results are detected by their hashes and computed again.
+
+    estimate:
+        With --estimate, each pcap is read once into a HyperLogLog sketch
+        and a Bloom filter instead of being loaded. The estimates are within
+        the printed error of the exact result ~95% of the time. Use it to
+        see whether an exact run is worthwhile.
+
+    similarity:
+        With --similarity, each pcap is reduced to a MinHash signature of
+        its frames and only pcaps whose signatures share a band (LSH) are
+        compared. This finds pcaps with more than ~40% of frames in common
+        among thousands of files. Similarities are estimated Jaccard
+        indexes (~5% error). Use --workers to sign pcaps in parallel and
+        save the list or heatmap with -o txt or an image format.
+
+    overlap:
+        With --overlap, every pair of pcaps is compared exactly: the unique
+        frames they have in common, their Jaccard index and the share of
+        each pcap's frames that the other saw. All pairs are counted in one
+        pass over the membership index, so 20+ capture points take about as
+        long as an intersection. The heatmap's rows show where each pcap's
+        traffic was also seen.
+
+    export:
+        With --export, the frame table is written in batches of columns:
+        capture, timestamp_ns, length, fingerprint and membership, a bitmask
+        with bit 1 << i set if the i-th pcap saw the frame. --export-flows
+        adds protocol, src_ip, src_port, dst_ip and dst_port. A .parquet or
+        .arrow file needs the pyarrow package, other names are CSV. Like
+        --overlap, this uses the memory engine or --state.
+
+    top talkers:
+        With --top-talkers, frames are streamed from every pcap into a
+        Space-Saving summary of 10 counters per talker asked for (at least
+        1000), so memory stays the same during a broadcast storm. Counts
+        are at most the printed error too high. Unlike the 10 most common
+        frames of -u, this needs no set operation and no tshark.
+
+    sampling:
+        With --sample 1/N, a frame is kept if a hash of its (stripped)
+        bytes is in the lowest 1/N of hashes. The same frames are kept in
+        every pcap, so set operations and --overlap on a 1/64 sample are
+        ~64x faster and their percentages estimate those of all frames.
+        Percentages are printed with a 95% confidence interval.
+
+    sinks:
+        Pcaps are saved in the CWD or the --sink directory. With -o - or a
+        named pipe as --sink, they are written to it instead, so that
+        pcapgraph -u a.pcap b.pcap -o - | tshark -r - works without a file.
+        Everything else is then printed to stderr. A pipe holds one pcap,
+        so several results need -o pcapng (one section each). With -w
+        (--sink wireshark), each result is fed to wireshark -k -i -.
+
+    compression:
+        Compressed pcaps are recognized by their first bytes and
+        decompressed while they are read, so they are never written to
+        disk uncompressed. tshark reads them from a pipe. With --compress,
+        saved pcaps get an extension like union.pcap.zst and are
+        compressed while they are written. zstd uses a thread per CPU and
+        needs the zstandard package, lz4 the lz4 package.
+
+    splitting:
+        With --split-size and/or --split-interval, saved pcaps are split
+        while they are written, like editcap -c/-i without a second pass:
+        union.pcap becomes union_00001.pcap, union_00002.pcap, ... with
+        their own headers. union_index.json lists the file, first and last
+        timestamp and frame count of each part. Intervals start at the
+        first frame and parts of silent intervals are skipped. Splitting
+        uses the native writer and applies to saved pcaps, not to pipes.
+
+    archives:
+        A tar or zip archive (like a support bundle.tar.gz) stands for the
+        pcaps and pcapngs in it, found by their first bytes and read
+        without extracting them. A member is named like a file in a
+        directory, bundle.tar.gz/logs/eth0.pcap. Archives in a directory
+        that is given are expanded the same way. With --workers, members of
+        zips and uncompressed tars are read in parallel. Compressed tars
+        are decompressed front to back, one member at a time.
+
+    streaming:
+        With --stream, pcaps are merged by timestamp and a packet is only
+        compared against packets seen within --max-skew seconds. Use this
+        for pcaps too large to load that were taken at the same time.
+
+    multiset:
+        With -m, identical packets (retransmissions, keepalives, ARP and
+        broadcast storms) are counted rather than merged into one. If A has
+        a packet 3 times and B has it once, the intersection has it once,
+        A - B has it twice and the union has it 3 (max) or 4 (sum) times.
+
 SEE ALSO:
     pcapgraph (https://pcapgraph.readthedocs.io):
         Comprehensive documentation for this program.
@@ -254,25 +443,48 @@ SEE ALSO:
     matplotlib (https://matplotlib.org/):
         Python package to plot 2D graphs.
 """
+import contextlib
 import re
+import sys
 
 import docopt
 
-import pcapgraph.manipulate_frames as mf
 import pcapgraph.get_filenames as gf
 import pcapgraph.draw_graph as dg
+import pcapgraph.estimate as est
+import pcapgraph.frame_export as fe
+import pcapgraph.incremental_math as im
+import pcapgraph.output_sink as output_sink
+import pcapgraph.overlap as ov
 import pcapgraph.pcap_math as pm
+import pcapgraph.stream_math as sm
+import pcapgraph.spill_math as spm
+import pcapgraph.planner as planner
+import pcapgraph.read_file as rf
+import pcapgraph.result_cache as rc
+import pcapgraph.sampling as sampling
+import pcapgraph.save_file as save
+import pcapgraph.similarity as sim
+import pcapgraph.top_talkers as tt
 from . import get_tshark_status
 
+ENGINES = {
+    'memory': pm.PcapMath,
+    'spill': spm.SpillPcapMath,
+    'stream': sm.StreamPcapMath,
+    'incremental': im.IncrementalPcapMath
+}
+
 
 def run():
     """Main function that contains the major moving parts:
 
     1. Verify tshark
     2. Get filenames from CLI args
-    3. Get a per-pcap frame list to be graphed/exported
-           frame dict form: {<file/operation>: {frame: timestamp, ...}, ...}
-    4. Draw the graph/export files
+    3. Do set operations (or load them from the cache). Results are only
+       written as pcaps if an output or --sink needs them.
+           frame dict form: {<file/operation>: {} or <SetResult>, ...}
+    4. Send the pcaps to their sink and draw the graph/export files
     """
     get_tshark_status()
     cli_docs = re.sub(r' *:: *\n\n|`|\*', '', __doc__)  # Remove RST signals.
@@ -281,15 +493,162 @@ def run():
     options = {
         'strip-l2': args['--strip-l2'],
         'strip-l3': args['--strip-l3'],
-        'pcapng': 'pcapng' in args['--output']
+        'pcapng': 'pcapng' in args['--output'],
+        'multiset': args['--multiset'] and args['--multiset-union'],
+        'max-skew': float(args['--max-skew']),
+        'max-memory': args['--max-memory'] and
+        spm.parse_size(args['--max-memory']),
+        'workers': int(args['--workers']),
+        'state': args['--state'],
+        'sample': sampling.parse_sample_rate(args['--sample']),
+        'writer': args['--writer'],
+        'compress': args['--compress'] or '',
+        'linktype': rf.get_linktype(filenames[0]) if filenames else 1,
     }
-    pcap_math = pm.PcapMath(filenames, options)
-    all_filenames = pcap_math.parse_set_args(args)
-    pcaps_frame_dict = mf.get_pcap_frame_dict(all_filenames)
-    if args['-w']:
-        args['--output'].extend(['wireshark', 'pcap'])
-    dg.draw_graph(pcaps_frame_dict, filenames, args['--output'],
-                  args['--exclude-empty'], args['--anonymize'])
+    options.update(get_split_options(args))
+    if options['writer'] not in save.WRITERS:
+        raise SyntaxError("\nERROR: --writer must be one of " +
+                          ', '.join(save.WRITERS) + '.')
+    sink = get_output_sink(args)
+    # The pcaps have stdout to themselves, so everything else is printed
+    # to stderr.
+    with contextlib.redirect_stdout(
+            sys.stderr if sink and sink.target == '-' else sys.stdout):
+        if output_comparison(filenames, args, options):
+            return
+        set_results, cache_key, cache = get_set_results(
+            filenames, args, options)
+        if sink:
+            sink.write_results(set_results)
+            if cache:
+                cache.store(cache_key, set_results)
+        # A pipe or Wireshark is the only output unless others are asked for.
+        if sink and not sink.keeps_files and not args['--output']:
+            return
+        pcaps_frame_dict = dict.fromkeys(filenames, {})
+        for set_result in set_results:
+            pcaps_frame_dict[set_result.name] = set_result
+        dg.draw_graph(pcaps_frame_dict, filenames, args['--output'],
+                      args['--exclude-empty'], args['--anonymize'])
+
+
+def get_set_results(filenames, args, options):
+    """Do set operations with the chosen engine or load them from the cache.
+
+    Args:
+        filenames (list): List of filenames.
+        args (dict): Dict of all arguments (including set args).
+        options (dict): Options of the engine (see run).
+    Returns:
+        (tuple): SetResults (list), cache key (str) and ResultCache or
+            ('', None) without --cache.
+    """
+    engine, reason = planner.choose_engine(filenames, args, options)
+    if engine is None:
+        return [], '', None
+    # stream and spill change how results are made, so they are always told.
+    if args['--verbose'] or engine != 'memory':
+        print("INFO: Using the", engine, "engine:", reason, file=sys.stderr)
+    if not args['--cache']:
+        pcap_math = ENGINES[engine](filenames, options)
+        return pcap_math.get_set_results(args), '', None
+    cache = rc.ResultCache(args['--cache'],
+                           spm.parse_size(args['--cache-size']))
+    cache_key = rc.get_cache_key(filenames, args, options, engine)
+    set_results = cache.get_set_results(cache_key, ENGINES[engine],
+                                        filenames, args, options)
+    return set_results, cache_key, cache
+
+
+def get_split_options(args):
+    """Get how saved pcaps are split from --split-size and --split-interval.
+
+    Args:
+        args (dict): Dict of all arguments (including set args).
+    Returns:
+        (dict): 'split-size' in bytes and 'split-interval' in ns, 0 for no
+            limit.
+    Raises:
+        SyntaxError: If a limit isn't above 0 or --writer is text2pcap.
+    """
+    split_options = {'split-size': 0, 'split-interval': 0}
+    if args['--split-size']:
+        split_options['split-size'] = spm.parse_size(args['--split-size'])
+    if args['--split-interval']:
+        try:
+            split_options['split-interval'] = int(
+                float(args['--split-interval']) * 10**9)
+        except ValueError:
+            split_options['split-interval'] = -1
+    if args['--split-size'] and split_options['split-size'] <= 0 or \
+            args['--split-interval'] and \
+            split_options['split-interval'] <= 0:
+        raise SyntaxError("\nERROR: --split-size and --split-interval "
+                          "must be above 0.")
+    if any(split_options.values()) and args['--writer'] == 'text2pcap':
+        raise SyntaxError("\nERROR: Splitting pcaps needs --writer native.")
+    return split_options
+
+
+def get_output_sink(args):
+    """Get where the pcaps of set operations go from --sink, -o and -w.
+
+    `-o -` and `-o wireshark` (-w) are shortcuts for --sink - and --sink
+    wireshark and are taken out of --output. A directory sink other than
+    the CWD implies --output pcap.
+
+    Args:
+        args (dict): Dict of all arguments (including set args).
+    Returns:
+        (OutputSink): Sink of the pcaps or None if no pcaps are output.
+    """
+    output_fmts = args['--output']
+    target = args['--sink']
+    if args['-w'] or 'wireshark' in output_fmts:
+        target = 'wireshark'
+    if '-' in output_fmts:
+        target = '-'
+    args['--output'] = [fmt for fmt in output_fmts
+                        if fmt not in ['-', 'wireshark']]
+    sink = output_sink.get_sink(target, int(args['--workers']))
+    pcap_fmts = {'pcap', 'pcapng'} & set(args['--output'])
+    if sink.keeps_files and target != '.' and not pcap_fmts:
+        args['--output'].append('pcap')
+    elif sink.keeps_files and not pcap_fmts:
+        return None
+    return sink
+
+
+def output_comparison(filenames, args, options):
+    """Print and draw a comparison of the pcaps instead of set operations.
+
+    Args:
+        filenames (list): List of filenames.
+        args (dict): Dict of all arguments (including set args).
+        options (dict): Options of the engine (see run).
+    Returns:
+        (bool): Whether --estimate, --similarity, --top-talkers,
+            --overlap or --export was used.
+    """
+    if args['--estimate']:
+        est.print_estimates(filenames, options)
+    elif args['--similarity']:
+        sim.output_similarity(filenames, options, args['--output'])
+    elif args['--top-talkers']:
+        tt.print_top_talkers(filenames, options, int(args['--top-talkers']),
+                             args['--top-by'])
+    elif args['--overlap']:
+        engine, _ = planner.choose_engine(filenames, args, options)
+        pcap_math = ENGINES[engine](filenames, options)
+        ov.output_overlap(filenames, pcap_math.get_overlap_counts(),
+                          options, args['--output'])
+    elif args['--export']:
+        engine, _ = planner.choose_engine(filenames, args, options)
+        fe.export_frames(ENGINES[engine](filenames, options),
+                         args['--export'], args['--export-flows'])
+    else:
+        return False
+    return True
 
 
 if __name__ == '__main__':
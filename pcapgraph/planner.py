@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Choose how to do set operations before any pcap is decoded.
+
+Engines, from fastest to most frugal:
+
+* memory: PcapMath. Loads every pcap with tshark. Supports all operations.
+* spill: SpillPcapMath. Hash partitions frames on disk. Exact -disu.
+* stream: StreamPcapMath. One pass with a --max-skew window. Only matches
+  frames seen within the window, so it is never chosen automatically.
+* incremental: IncrementalPcapMath. Exact -disu from a comparison saved
+  with --state. Only pcaps that are new to it are read.
+
+Frame counts are estimated from the file size and the average frame size of
+the first frames, which only needs the pcap/pcapng record headers.
+"""
+import itertools
+import os
+import sys
+
+from pcapgraph.compressed_file import get_uncompressed_size
+from pcapgraph.compressed_file import open_capture
+from pcapgraph.read_file import iter_frames
+from pcapgraph.read_file import get_capture_format
+
+ENGINES = ['memory', 'spill', 'stream']
+# Bytes of PcapMath memory per frame. tshark's JSON has every dissected
+# field of every frame, so this dwarfs the frame itself.
+JSON_BYTES_PER_FRAME = 20000
+# Bytes of PcapMath memory per byte of frame (hex strings in several dicts).
+MEMORY_BYTES_PER_FRAME_BYTE = 8
+# Per frame overhead of a record header (pcapng: enhanced packet block).
+RECORD_HEADER_BYTES = {'pcap': 16, 'pcapng': 34, '': 16}
+# Average frame size for formats that cannot be sampled without tshark.
+DEFAULT_FRAME_BYTES = 500
+SAMPLE_FRAMES = 100
+# Leave room for the rest of the system.
+AVAILABLE_MEMORY_FRACTION = 0.8
+
+
+def estimate_frame_count(filename):
+    """Estimate the number of frames in a pcap without reading all of it.
+
+    Args:
+        filename (str): Name of packet capture.
+    Returns:
+        (tuple): (<estimated frame count>, <average frame bytes>)
+    """
+    file_size = get_uncompressed_size(filename)
+    if not file_size:
+        return 0, 0
+    with open_capture(filename) as capture:
+        capture_format = get_capture_format(capture.peek(4)[:4])
+    avg_frame_bytes = DEFAULT_FRAME_BYTES
+    if capture_format:
+        sample = [
+            len(frame) for _, frame, _ in itertools.islice(
+                iter_frames(filename), SAMPLE_FRAMES)
+        ]
+        if not sample:
+            return 0, 0
+        avg_frame_bytes = sum(sample) / len(sample)
+        if len(sample) < SAMPLE_FRAMES:
+            return len(sample), avg_frame_bytes
+    frame_count = file_size // \
+        (avg_frame_bytes + RECORD_HEADER_BYTES[capture_format])
+    return int(frame_count), avg_frame_bytes
+
+
+def estimate_memory(filenames):
+    """Estimate how much memory PcapMath needs for these files.
+
+    Args:
+        filenames (list): List of filenames.
+    Returns:
+        (int): Estimated bytes of memory.
+    """
+    memory = 0
+    for filename in filenames:
+        frame_count, avg_frame_bytes = estimate_frame_count(filename)
+        memory += frame_count * (
+            JSON_BYTES_PER_FRAME +
+            MEMORY_BYTES_PER_FRAME_BYTE * avg_frame_bytes)
+    return int(memory)
+
+
+def get_available_memory():
+    """Get the memory that is available to pcapgraph.
+
+    Returns:
+        (int): Available bytes or 0 if this cannot be determined.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def get_memory_budget(options):
+    """Get the memory budget for set operations.
+
+    Args:
+        options (dict): 'max-memory' budget in bytes (0/None for available
+            memory).
+    Returns:
+        (int): Budget in bytes or 0 if there is no known budget.
+    """
+    return options.get('max-memory') or \
+        int(get_available_memory() * AVAILABLE_MEMORY_FRACTION)
+
+
+def choose_engine(filenames, args, options):
+    """Choose the fastest engine whose working set fits in memory.
+
+    Args:
+        filenames (list): List of filenames.
+        args (dict): Dict of all arguments (including set args).
+        options (dict): 'max-memory' budget in bytes (0/None for available
+            memory) and whether to use multiset semantics.
+    Returns:
+        (tuple): (<engine in ENGINES or 'incremental'>, <reason>) or
+            (None, <reason>) if there are no set operations to do.
+    Raises:
+        SyntaxError: If an engine does not support a requested operation.
+    """
+    engine = args['--engine']
+    if args['--stream']:
+        engine = 'stream'
+    if engine not in ENGINES + ['auto']:
+        raise SyntaxError("\nERROR: --engine must be one of auto, " +
+                          ', '.join(ENGINES) + '.')
+    needs_memory_engine = args['--bounded-intersection'] or \
+        args['--inverse-bounded'] or options.get('multiset')
+    if args['--state']:
+        if needs_memory_engine:
+            raise SyntaxError("\nERROR: -b, -e and -m cannot be used with "
+                              "--state.")
+        return 'incremental', 'requested with --state'
+    # The overlap of pairs of pcaps and exports need a membership index.
+    needs_memory_engine = needs_memory_engine or args['--overlap'] or \
+        args['--export']
+    if engine != 'auto':
+        if engine != 'memory' and needs_memory_engine:
+            raise SyntaxError("\nERROR: -b, -e, -m, --overlap and --export "
+                              "need --engine memory.")
+        return engine, 'requested with --engine'
+
+    has_set_operation = args['--symmetric-difference'] or \
+        args['--union'] or args['--difference'] or args['--intersection']
+    if not has_set_operation and not needs_memory_engine:
+        return None, 'no set operations, so pcaps are not loaded'
+
+    budget = get_memory_budget(options)
+    estimate = estimate_memory(filenames)
+    estimate_text = '~{} MiB needed, {} MiB budget'.format(
+        estimate // 2**20, budget // 2**20)
+    if needs_memory_engine:
+        return 'memory', estimate_text + \
+            ' (-b, -e, -m, --overlap and --export need it)'
+    if not budget or estimate <= budget:
+        return 'memory', estimate_text
+    return 'spill', estimate_text
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Read files one frame at a time.
+
+`tshark -T json` has to finish before its output can be parsed, so the whole
+capture ends up in memory. pcap and pcapng are simple enough to read
+directly, which lets frames be streamed in capture order. Other formats that
+tshark understands are converted to pcapng on a pipe with
+`tshark -r <file> -F pcapng -w -` and then streamed the same way.
+Compressed files are decompressed while they are read (see
+compressed_file).
+
+Frames are yielded as (timestamp, frame, linktype) where timestamp is in
+integer nanoseconds since the epoch and frame is the raw bytes of the frame.
+iter_frame_sources also yields where each frame's bytes are in the
+(decompressed) capture, so that FrameReader can read them again later.
+"""
+
+import contextlib
+import shutil
+import struct
+import subprocess as sp
+import tempfile
+
+from pcapgraph.compressed_file import can_seek
+from pcapgraph.compressed_file import open_capture
+from pcapgraph.compressed_file import popen_tshark
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_SHB_TYPE = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_IDB_TYPE = 0x00000001
+PCAPNG_PB_TYPE = 0x00000002
+PCAPNG_SPB_TYPE = 0x00000003
+PCAPNG_EPB_TYPE = 0x00000006
+# if_tsresol option code of an Interface Description Block
+PCAPNG_TSRESOL_OPTION = 9
+# Bytes skipped at once to reach a frame in a capture that can't seek.
+SKIP_CHUNK_BYTES = 2**20
+
+
+def get_capture_format(magic):
+    """Identify a capture format by its first 4 bytes.
+
+    Args:
+        magic (bytes): First 4 bytes of a file.
+    Returns:
+        (str): 'pcap', 'pcapng', or '' if neither.
+    """
+    if len(magic) < 4:
+        return ''
+    if struct.unpack('<I', magic)[0] == PCAPNG_SHB_TYPE:
+        return 'pcapng'
+    for endian in '<>':
+        if struct.unpack(endian + 'I', magic)[0] in (PCAP_MAGIC_USEC,
+                                                     PCAP_MAGIC_NSEC):
+            return 'pcap'
+    return ''
+
+
+def iter_frames(filename):
+    """Yield every frame in a packet capture in file order.
+
+    Args:
+        filename (str): Name of a file that tshark can read, which may be
+            compressed.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>, <linktype>)
+    """
+    for timestamp, frame, linktype, _ in iter_frame_sources(filename):
+        yield timestamp, frame, linktype
+
+
+def iter_frame_sources(filename):
+    """Yield every frame in a packet capture with where it is in the file.
+
+    Args:
+        filename (str): Name of a file that tshark can read, which may be
+            compressed.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>, <linktype>, <offset>)
+            where offset is the position of the frame's bytes in the
+            decompressed capture, or -1 for formats that tshark converts.
+    """
+    with open_capture(filename) as capture:
+        magic = capture.peek(4)[:4]
+        if not magic:
+            return  # Empty file
+        capture_format = get_capture_format(magic)
+        if capture_format == 'pcap':
+            yield from iter_pcap_frames(capture)
+            return
+        if capture_format == 'pcapng':
+            yield from iter_pcapng_frames(capture)
+            return
+
+    # Let tshark convert formats like snoop or 5vw to pcapng on a pipe.
+    convert_sp = popen_tshark(filename, ['-F', 'pcapng', '-w', '-'],
+                              stdout=sp.PIPE, stderr=sp.PIPE)
+    try:
+        if get_capture_format(convert_sp.stdout.peek(4)[:4]) == 'pcapng':
+            for timestamp, frame, linktype, _ in \
+                    iter_pcapng_frames(convert_sp.stdout):
+                yield timestamp, frame, linktype, -1
+    finally:
+        convert_sp.kill()
+        convert_sp.communicate()
+
+
+def iter_pcap_frames(capture):
+    """Yield the frames of a libpcap file object.
+
+    Args:
+        capture (file): Binary file object positioned at the global header.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>, <linktype>, <offset>)
+    """
+    header = capture.read(24)
+    if len(header) < 24:
+        return
+    endian = '<'
+    magic = struct.unpack('<I', header[:4])[0]
+    if magic not in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        endian = '>'
+        magic = struct.unpack('>I', header[:4])[0]
+    frac_multiplier = 1 if magic == PCAP_MAGIC_NSEC else 1000
+    linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0xffff
+    record_struct = struct.Struct(endian + 'IIII')
+    position = 24
+
+    while True:
+        record_header = capture.read(16)
+        if len(record_header) < 16:
+            return
+        ts_sec, ts_frac, incl_len, _ = record_struct.unpack(record_header)
+        frame = capture.read(incl_len)
+        if len(frame) < incl_len:
+            return  # Truncated capture
+        yield ts_sec * 10**9 + ts_frac * frac_multiplier, frame, linktype, \
+            position + 16
+        position += 16 + incl_len
+
+
+def iter_pcapng_frames(capture):
+    """Yield the frames of a pcapng file object.
+
+    Only blocks that carry frames (enhanced, simple and obsolete packet
+    blocks) are yielded. Interface descriptions are tracked for the linktype
+    and timestamp resolution of each frame.
+
+    Args:
+        capture (file): Binary file object positioned at the first block.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>, <linktype>, <offset>)
+    """
+    endian = '<'
+    interfaces = []  # [(linktype, snaplen, ticks to ns function), ...]
+    position = 0
+    while True:
+        block_header = capture.read(8)
+        if len(block_header) < 8:
+            return
+        block_start = position + 8
+        block_type = struct.unpack(endian + 'I', block_header[:4])[0]
+        if block_type == PCAPNG_SHB_TYPE:
+            # Byte order is set per section by the byte-order magic.
+            byte_order_magic = capture.read(4)
+            endian = '<' if struct.unpack('<I', byte_order_magic)[0] == \
+                PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_len = struct.unpack(endian + 'I', block_header[4:])[0]
+            capture.read(block_len - 12)
+            interfaces = []
+            position += block_len
+            continue
+        block_len = struct.unpack(endian + 'I', block_header[4:])[0]
+        position += block_len
+        body = capture.read(block_len - 8)
+        if len(body) < block_len - 8:
+            return  # Truncated capture
+        if block_type == PCAPNG_IDB_TYPE:
+            interfaces.append(get_pcapng_interface(body, endian))
+        elif block_type == PCAPNG_EPB_TYPE:
+            if_id, ts_high, ts_low, cap_len = \
+                struct.unpack(endian + 'IIII', body[:16])
+            linktype, _, to_ns = interfaces[if_id]
+            yield to_ns((ts_high << 32) | ts_low), body[20:20 + cap_len], \
+                linktype, block_start + 20
+        elif block_type == PCAPNG_SPB_TYPE:
+            linktype, snaplen, _ = interfaces[0]
+            orig_len = struct.unpack(endian + 'I', body[:4])[0]
+            cap_len = min(orig_len, snaplen) if snaplen else orig_len
+            # Simple packet blocks have no timestamp.
+            yield 0, body[4:4 + cap_len], linktype, block_start + 4
+        elif block_type == PCAPNG_PB_TYPE:
+            if_id, _, ts_high, ts_low, cap_len = \
+                struct.unpack(endian + 'HHIII', body[:16])
+            linktype, _, to_ns = interfaces[if_id]
+            yield to_ns((ts_high << 32) | ts_low), body[20:20 + cap_len], \
+                linktype, block_start + 20
+
+
+def get_pcapng_interface(idb_body, endian):
+    """Parse an Interface Description Block body.
+
+    Args:
+        idb_body (bytes): Block body without the type and length fields.
+        endian (str): struct byte order character.
+    Returns:
+        (tuple): (linktype, snaplen, function converting ticks to ns)
+    """
+    linktype, _, snaplen = struct.unpack(endian + 'HHI', idb_body[:8])
+    tsresol = 6  # Default resolution is microseconds.
+    offset = 8
+    # Options are (code, length, value padded to 32 bits) until opt_endofopt
+    while offset + 4 <= len(idb_body) - 4:
+        code, length = struct.unpack(endian + 'HH',
+                                     idb_body[offset:offset + 4])
+        if code == 0:
+            break
+        if code == PCAPNG_TSRESOL_OPTION and length == 1:
+            tsresol = idb_body[offset + 4]
+        offset += 4 + length + (-length % 4)
+
+    if tsresol & 0x80:  # Negative power of 2
+        power = tsresol & 0x7f
+        return linktype, snaplen, lambda ticks: (ticks * 10**9) >> power
+    if tsresol <= 9:
+        multiplier = 10**(9 - tsresol)
+        return linktype, snaplen, lambda ticks: ticks * multiplier
+    divisor = 10**(tsresol - 9)
+    return linktype, snaplen, lambda ticks: ticks // divisor
+
+
+def get_linktype(filename):
+    """Get the linktype of the first interface of a packet capture.
+
+    Args:
+        filename (str): Name of packet capture.
+    Returns:
+        (int): Linktype (1 = Ethernet, 101 = raw IP, ...). 1 if unknown.
+    """
+    for _, _, linktype in iter_frames(filename):
+        return linktype
+    return 1
+
+
+class FrameReader:
+    """Read frames of packet captures again by their offsets.
+
+    Offsets are the ones of iter_frame_sources. Captures stay open until the
+    reader is closed. Captures that can't seek cheaply (compressed captures
+    and members of compressed archives) are read forward. The first read
+    further back decompresses such a capture to a temporary file once, which
+    is read from then on, so frames are best read in file order.
+    """
+
+    def __init__(self, filenames):
+        """Prepare to read frames of captures.
+
+        Args:
+            filenames (list): Names of the packet captures.
+        """
+        self.filenames = filenames
+        # {<pcap index>: (ExitStack, file, position)} where position is None
+        # for files that can seek.
+        self.captures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close all captures."""
+        for exit_stack, _, _ in self.captures.values():
+            exit_stack.close()
+        self.captures = {}
+
+    def read(self, pcap_index, offset, length):
+        """Read the bytes of a frame.
+
+        Args:
+            pcap_index (int): Index of the capture in filenames.
+            offset (int): Offset of the frame in the decompressed capture.
+            length (int): Bytes of the frame.
+        Returns:
+            (bytes): Frame, fewer bytes if the capture is shorter.
+        """
+        filename = self.filenames[pcap_index]
+        exit_stack, capture, position = self.captures.get(
+            pcap_index, (None, None, None))
+        if capture is None:
+            exit_stack = contextlib.ExitStack()
+            capture = exit_stack.enter_context(open_capture(filename))
+            position = None if can_seek(filename) else 0
+        elif position is not None and offset < position:
+            exit_stack.close()
+            exit_stack = contextlib.ExitStack()
+            capture = exit_stack.enter_context(
+                tempfile.TemporaryFile(prefix='pcapgraph-'))
+            with open_capture(filename) as source:
+                shutil.copyfileobj(source, capture, SKIP_CHUNK_BYTES)
+            position = None
+        if position is None:
+            capture.seek(offset)
+        else:
+            while position < offset:
+                skipped = len(capture.read(
+                    min(offset - position, SKIP_CHUNK_BYTES)))
+                if not skipped:
+                    break
+                position += skipped
+        frame = capture.read(length)
+        if position is not None:
+            position = offset + len(frame)
+        self.captures[pcap_index] = (exit_stack, capture, position)
+        return frame
+
+
+def format_timestamp(timestamp):
+    """Format integer nanoseconds like tshark's frame.time_epoch.
+
+    Args:
+        timestamp (int): Nanoseconds since the epoch.
+    Returns:
+        (str): Timestamp like '1537945792.667334000'
+    """
+    return '{}.{:09d}'.format(*divmod(timestamp, 10**9))
+
+
+def parse_timestamp(timestamp):
+    """Parse a timestamp like tshark's frame.time_epoch to integer ns.
+
+    Args:
+        timestamp (str): Timestamp like '1537945792.667334000'
+    Returns:
+        (int): Nanoseconds since the epoch.
+    """
+    seconds, _, fraction = str(timestamp).partition('.')
+    return int(seconds) * 10**9 + int((fraction + '0' * 9)[:9])
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reuse the results of identical runs from a content-addressed cache.
+
+A run is identified by a hash of the contents of its pcaps, the flags and
+options that change results and the pcapgraph version. With --cache <dir>,
+each run's SetResults are kept in <dir>/<key>/:
+
+* entry.json: result names, what the run printed and a hash of every file
+* <n>.npz: records of result n as they are saved (payload, offsets and
+  timestamps, like a FrameTable, with their linktype, pcapng interfaces
+  and comments)
+* <n>.pcap: result n as saved by save_pcap, if an output needed it
+
+A later run with the same key loads the results instead of reading the
+pcaps. Cached results save the same pcaps as the results they were stored
+from, including frames saved as they were captured (-2/-3) and the
+annotations of a pcapng union. Files whose hash no longer matches
+invalidate the whole entry. The least recently used entries are removed
+when <dir> grows beyond --cache-size.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pcapgraph import __version__
+from pcapgraph.compressed_file import open_raw
+from pcapgraph.frame_table import FrameSelection
+from pcapgraph.frame_table import FrameTable
+from pcapgraph.set_result import SetResult
+import pcapgraph.save_file as save
+
+CACHE_VERSION = 2
+ENTRY_NAME = 'entry.json'
+# Flags and options that change which results are made and their frames.
+CACHE_FLAGS = [
+    '--bounded-intersection', '--difference', '--exclude-empty',
+    '--intersection', '--inverse-bounded', '--symmetric-difference',
+    '--union'
+]
+CACHE_OPTIONS = [
+    'strip-l2', 'strip-l3', 'pcapng', 'multiset', 'sample', 'writer',
+    'compress'
+]
+HASH_CHUNK_BYTES = 2**20
+
+
+def get_file_hash(filename):
+    """Get the content hash of a file.
+
+    Args:
+        filename (str): Name of file or of an archive member.
+    Returns:
+        (str): Hex digest of the file's contents.
+    """
+    file_hash = hashlib.blake2b()
+    with open_raw(filename) as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_cache_key(filenames, args, options, engine):
+    """Get the key of a run from the contents of its pcaps.
+
+    Results are named after the pcaps, so their basenames are part of the
+    key too. Engines differ in which frames match (stream within
+    --max-skew), which timestamp a frame keeps and what they can save as
+    captured, so the engine is part of the key.
+
+    Args:
+        filenames (list): List of filenames.
+        args (dict): Dict of all arguments (including set args).
+        options (dict): Options of the engine (see pcapgraph.run).
+        engine (str): Engine that would do the set operations.
+    Returns:
+        (str): Hex digest that identifies the results.
+    """
+    key_options = {name: options.get(name) for name in CACHE_OPTIONS}
+    if engine == 'stream':
+        key_options['max-skew'] = options['max-skew']
+    key_parts = {
+        'version': [__version__, CACHE_VERSION],
+        'engine': engine,
+        'flags': [flag for flag in CACHE_FLAGS if args[flag]],
+        'options': key_options,
+        'pcaps': [[os.path.basename(filename),
+                   get_file_hash(filename)] for filename in filenames],
+    }
+    return hashlib.sha256(
+        json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+
+
+def get_saved_name(set_result):
+    """Get the name of the file that SetResult.save writes.
+
+    Args:
+        set_result (SetResult): A set operation result.
+    Returns:
+        (str): Path of the file (see save_file.get_saved_name).
+    """
+    return save.get_saved_name(
+        os.path.join(set_result.directory, set_result.name),
+        set_result.options)
+
+
+class CachedSetResult(SetResult):
+    """A SetResult loaded from the cache.
+
+    Saving copies the cached pcap if there is one instead of encoding the
+    frames again. Split pcaps (see save_file.save_split_pcap) are encoded.
+    """
+
+    def __init__(self, name, frames, options, cached_pcap=''):
+        """Wrap the frames of a cached result.
+
+        Args:
+            name (str): Filename the result is saved as.
+            frames (FrameSelection): Frames and timestamps of the result.
+            options (dict): Whether to encode with L2/L3 headers and as
+                pcapng.
+            cached_pcap (str): Path of the saved pcap in the cache or ''.
+        """
+        super().__init__(name, frames, options)
+        self.cached_pcap = cached_pcap
+
+    def save(self, directory=''):
+        """Save the result as a pcap (once).
+
+        Args:
+            directory (str): Directory to save it in ('' for the CWD).
+        Returns:
+            (str): Filename of the saved pcap.
+        """
+        if not self.saved and self.cached_pcap and \
+                not save.is_split(self.options):
+            self.directory = directory
+            shutil.copyfile(self.cached_pcap, get_saved_name(self))
+            self.saved = True
+        return super().save(directory)
+
+    def write(self, pcap_file):
+        """Write the result as a pcap to a binary stream without saving it.
+
+        Args:
+            pcap_file (file): Binary file object like stdout or a pipe.
+        """
+        if not self.cached_pcap:
+            super().write(pcap_file)
+            return
+        with open(self.cached_pcap, 'rb') as cached_file:
+            shutil.copyfileobj(cached_file, pcap_file)
+
+
+class CachedFrames(FrameSelection):
+    """Records of a cached result, in the order they were saved in.
+
+    They are saved with the linktype, pcapng interfaces and comments that
+    the result they were stored from was saved with (see save_frames).
+    """
+
+    chronological = True
+
+    def __init__(self, frame_table, linktype, interface_names, annotations):
+        """Select all records of a table of cached records.
+
+        Args:
+            frame_table (FrameTable): Records in file order.
+            linktype (int): Linktype the records were saved with.
+            interface_names (list): Names of their pcapng interfaces.
+            annotations (tuple): (<interfaces>, <comments>) of the records.
+        """
+        super().__init__(frame_table, np.arange(len(frame_table)))
+        self.original_linktype = linktype
+        self.source_names = interface_names
+        self.annotations = annotations
+
+    def iter_records(self):
+        """Yield records as (<timestamp ns>, <frame bytes>) in file order."""
+        yield from zip(self.frame_table.timestamps.tolist(),
+                       self.frame_table.iter_frames_at(self.frame_nums))
+
+    def iter_annotated_records(self):
+        """Yield records with their pcapng interface and comment.
+
+        Yields:
+            (tuple): (<timestamp ns>, <frame bytes>, <interface>, <comment>)
+        """
+        interfaces, comments = self.annotations
+        for (timestamp, frame), interface, comment in zip(
+                self.iter_records(), interfaces, comments):
+            yield timestamp, frame, interface, comment
+
+
+class ResultCache:
+    """Directory of the results of previous runs, by key."""
+
+    def __init__(self, cache_dir, max_size):
+        """Use cache_dir as a cache of at most max_size bytes.
+
+        Args:
+            cache_dir (str): Directory of the cache.
+            max_size (int): Bytes that entries may take up in total.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_set_results(self, key, engine_class, filenames, args, options):
+        """Load the results of key or compute and store them.
+
+        The pcaps are only read if key is not cached.
+
+        Args:
+            key (str): Key of the run (see get_cache_key).
+            engine_class (class): PcapMath or one of its subclasses.
+            filenames (list): List of filenames.
+            args (dict): Dict of all arguments (including set args).
+            options (dict): Options of the engine (see pcapgraph.run).
+        Returns:
+            (list): SetResults of all operations, in the order of the flags.
+        """
+        set_results = self.load(key, options)
+        if set_results is not None:
+            return set_results
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            pcap_math = engine_class(filenames, options)
+            set_results = pcap_math.get_set_results(args)
+        print(stdout.getvalue(), end='')
+        self.store(key, set_results, stdout.getvalue())
+        return set_results
+
+    def load(self, key, options):
+        """Load the results of key and print what that run printed.
+
+        Args:
+            key (str): Key of the run (see get_cache_key).
+            options (dict): Whether to encode with L2/L3 headers and as
+                pcapng.
+        Returns:
+            (list): CachedSetResults or None if key is not cached or its
+                files are damaged.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        entry = self.read_entry(entry_dir)
+        if entry is None:
+            return None
+        # Entries are evicted in order of last use.
+        os.utime(os.path.join(entry_dir, ENTRY_NAME))
+        set_results = []
+        for result in entry['results']:
+            with np.load(os.path.join(entry_dir, result['frames'])) as frames:
+                frame_table = FrameTable({
+                    'payload': len(frames['payload']),
+                    'frames': len(frames['timestamps']),
+                    'pcaps': 1
+                })
+                frame_table.payload[:] = frames['payload']
+                frame_table.offsets[:] = frames['offsets']
+                frame_table.timestamps[:] = frames['timestamps']
+                frame_table.pcap_offsets[1] = len(frame_table)
+                cached_frames = CachedFrames(
+                    frame_table, int(frames['linktype']),
+                    frames['interface_names'].tolist(),
+                    (frames['interfaces'].tolist(),
+                     frames['comments'].tolist()))
+            cached_pcap = ''
+            if result['pcap']:
+                cached_pcap = os.path.join(entry_dir, result['pcap'])
+            set_results.append(
+                CachedSetResult(result['name'], cached_frames, options,
+                                cached_pcap))
+        print(entry['stdout'], end='')
+        return set_results
+
+    def read_entry(self, entry_dir):
+        """Read an entry and check the hashes of its files.
+
+        A damaged entry is removed.
+
+        Args:
+            entry_dir (str): Directory of the entry.
+        Returns:
+            (dict): Contents of entry.json or None.
+        """
+        try:
+            with open(os.path.join(entry_dir, ENTRY_NAME)) as entry_file:
+                entry = json.load(entry_file)
+            for cached_file, file_hash in entry['hashes'].items():
+                if get_file_hash(os.path.join(entry_dir,
+                                              cached_file)) != file_hash:
+                    raise ValueError("Hash mismatch of " + cached_file)
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        return entry
+
+    def store(self, key, set_results, stdout=''):
+        """Store the results of key, including the pcaps saved so far.
+
+        If key is already stored, only pcaps it doesn't have yet are added.
+        Split pcaps aren't stored, as their parts depend on the split.
+
+        Args:
+            key (str): Key of the run (see get_cache_key).
+            set_results (list): SetResults of the run.
+            stdout (str): What the run printed.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        entry = self.read_entry(entry_dir)
+        if entry is None:
+            entry = self.create_entry(entry_dir, set_results, stdout)
+        added_pcaps = False
+        for set_result, result in zip(set_results, entry['results']):
+            if set_result.saved and not result['pcap'] and \
+                    not save.is_split(set_result.options):
+                result['pcap'] = result['frames'][:-4] + '.pcap'
+                cached_pcap = os.path.join(entry_dir, result['pcap'])
+                shutil.copyfile(get_saved_name(set_result), cached_pcap)
+                entry['hashes'][result['pcap']] = get_file_hash(cached_pcap)
+                added_pcaps = True
+        if added_pcaps:
+            write_entry(entry_dir, entry)
+        self.evict()
+
+    def create_entry(self, entry_dir, set_results, stdout):
+        """Save the frames of results as a new entry.
+
+        The entry is written next to the cache and then renamed into place
+        so that an interrupted write never looks like an entry.
+
+        Args:
+            entry_dir (str): Directory of the entry.
+            set_results (list): SetResults of the run.
+            stdout (str): What the run printed.
+        Returns:
+            (dict): Contents of entry.json.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        new_entry_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.')
+        entry = {'stdout': stdout, 'results': [], 'hashes': {}}
+        for result_num, set_result in enumerate(set_results):
+            frames_name = str(result_num) + '.npz'
+            save_frames(set_result, os.path.join(new_entry_dir, frames_name))
+            entry['results'].append({
+                'name': set_result.name,
+                'frames': frames_name,
+                'pcap': ''
+            })
+            entry['hashes'][frames_name] = get_file_hash(
+                os.path.join(new_entry_dir, frames_name))
+        write_entry(new_entry_dir, entry)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.rename(new_entry_dir, entry_dir)
+        return entry
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            entry_name = os.path.join(entry_dir, ENTRY_NAME)
+            if key.startswith('.') or not os.path.isfile(entry_name):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry_dir, cached_file))
+                for cached_file in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_name), size, entry_dir))
+        cache_size = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if cache_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            cache_size -= size
+
+
+def write_entry(entry_dir, entry):
+    """Replace entry.json of an entry in one step.
+
+    Args:
+        entry_dir (str): Directory of the entry.
+        entry (dict): Contents of entry.json.
+    """
+    new_entry_name = os.path.join(entry_dir, '.' + ENTRY_NAME)
+    with open(new_entry_name, 'w') as entry_file:
+        json.dump(entry, entry_file)
+    os.replace(new_entry_name, os.path.join(entry_dir, ENTRY_NAME))
+
+
+def save_frames(set_result, filename):
+    """Save the records of a result as the native writer saves them.
+
+    Records are kept in file order with their linktype, pcapng interfaces
+    and comments (see save_file.get_capture_records), so frames saved as
+    they were captured and annotations are cached too.
+
+    Args:
+        set_result (SetResult): A set operation result.
+        filename (str): Name of the .npz file.
+    """
+    records, interface_names, linktype = save.get_capture_records(
+        set_result.frames, set_result.options)
+    frames = []
+    timestamps = []
+    interfaces = []
+    comments = []
+    for record in records:
+        timestamps.append(record[0])
+        frames.append(record[1])
+        interface, comment = record[2:] or (0, '')
+        interfaces.append(interface)
+        comments.append(comment)
+    offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frame) for frame in frames])
+    np.savez(
+        filename,
+        payload=np.frombuffer(b''.join(frames), dtype=np.uint8),
+        offsets=offsets,
+        timestamps=np.array(timestamps, dtype=np.int64),
+        linktype=np.int64(linktype),
+        interface_names=np.array(list(interface_names), dtype=str),
+        interfaces=np.array(interfaces, dtype=np.int64),
+        comments=np.array(comments, dtype=str))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sample the same frames from every pcap.
+
+With --sample 1/N, a frame is kept if a hash of its stripped bytes is in the
+lowest 1/N of the hash range. The hash only depends on the frame, so a frame
+that is kept in one pcap is kept in all of them and set operations on the
+samples are set operations on the full pcaps, restricted to 1/N of frames.
+
+Overlap percentages of samples are proportions of sampled frames, so they
+are printed with a Wilson score interval. The hash is keyed differently from
+frame fingerprints, which shard and sketch frames by their own bits.
+"""
+import hashlib
+import math
+
+SAMPLE_HASH_KEY = b'pcapgraph-sample'
+# Normal quantile of a two-sided 95% confidence interval.
+CONFIDENCE_Z = 1.96
+
+
+def parse_sample_rate(sample):
+    """Parse a sample rate like 1/64 or 64.
+
+    Args:
+        sample (str): 1/N or N, where N is a positive integer.
+    Returns:
+        (int): N. 1 keeps every frame.
+    Raises:
+        SyntaxError: If sample is not 1/N or N.
+    """
+    numerator, _, denominator = sample.rpartition('/')
+    if numerator in ['', '1'] and denominator.isdigit() and \
+            int(denominator) > 0:
+        return int(denominator)
+    raise SyntaxError("\nERROR: --sample must be like 1/64.")
+
+
+def is_sampled(frame_raw, options):
+    """Check whether a frame is in the sample of options['sample'].
+
+    Args:
+        frame_raw (str): ASCII hex of the stripped frame.
+        options (dict): 'sample' rate N of 1/N (1 or missing keeps all).
+    Returns:
+        (bool): Whether to keep the frame.
+    """
+    sample_rate = options.get('sample', 1)
+    if sample_rate <= 1:
+        return True
+    digest = hashlib.blake2b(
+        frame_raw.encode(), digest_size=8, key=SAMPLE_HASH_KEY).digest()
+    return int.from_bytes(digest, 'little') < 2**64 // sample_rate
+
+
+def get_confidence_interval(count, total):
+    """Get the Wilson score interval of the proportion count / total.
+
+    Args:
+        count (int): Sampled frames that are in the subset.
+        total (int): Sampled frames.
+    Returns:
+        (tuple): (<low>, <high>) proportions (0-1).
+    """
+    if not total:
+        return 0.0, 1.0
+    proportion = count / total
+    z_squared = CONFIDENCE_Z**2
+    center = (proportion + z_squared / (2 * total)) / (1 + z_squared / total)
+    spread = CONFIDENCE_Z / (1 + z_squared / total) * math.sqrt(
+        proportion * (1 - proportion) / total + z_squared / (4 * total**2))
+    return max(center - spread, 0.0), min(center + spread, 1.0)
+
+
+def get_percent_text(count, total, options):
+    """Format count / total as a percentage, with its interval if sampled.
+
+    Args:
+        count (int): Frames that are in the subset.
+        total (int): Frames.
+        options (dict): 'sample' rate N of 1/N.
+    Returns:
+        (str): Like '31%' or, for a sample, '31% (25-37%)'.
+    """
+    percent_text = str(round(100 * (count / (total or 1)))) + '%'
+    if options.get('sample', 1) <= 1:
+        return percent_text
+    low, high = get_confidence_interval(count, total)
+    return '{} ({}-{}%)'.format(percent_text, math.floor(100 * low),
+                                math.ceil(100 * high))
@@ -12,10 +12,64 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Save file."""
+"""Save file.
 
+Results are written as pcap or pcapng directly from frame bytes and integer
+nanosecond timestamps (native writer). pcap files use the nanosecond magic
+number and pcapng files an interface with if_tsresol 9, so no timestamp
+precision is lost. A pcapng union has an interface per input pcap instead:
+each frame is saved on the interface of the pcap it was taken from, with a
+comment naming every pcap that saw it. Frames with several linktypes (inputs
+with different linktypes that are not stripped by -2/-3) are saved as pcapng
+with an interface per linktype, as classic pcap has one linktype per file.
+
+The text2pcap writer pipes an ASCII hexdump of the frames in timestamp order
+to text2pcap instead. Either writes straight to the final name and can be
+compressed as it is written (see compressed_file).
+"""
+
+import binascii
+import heapq
+import itertools
+import json
 import subprocess as sp
 import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from pcapgraph.compressed_file import COMPRESSION_EXTENSIONS
+from pcapgraph.compressed_file import open_writer
+from pcapgraph.read_file import PCAP_MAGIC_NSEC
+from pcapgraph.read_file import PCAPNG_BYTE_ORDER_MAGIC
+from pcapgraph.read_file import PCAPNG_EPB_TYPE
+from pcapgraph.read_file import PCAPNG_IDB_TYPE
+from pcapgraph.read_file import PCAPNG_SHB_TYPE
+from pcapgraph.read_file import PCAPNG_TSRESOL_OPTION
+from pcapgraph.read_file import parse_timestamp
+
+WRITERS = ['native', 'text2pcap']
+# Largest frame that readers are expected to accept (like tshark's default).
+SNAPLEN = 262144
+# Raw IP, for frames whose L2 header was stripped.
+RAW_IP_LINKTYPE = 101
+PCAP_HEADER = struct.Struct('<IHHiIII')
+PCAP_RECORD_HEADER = struct.Struct('<IIII')
+PCAPNG_EPB_HEADER = struct.Struct('<IIIII')
+PCAPNG_COMMENT_OPTION = 1
+PCAPNG_IF_NAME_OPTION = 2
+PCAPNG_END_OF_OPTIONS = b'\0' * 4
+HEXDUMP_LINE_BYTES = 16
+# Frames whose hexdump is piped to text2pcap at once.
+PIPE_CHUNK_FRAMES = 4096
+# Frame bytes sorted in memory at once. Larger results are sorted in runs
+# of this size on disk that are then merged.
+SORT_RUN_BYTES = 2**26
+# Timestamp, position in the result, interface (-1 for none) and length of
+# a record in a sorted run
+SORT_RUN_HEADER = struct.Struct('<qQiI')
 
 
 def convert_to_pcaptext(raw_packet, timestamp=''):
@@ -45,6 +99,8 @@ def convert_to_pcaptext(raw_packet, timestamp=''):
       0050  26 27 28 29 2a 2b 2c 2d 2e 2f 30 31 32 33 34 35
       0060  36 37
 
+    Offsets are hex, like those of od.
+
     NOTE: Output format doesn't need an extra \\n between packets. So in the
     above example, the next line could be 0000  00 ... for the next packet.
 
@@ -55,69 +111,607 @@ def convert_to_pcaptext(raw_packet, timestamp=''):
     Returns:
         formatted_string (str): Packet in ASCII hexdump format like `Out` above
     """
-    # init vars
     formatted_string = ''
-    hex_chars_per_line = 32
-    hex_chars_per_byte = 2
-    num_chars = len(raw_packet)
-
     if timestamp:
         formatted_string += str(timestamp) + '\n'
-    # Parse the string into lines and each line into space-delimited bytes.
-    for line_sep in range(0, num_chars, hex_chars_per_line):
-        raw_line = raw_packet[line_sep:line_sep + hex_chars_per_line]
-        line = ''
-        for byte_sep in range(0, hex_chars_per_line, hex_chars_per_byte):
-            line += raw_line[byte_sep:byte_sep + hex_chars_per_byte] + ' '
-        line = line[:-1]  # get rid of trailing space
-        line_sep_hex = line_sep // 32 * 10  # Offsets need to be in hex.
-        formatted_string += '{:>04d}'.format(line_sep_hex) + '  ' + line + '\n'
+    frame = bytes.fromhex(raw_packet)
+    return formatted_string + ''.join(
+        get_hexdump_lines(get_spaced_hex(frame), 0, len(frame)))
 
-    return formatted_string
 
+def get_spaced_hex(data):
+    """Get the hex of many bytes at once, each followed by a space.
 
-def reorder_packets(pcap):
-    """Union causes packets to be ordered incorrectly, so reorder properly.
+    Args:
+        data (bytes): Bytes of one or more frames.
+    Returns:
+        (str): 'xx ' for every byte of data.
+    """
+    spaced_hex = np.full((len(data), 3), ord(' '), dtype=np.uint8)
+    spaced_hex[:, :2] = np.frombuffer(binascii.hexlify(data),
+                                      dtype=np.uint8).reshape(-1, 2)
+    return spaced_hex.tobytes().decode('ascii')
 
-    Reorder packets, save to 2nd file. After this is done, replace initial
-    file with reordered one. Append temporary file with '_'.
+
+def get_hexdump_lines(spaced_hex, start, length):
+    """Cut the spaced hex of a frame into the lines of its hexdump.
 
     Args:
-        pcap (str): Filename of packet capture. Should end with '_', which
-            can be stripped off so that we can reorder to a diff file.
+        spaced_hex (str): Output of get_spaced_hex.
+        start (int): Index of the frame's first byte in spaced_hex.
+        length (int): Bytes in the frame.
+    Returns:
+        (list): Lines of the frame as in convert_to_pcaptext.
     """
-    pcap_filename_parts = os.path.splitext(pcap)
-    temp_pcap = pcap_filename_parts[0] + '2' + pcap_filename_parts[1]
-    reorder_packets_cmds = ['reordercap', pcap, temp_pcap]
-    reorder_sp = sp.Popen(reorder_packets_cmds, stdout=sp.PIPE, stderr=sp.PIPE)
-    reorder_sp.communicate()
-    reorder_sp.kill()
-    os.replace(temp_pcap, pcap)
+    lines = []
+    for offset in range(0, length, HEXDUMP_LINE_BYTES):
+        line_bytes = min(HEXDUMP_LINE_BYTES, length - offset)
+        line_start = 3 * (start + offset)
+        lines.append('{:04x}  {}{}\n'.format(
+            offset, spaced_hex[line_start:line_start + 3 * line_bytes - 1],
+            ' ' * (HEXDUMP_LINE_BYTES - line_bytes)))
+    return lines
+
+
+def iter_pcaptext_chunks(records):
+    """Yield the text2pcap input of records in bounded chunks.
+
+    The hex of each chunk of frames is made in one step.
+
+    Args:
+        records (iterable): [(<timestamp ns>, <frame bytes>), ...]
+    Yields:
+        (bytes): ASCII hexdump of up to PIPE_CHUNK_FRAMES frames.
+    """
+    records = iter(records)
+    chunk = list(itertools.islice(records, PIPE_CHUNK_FRAMES))
+    while chunk:
+        spaced_hex = get_spaced_hex(b''.join(frame for _, frame in chunk))
+        lines = []
+        start = 0
+        for timestamp, frame in chunk:
+            lines.append('%d.%09d\n' % divmod(timestamp, 10**9))
+            lines += get_hexdump_lines(spaced_hex, start, len(frame))
+            start += len(frame)
+        yield ''.join(lines).encode('ascii')
+        chunk = list(itertools.islice(records, PIPE_CHUNK_FRAMES))
 
 
 def save_pcap(pcap_dict, name, options):
-    """Save a packet capture given ASCII hexdump using `text2pcap`
+    """Save a packet capture of frames with the writer in options.
 
     Args:
         pcap_dict (dict): List of pcaps of frames to timestamps. Format:
             {<frame>: <timestamp>, ...}
+            Repeated frames (multiset results) can be passed as a list of
+            pairs instead: [(<frame>, <timestamp>), ...]
         name (str): Type of operation and name of savefile
-        options (dict): Whether to encode with L2/L3 headers.
+        options (dict): Whether to encode with L2/L3 headers and as pcapng,
+            the 'linktype' of the frames, the 'writer' (see WRITERS) and
+            how to 'compress' it (see compressed_file). With 'split-size'
+            or 'split-interval', it is saved in parts (see save_split_pcap).
+    """
+    if is_split(options):
+        save_split_pcap(pcap_dict, name, options)
+        return
+    if options.get('writer', 'native') == 'text2pcap' and \
+            not options.get('compress'):
+        save_pcap_text2pcap(pcap_dict, name, options)
+        return
+    with open(get_saved_name(name, options), 'wb') as pcap_file:
+        write_capture(pcap_file, pcap_dict, options)
+
+
+def is_split(options):
+    """Check whether saved pcaps are split into parts.
+
+    Args:
+        options (dict): Options as in save_pcap.
+    Returns:
+        (bool): Whether 'split-size' or 'split-interval' is set.
+    """
+    return bool(options.get('split-size') or options.get('split-interval'))
+
+
+def save_split_pcap(pcap_dict, name, options):
+    """Save a packet capture in numbered parts and an index of them.
+
+    Like editcap -c/-i, but while the frames are written: a part ends
+    before options['split-size'] bytes or at the end of its
+    options['split-interval'] ns. union.pcap is saved as union_00001.pcap,
+    union_00002.pcap, ... and union_index.json, which lists the file,
+    first and last timestamp and frames of each part.
+
+    Args:
+        pcap_dict (dict): Frames as in save_pcap.
+        name (str): Name of savefile.
+        options (dict): Options as in save_pcap (native writer).
+    """
+    records, interface_names, linktype = \
+        get_capture_records(pcap_dict, options)
+    stem, extension = os.path.splitext(name)
+    index = []
+    for part_num, part in enumerate(
+            iter_parts(records, options.get('split-size', 0),
+                       options.get('split-interval', 0)), 1):
+        part_name = get_saved_name(
+            '%s_%05d%s' % (stem, part_num, extension), options)
+        span = []
+        with open(part_name, 'wb') as pcap_file, \
+                open_writer(pcap_file, options.get('compress', '')) as \
+                pcap_writer:
+            write_records(pcap_writer, count_records(part, span),
+                          interface_names, linktype, options)
+        index.append({
+            'file': os.path.basename(part_name),
+            'first': '%d.%09d' % divmod(span[0], 10**9),
+            'last': '%d.%09d' % divmod(span[1], 10**9),
+            'frames': span[2],
+        })
+    with open(stem + '_index.json', 'w') as index_file:
+        json.dump(index, index_file, indent=2)
+
+
+def iter_parts(records, split_size=0, split_interval=0):
+    """Split records into consecutive parts like editcap -c/-i.
+
+    Each part must be read to its end before the next one is.
+
+    Args:
+        records (iterable): Records that start with (<timestamp ns>,
+            <frame bytes>) in file order.
+        split_size (int): Most bytes of frames and their headers in a part
+            (0 for no limit). A larger frame gets a part of its own.
+        split_interval (int): Nanoseconds of a part (0 for no limit). Parts
+            start at multiples of it from the first frame, so parts of
+            silent intervals are skipped.
+    Yields:
+        (iterator): Records of each part.
+    """
+    records = iter(records)
+    pending = [next(records, None)]
+    if pending[0] is None:
+        return
+    first_timestamp = pending[0][0]
+
+    def iter_part():
+        record = pending[0]
+        part_bytes = 0
+        part_end = None
+        if split_interval:
+            part_end = record[0] + split_interval - \
+                (record[0] - first_timestamp) % split_interval
+        while record is not None:
+            record_bytes = PCAP_RECORD_HEADER.size + len(record[1])
+            if part_bytes and split_size and \
+                    part_bytes + record_bytes > split_size:
+                break
+            if part_end is not None and record[0] >= part_end:
+                break
+            yield record
+            part_bytes += record_bytes
+            record = next(records, None)
+        pending[0] = record
+
+    while pending[0] is not None:
+        yield iter_part()
+
+
+def count_records(records, span):
+    """Pass records through and note their time span.
+
+    Args:
+        records (iterable): Records in file order.
+        span (list): Empty list that becomes [<first timestamp ns>, <last
+            timestamp ns>, <records>].
+    Yields:
+        (tuple): Each record.
+    """
+    for record in records:
+        if not span:
+            span.extend([record[0], record[0], 0])
+        span[1] = record[0]
+        span[2] += 1
+        yield record
+
+
+def get_saved_name(name, options):
+    """Get the name of the file that save_pcap writes.
+
+    Args:
+        name (str): Name of savefile
+        options (dict): Whether to encode as pcapng and the compression.
+    Returns:
+        (str): name with 'ng' for pcapng and an extension like '.gz' if it
+            is compressed.
+    """
+    if options['pcapng']:
+        name += 'ng'
+    if options.get('compress'):
+        name += COMPRESSION_EXTENSIONS[options['compress']]
+    return name
+
+
+def write_capture(pcap_file, pcap_dict, options):
+    """Write a packet capture of frames to a binary stream like stdout.
+
+    The text2pcap writer can only write files, so its pcap is made in a
+    temporary directory and copied. With options['compress'], the pcap is
+    compressed while it is written.
+
+    Args:
+        pcap_file (file): Binary file object.
+        pcap_dict (dict): Frames as in save_pcap.
+        options (dict): Options as in save_pcap.
+    """
+    with open_writer(pcap_file, options.get('compress', '')) as pcap_writer:
+        if options.get('writer', 'native') == 'text2pcap':
+            copy_text2pcap_capture(pcap_writer, pcap_dict, options)
+            return
+        write_records(pcap_writer,
+                      *get_capture_records(pcap_dict, options),
+                      options=options)
+
+
+def get_capture_records(pcap_dict, options):
+    """Get the records that the native writer saves for frames.
+
+    Args:
+        pcap_dict (dict): Frames as in save_pcap.
+        options (dict): Options as in save_pcap.
+    Returns:
+        (tuple): Records in file order (see write_pcapng), the names of
+            their pcapng interfaces and their linktype (a list per
+            interface if frames have several, see get_mixed_records).
+    """
+    frame_linktypes = get_frame_linktypes(pcap_dict, options)
+    if len(frame_linktypes) > 1:
+        return get_mixed_records(pcap_dict, frame_linktypes, options)
+    linktype = get_output_linktype(options, pcap_dict)
+    if options['pcapng'] and hasattr(pcap_dict, 'iter_annotated_records'):
+        return pcap_dict.iter_annotated_records(), pcap_dict.source_names, \
+            linktype
+    return get_sorted_records(pcap_dict), ('', ), linktype
+
+
+def get_frame_linktypes(pcap_dict, options):
+    """Get the linktypes of frames that are saved as they are.
+
+    Args:
+        pcap_dict (dict): Frames as in save_pcap. Objects with
+            get_linktypes (like FrameSelection) know the linktype of each
+            frame.
+        options (dict): Options as in save_pcap.
+    Returns:
+        (list): Sorted linktypes of the frames, or [] if they are stripped
+            (see get_output_linktype) or unknown.
+    """
+    if options['strip-l2'] or options['strip-l3'] or \
+            not hasattr(pcap_dict, 'get_linktypes'):
+        return []
+    return pcap_dict.get_linktypes()
+
+
+def get_mixed_records(pcap_dict, linktypes, options):
+    """Get the records of frames with several linktypes.
+
+    Each linktype gets a pcapng interface. A union has an interface per pcap
+    and linktype instead (see MergedFrames.get_interfaces).
+
+    Args:
+        pcap_dict (dict): Frames as in save_pcap with get_linktypes and
+            iter_linktype_records.
+        linktypes (list): Sorted linktypes of the frames.
+        options (dict): Options as in save_pcap.
+    Returns:
+        (tuple): Records as in write_pcapng, the names of their interfaces
+            and the linktype of each interface.
+    Raises:
+        SyntaxError: If the frames are not saved as pcapng.
+    """
+    if not options['pcapng']:
+        raise SyntaxError(
+            "\nERROR: Frames with linktypes " +
+            ', '.join(str(linktype) for linktype in linktypes) +
+            " can only be saved together as pcapng (-o pcapng) or with "
+            "-2/-3.")
+    if hasattr(pcap_dict, 'iter_annotated_records'):
+        interfaces = pcap_dict.get_interfaces()
+        return pcap_dict.iter_annotated_records(interfaces), \
+            [pcap_dict.source_names[pcap_index]
+             for pcap_index, _ in interfaces], \
+            [linktype for _, linktype in interfaces]
+    interfaces = {linktype: index for index, linktype in enumerate(linktypes)}
+    records = ((timestamp, frame, interfaces[linktype])
+               for timestamp, frame, linktype in
+               pcap_dict.iter_linktype_records())
+    if not getattr(pcap_dict, 'chronological', False):
+        records = iter_sorted_records(records)
+    return records, [''] * len(linktypes), linktypes
+
+
+def write_records(pcap_file, records, interface_names, linktype, options):
+    """Write records as pcap or pcapng per options.
+
+    Args:
+        pcap_file (file): Binary file object.
+        records (iterable): Records as in write_pcapng.
+        interface_names (iterable): Names of the pcapng interfaces.
+        linktype (int|list): Linktype of all frames, or for pcapng that of
+            each interface.
+        options (dict): Options as in save_pcap.
     """
-    pcap_text = ''
-    for frame in pcap_dict:
-        frame_timestamp = pcap_dict[frame]
-        pcap_text += convert_to_pcaptext(frame, frame_timestamp)
-    save_pcap_cmds = ['text2pcap', '-', '-t', '%s.']
+    if options['pcapng']:
+        write_pcapng(pcap_file, records, linktype, interface_names)
+    else:
+        write_pcap(pcap_file, records, linktype)
+
+
+def copy_text2pcap_capture(pcap_file, pcap_dict, options):
+    """Save a packet capture with text2pcap and copy it to a stream.
+
+    Args:
+        pcap_file (file): Binary file object.
+        pcap_dict (dict): Frames as in save_pcap.
+        options (dict): Options as in save_pcap.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        name = os.path.join(temp_dir, 'result.pcap')
+        save_pcap_text2pcap(pcap_dict, name, options)
+        with open(get_saved_name(name, dict(options, compress='')),
+                  'rb') as saved_file:
+            shutil.copyfileobj(saved_file, pcap_file)
+
+
+def get_output_linktype(options, pcap_dict=None):
+    """Get the linktype that frames are saved with.
+
+    Args:
+        options (dict): Whether L2/L3 headers were stripped and the
+            'linktype' of the input pcaps (1 = Ethernet if missing).
+        pcap_dict (dict): Frames as in save_pcap. Frames saved as they
+            were captured (see FrameSelection) keep their linktype.
+    Returns:
+        (int): Linktype of the saved pcap.
+    """
+    if getattr(pcap_dict, 'original_linktype', None) is not None:
+        return pcap_dict.original_linktype
     if options['strip-l2'] or options['strip-l3']:
-        # 101 is the link-type for raw-ip (IPv4 & IPv6)
-        save_pcap_cmds += ['-l', '101']
+        return RAW_IP_LINKTYPE
+    return options.get('linktype', 1)
+
+
+def iter_records(pcap_dict):
+    """Yield the frames of a result as records.
+
+    Args:
+        pcap_dict (dict|iterable): Frames as in save_pcap. Objects with
+            iter_records (like FrameSelection) skip the hex round trip.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>)
+    """
+    if hasattr(pcap_dict, 'iter_records'):
+        yield from pcap_dict.iter_records()
+        return
+    if isinstance(pcap_dict, dict):
+        pcap_dict = pcap_dict.items()
+    for frame, timestamp in pcap_dict:
+        yield parse_timestamp(timestamp), bytes.fromhex(frame)
+
+
+def get_sorted_records(pcap_dict):
+    """Get the frames of a result as records in timestamp order.
+
+    Frames with the same timestamp keep their order, like reordercap.
+    Chronological frames (like MergedFrames) are passed through as they
+    are made.
+
+    Args:
+        pcap_dict (dict|iterable): Frames as in save_pcap.
+    Returns:
+        (iterable): (<timestamp ns>, <frame bytes>) records.
+    """
+    if getattr(pcap_dict, 'chronological', False):
+        return pcap_dict.iter_records()
+    return iter_sorted_records(iter_records(pcap_dict))
+
+
+def iter_sorted_records(records, run_bytes=SORT_RUN_BYTES):
+    """Sort records by timestamp in runs of about run_bytes of frames.
+
+    Each run is sorted in memory. If there is more than one, runs are
+    written to temporary files and merged with a heap.
+
+    Args:
+        records (iterable): (<timestamp ns>, <frame bytes>) records, which
+            can also have the index of their pcapng interface.
+        run_bytes (int): Frame bytes after which a run is written.
+    Yields:
+        (tuple): (<timestamp ns>, <frame bytes>) in timestamp order, or
+            (<timestamp ns>, <frame bytes>, <interface>, '') for records
+            with an interface (see write_pcapng).
+    """
+    with tempfile.TemporaryDirectory(prefix='pcapgraph-') as run_dir:
+        run_names = []
+        run = []
+        frame_bytes = 0
+        for sequence, (timestamp, frame, *interface) in enumerate(records):
+            # The position keeps equal timestamps in order and means frames
+            # are never compared.
+            run.append((timestamp, sequence,
+                        interface[0] if interface else -1, frame))
+            frame_bytes += len(frame)
+            if frame_bytes >= run_bytes:
+                run_names.append(write_sorted_run(run, run_dir))
+                run = []
+                frame_bytes = 0
+        if run_names:
+            if run:
+                run_names.append(write_sorted_run(run, run_dir))
+            run = heapq.merge(*[iter_sorted_run(name) for name in run_names])
+        else:
+            run.sort()
+        for timestamp, _, interface, frame in run:
+            if interface < 0:
+                yield timestamp, frame
+            else:
+                yield timestamp, frame, interface, ''
+
+
+def write_sorted_run(run, run_dir):
+    """Sort records and write them to a file in run_dir.
+
+    Args:
+        run (list): (<timestamp ns>, <position>, <interface>, <frame
+            bytes>) records.
+        run_dir (str): Directory of the run files.
+    Returns:
+        (str): Filename of the run.
+    """
+    run.sort()
+    with tempfile.NamedTemporaryFile(dir=run_dir, delete=False) as run_file:
+        for timestamp, sequence, interface, frame in run:
+            run_file.write(
+                SORT_RUN_HEADER.pack(timestamp, sequence, interface,
+                                     len(frame)))
+            run_file.write(frame)
+    return run_file.name
+
+
+def iter_sorted_run(run_name):
+    """Read the records of a run written by write_sorted_run.
+
+    Args:
+        run_name (str): Filename of the run.
+    Yields:
+        (tuple): (<timestamp ns>, <position>, <interface>, <frame bytes>)
+    """
+    with open(run_name, 'rb') as run_file:
+        while True:
+            header = run_file.read(SORT_RUN_HEADER.size)
+            if len(header) < SORT_RUN_HEADER.size:
+                return
+            timestamp, sequence, interface, frame_len = \
+                SORT_RUN_HEADER.unpack(header)
+            yield timestamp, sequence, interface, run_file.read(frame_len)
+
+
+def write_pcap(pcap_file, records, linktype):
+    """Write records as a nanosecond resolution pcap.
+
+    Args:
+        pcap_file (file): Binary file object.
+        records (iterable): (<timestamp ns>, <frame bytes>) in file order.
+        linktype (int): Linktype of all frames.
+    """
+    pcap_file.write(
+        PCAP_HEADER.pack(PCAP_MAGIC_NSEC, 2, 4, 0, 0, SNAPLEN, linktype))
+    for timestamp, frame in records:
+        seconds, nanoseconds = divmod(timestamp, 10**9)
+        pcap_file.write(
+            PCAP_RECORD_HEADER.pack(seconds, nanoseconds, len(frame),
+                                    len(frame)))
+        pcap_file.write(frame)
+
+
+def write_pcapng(pcap_file, records, linktype, interface_names=('', )):
+    """Write records as pcapng with nanosecond resolution interfaces.
+
+    Args:
+        pcap_file (file): Binary file object.
+        records (iterable): (<timestamp ns>, <frame bytes>) in file order.
+            Records can also have the index of their interface and a
+            comment: (<timestamp ns>, <frame bytes>, <interface>, <comment>)
+        linktype (int|list): Linktype of all frames, or of each interface.
+        interface_names (iterable): if_name of each interface ('' for none).
+    """
+    interface_names = list(interface_names)
+    if isinstance(linktype, int):
+        linktype = [linktype] * len(interface_names)
+    # Section header block: version 1.0 of unknown section length.
+    write_pcapng_block(
+        pcap_file, PCAPNG_SHB_TYPE,
+        struct.pack('<IHHq', PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1))
+    for interface_name, interface_linktype in zip(interface_names, linktype):
+        # Interface description block with if_tsresol 9 (ns).
+        idb_options = get_pcapng_option(PCAPNG_TSRESOL_OPTION, b'\x09')
+        if interface_name:
+            idb_options += get_pcapng_option(PCAPNG_IF_NAME_OPTION,
+                                             interface_name.encode())
+        write_pcapng_block(
+            pcap_file, PCAPNG_IDB_TYPE,
+            struct.pack('<HHI', interface_linktype, 0, SNAPLEN) +
+            idb_options +
+            PCAPNG_END_OF_OPTIONS)
+    for record in records:
+        timestamp, frame = record[:2]
+        interface_id, comment = record[2:] or (0, '')
+        epb_options = b''
+        if comment:
+            epb_options = get_pcapng_option(
+                PCAPNG_COMMENT_OPTION,
+                comment.encode()) + PCAPNG_END_OF_OPTIONS
+        write_pcapng_block(
+            pcap_file, PCAPNG_EPB_TYPE,
+            PCAPNG_EPB_HEADER.pack(interface_id, timestamp >> 32,
+                                   timestamp & 0xffffffff, len(frame),
+                                   len(frame)) + frame +
+            b'\0' * (-len(frame) % 4) + epb_options)
+
+
+def get_pcapng_option(code, value):
+    """Encode a pcapng option, padded to 32 bits.
+
+    Args:
+        code (int): Option code.
+        value (bytes): Option value.
+    Returns:
+        (bytes): Option as it is written in a block.
+    """
+    return struct.pack('<HH', code, len(value)) + value + \
+        b'\0' * (-len(value) % 4)
+
+
+def write_pcapng_block(pcap_file, block_type, body):
+    """Write a pcapng block around a body padded to 32 bits.
+
+    Args:
+        pcap_file (file): Binary file object.
+        block_type (int): Block type.
+        body (bytes): Block body.
+    """
+    block_len = len(body) + 12
+    pcap_file.write(
+        struct.pack('<II', block_type, block_len) + body +
+        struct.pack('<I', block_len))
+
+
+def save_pcap_text2pcap(pcap_dict, name, options):
+    """Save a packet capture given ASCII hexdump using `text2pcap`
+
+    Timestamps are saved with microsecond resolution. The hexdump is
+    written to text2pcap's stdin in chunks instead of being built first,
+    already in timestamp order, so it needs no reordercap pass.
+
+    Args:
+        pcap_dict (dict): Frames as in save_pcap.
+        name (str): Type of operation and name of savefile
+        options (dict): Whether to encode with L2/L3 headers and as pcapng
+            and the 'linktype' of the frames.
+    """
+    if len(get_frame_linktypes(pcap_dict, options)) > 1:
+        raise SyntaxError("\nERROR: text2pcap saves one linktype. Use the "
+                          "native writer for frames with several.")
+    save_pcap_cmds = ['text2pcap', '-', '-t', '%s.',
+                      '-l', str(get_output_linktype(options, pcap_dict))]
     if options['pcapng']:  # If output type is pcapng
         save_pcap_cmds += ['-n']
         name += 'ng'
     save_pcap_cmds += [name]
     save_pcap_sp = sp.Popen(
-        save_pcap_cmds, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.PIPE)
-    save_pcap_sp.communicate(input=pcap_text.encode())
-    save_pcap_sp.kill()
-    reorder_packets(name)
+        save_pcap_cmds, stdin=sp.PIPE, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+    with save_pcap_sp.stdin:
+        for pcap_text in iter_pcaptext_chunks(
+                get_sorted_records(pcap_dict)):
+            save_pcap_sp.stdin.write(pcap_text)
+    save_pcap_sp.wait()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run tasks that depend on each other once each, in dependency order.
+
+Set operations share intermediates: -bdeisu needs the intersection for -i,
+-b and -e and the frames unique to each pcap for -d and -s. Tasks are
+described as {<name>: (<function>, [<dependency name>, ...])}, which is a
+DAG. Each task that a target depends on runs exactly once, as soon as its
+dependencies are done. Most intermediates are numpy or Python loops that
+hold the GIL, so they run one after another in the calling thread, in the
+same order every time. Tasks described with a third item of True
+(`(<function>, [...], True)`) mostly wait on I/O and run on a thread pool
+while the others run.
+"""
+import concurrent.futures
+
+
+def get_needed_tasks(tasks, targets):
+    """Get the names of targets and every task they depend on.
+
+    Args:
+        tasks (dict): {<name>: (<function>, [<dependency name>, ...])}
+        targets (list): Names of the tasks whose results are wanted.
+    Returns:
+        (set): Names of the tasks to run.
+    """
+    needed = set()
+    unvisited = list(targets)
+    while unvisited:
+        name = unvisited.pop()
+        if name not in needed:
+            needed.add(name)
+            unvisited.extend(tasks[name][1])
+    return needed
+
+
+def is_io_bound(task):
+    """Check whether a task mostly waits on I/O.
+
+    Args:
+        task (tuple): (<function>, [<dependency name>, ...]) with an
+            optional third item that is True for I/O-bound tasks.
+    Returns:
+        (bool): Whether the task can run on a thread.
+    """
+    return len(task) > 2 and bool(task[2])
+
+
+def run_graph(tasks, targets, workers=None):
+    """Run targets and their dependencies, each once.
+
+    Args:
+        tasks (dict): {<name>: (<function>, [<dependency name>, ...])}
+            Functions take no arguments. See is_io_bound for tasks that run
+            on threads.
+        targets (list): Names of the tasks whose results are wanted.
+        workers (int): Max I/O-bound tasks to run at the same time (None for
+            the thread pool default).
+    Returns:
+        (dict): {<name>: <result of function>, ...} of all tasks that ran.
+    Raises:
+        ValueError: If the tasks have a dependency cycle.
+    """
+    needed = get_needed_tasks(tasks, targets)
+    results = {}
+    running = {}  # {<future>: <name>}
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        while len(results) < len(needed):
+            ready = [
+                name for name in
+                sorted(needed - set(results) - set(running.values()))
+                if all(dep in results for dep in tasks[name][1])
+            ]
+            for name in ready:
+                if is_io_bound(tasks[name]):
+                    running[pool.submit(tasks[name][0])] = name
+            gil_bound = [
+                name for name in ready if not is_io_bound(tasks[name])
+            ]
+            if gil_bound:
+                results[gil_bound[0]] = tasks[gil_bound[0]][0]()
+                done = [future for future in running if future.done()]
+            elif running:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+            else:
+                raise ValueError("Tasks have a dependency cycle: " +
+                                 ', '.join(sorted(needed - set(results))))
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return results
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Results of set operations that are only saved when an output needs them.
+
+A SetResult knows the pcap it would be saved as, how many frames it has and
+their first and last timestamps. That is enough to graph it or count it, so
+a pcap is only written when a pcap or pcapng output or a sink (see
+output_sink) asks for one.
+
+Operations with a result per pcap (like -e or -b on 40 pcaps) save their
+results on a pool of threads (see save_results). Writing is mostly waiting
+on disks, compressors and text2pcap, and threads share the frames of the
+results instead of copying them to other processes.
+"""
+import concurrent.futures
+import os
+
+from pcapgraph.read_file import parse_timestamp
+import pcapgraph.save_file as save
+
+
+class SetResult:
+    """The frames of one set operation, saved to a pcap only on request.
+
+    Frames can be anything that save.save_pcap takes: a frame dict, a list
+    of (frame, timestamp) pairs, a FrameSelection or SpilledFrames.
+    """
+
+    def __init__(self, name, frames, options):
+        """Wrap the frames of a set operation.
+
+        Args:
+            name (str): Filename the result is saved as.
+            frames (dict|iterable): Frames and timestamps of the result.
+            options (dict): Whether to encode with L2/L3 headers and as
+                pcapng.
+        """
+        self.name = name
+        self.frames = frames
+        self.options = options
+        self.saved = False
+        self.directory = ''
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get_frame_pairs(self):
+        """Get the frames of the result.
+
+        Returns:
+            (iterable): (<frame>, <timestamp>) pairs.
+        """
+        if isinstance(self.frames, dict):
+            return self.frames.items()
+        return self.frames
+
+    def get_time_bounds(self):
+        """Get the first and last timestamp of the result without saving it.
+
+        Returns:
+            (tuple): (<first ns>, <last ns>) or () if the result is empty.
+        """
+        if hasattr(self.frames, 'get_time_bounds'):
+            return self.frames.get_time_bounds()
+        timestamps = [
+            parse_timestamp(timestamp)
+            for _, timestamp in self.get_frame_pairs()
+        ]
+        if not timestamps:
+            return ()
+        return min(timestamps), max(timestamps)
+
+    def save(self, directory=''):
+        """Save the result as a pcap (once).
+
+        Args:
+            directory (str): Directory to save it in ('' for the CWD).
+        Returns:
+            (str): Filename of the saved pcap.
+        """
+        if not self.saved:
+            self.directory = directory
+            save.save_pcap(
+                pcap_dict=self.frames,
+                name=os.path.join(directory, self.name),
+                options=self.options)
+            self.saved = True
+        return os.path.join(self.directory, self.name)
+
+    def write(self, pcap_file):
+        """Write the result as a pcap to a binary stream without saving it.
+
+        Args:
+            pcap_file (file): Binary file object like stdout or a pipe.
+        """
+        save.write_capture(pcap_file, self.frames, self.options)
+
+
+def save_results(set_results, directory='', workers=1):
+    """Save results as pcaps, up to workers at a time.
+
+    Args:
+        set_results (list): SetResults to save.
+        directory (str): Directory to save them in ('' for the CWD).
+        workers (int): Number of writer threads (0 for one per CPU).
+    Returns:
+        (list): Filenames of the saved pcaps, in the order of set_results.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(set_results))
+    if workers <= 1:
+        return [set_result.save(directory) for set_result in set_results]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        return list(
+            pool.map(lambda set_result: set_result.save(directory),
+                     set_results))
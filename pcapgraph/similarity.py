@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Find which of many pcaps saw the same traffic.
+
+Each pcap is reduced to a MinHash signature of its frame fingerprints: the
+minimum of each of MINHASH_PERMUTATIONS hash functions over its frames. The
+share of equal minimums of two signatures estimates the Jaccard similarity
+of their frames.
+
+Comparing every pair of thousands of signatures is slow, so signatures are
+cut into LSH_BANDS bands. Only pcaps with an identical band are compared,
+which finds pairs above ~(1 / LSH_BANDS) ** (1 / rows per band) similarity
+(~42%) with high probability.
+"""
+import concurrent.futures
+import itertools
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from pcapgraph.estimate import iter_fingerprint_chunks
+
+MINHASH_PERMUTATIONS = 128
+MINHASH_SEED = 2018
+LSH_BANDS = 32
+LSH_THRESHOLD = (1 / LSH_BANDS)**(LSH_BANDS / MINHASH_PERMUTATIONS)
+# Signature of a pcap without frames. Hashes are 32 bit.
+EMPTY_HASH = 2**32
+# Frames hashed at once (hashes take PERMUTATIONS * 8 bytes per frame).
+HASH_CHUNK_FRAMES = 4096
+# Pcap names are not shown on larger heatmaps.
+MAX_HEATMAP_LABELS = 50
+
+
+def get_hash_coefficients():
+    """Get the multipliers and increments of the MinHash hash functions.
+
+    Returns:
+        (tuple): Odd uint64 multipliers and uint64 increments.
+    """
+    random_state = np.random.RandomState(MINHASH_SEED)
+    halves = random_state.randint(
+        0, 2**32, size=(4, MINHASH_PERMUTATIONS), dtype=np.uint64)
+    multipliers = (halves[0] << np.uint64(32)) | halves[1] | np.uint64(1)
+    increments = (halves[2] << np.uint64(32)) | halves[3]
+    return multipliers, increments
+
+
+def get_signature(filename, options):
+    """Get the MinHash signature of a pcap's frames.
+
+    Hashes are the top 32 bits of multiply-add on 64 bit fingerprints.
+
+    Args:
+        filename (str): Name of packet capture.
+        options (dict): Whether to strip L2 and L3 headers.
+    Returns:
+        (np.ndarray): uint64 signature of MINHASH_PERMUTATIONS minimums.
+    """
+    multipliers, increments = get_hash_coefficients()
+    signature = np.full(MINHASH_PERMUTATIONS, EMPTY_HASH, dtype=np.uint64)
+    for fingerprints in iter_fingerprint_chunks(filename, options):
+        fingerprints = np.unique(fingerprints)
+        for start in range(0, len(fingerprints), HASH_CHUNK_FRAMES):
+            chunk = fingerprints[start:start + HASH_CHUNK_FRAMES]
+            hashes = (multipliers[:, None] * chunk[None, :] +
+                      increments[:, None]) >> np.uint64(32)
+            signature = np.minimum(signature, hashes.min(axis=1))
+    return signature
+
+
+def get_signatures(filenames, options):
+    """Get the signature of every pcap, on options['workers'] processes.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers and the number
+            of 'workers' (0 for one per CPU).
+    Returns:
+        (np.ndarray): Signatures of shape (len(filenames),
+            MINHASH_PERMUTATIONS).
+    """
+    workers = options.get('workers', 1) or os.cpu_count() or 1
+    if workers <= 1 or len(filenames) <= 1:
+        signatures = [get_signature(file, options) for file in filenames]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            signatures = list(
+                pool.map(get_signature, filenames,
+                         itertools.repeat(options),
+                         chunksize=max(len(filenames) // (workers * 4), 1)))
+    return np.array(signatures, dtype=np.uint64).reshape(
+        len(filenames), MINHASH_PERMUTATIONS)
+
+
+def get_candidate_pairs(signatures):
+    """Find pairs of pcaps that have at least one identical band.
+
+    Args:
+        signatures (np.ndarray): Signatures (see get_signatures).
+    Returns:
+        (set): {(<pcap index>, <greater pcap index>), ...}
+    """
+    rows_per_band = MINHASH_PERMUTATIONS // LSH_BANDS
+    non_empty = np.flatnonzero((signatures != EMPTY_HASH).any(axis=1))
+    candidate_pairs = set()
+    for band in range(LSH_BANDS):
+        band_signatures = signatures[:, band * rows_per_band:(band + 1) *
+                                     rows_per_band]
+        buckets = {}
+        for pcap_index in non_empty.tolist():
+            buckets.setdefault(band_signatures[pcap_index].tobytes(),
+                               []).append(pcap_index)
+        for bucket in buckets.values():
+            candidate_pairs.update(itertools.combinations(bucket, 2))
+    return candidate_pairs
+
+
+def get_similar_pairs(signatures):
+    """Estimate the similarity of candidate pairs, most similar first.
+
+    Args:
+        signatures (np.ndarray): Signatures (see get_signatures).
+    Returns:
+        (list): [(<similarity 0-1>, <pcap index>, <pcap index>), ...]
+    """
+    similar_pairs = [(float(
+        np.mean(signatures[first] == signatures[second])), first, second)
+                     for first, second in get_candidate_pairs(signatures)]
+    return sorted(similar_pairs, key=lambda pair: (-pair[0], pair[1:]))
+
+
+def get_cluster_order(similar_pairs, pcap_count):
+    """Order pcaps so that pcaps in the same cluster are next to each other.
+
+    Pcaps are clustered by single linkage of pairs above LSH_THRESHOLD.
+    Larger clusters come first.
+
+    Args:
+        similar_pairs (list): See get_similar_pairs.
+        pcap_count (int): Number of pcaps.
+    Returns:
+        (list): Pcap indices in heatmap order.
+    """
+    parents = list(range(pcap_count))
+    for similarity, first, second in similar_pairs:
+        if similarity >= LSH_THRESHOLD:
+            parents[get_root(parents, first)] = get_root(parents, second)
+    clusters = {}
+    for pcap_index in range(pcap_count):
+        clusters.setdefault(get_root(parents, pcap_index),
+                            []).append(pcap_index)
+    ordered_clusters = sorted(
+        clusters.values(), key=lambda cluster: (-len(cluster), cluster[0]))
+    return [
+        pcap_index for cluster in ordered_clusters for pcap_index in cluster
+    ]
+
+
+def get_root(parents, pcap_index):
+    """Find the first pcap of a cluster (union-find with path halving).
+
+    Args:
+        parents (list): Parent of each pcap in its cluster.
+        pcap_index (int): Index of a pcap.
+    Returns:
+        (int): Index of the pcap that represents its cluster.
+    """
+    while parents[pcap_index] != pcap_index:
+        parents[pcap_index] = parents[parents[pcap_index]]
+        pcap_index = parents[pcap_index]
+    return pcap_index
+
+
+def make_similarity_text(filenames, similar_pairs):
+    """Make the text of the sorted similarity list.
+
+    Args:
+        filenames (list): List of filenames.
+        similar_pairs (list): See get_similar_pairs.
+    Returns:
+        (str): One line per similar pair.
+    """
+    result_string = "{: <12} {: <}".format('\nSIMILARITY', 'PCAP NAMES')
+    for similarity, first, second in similar_pairs:
+        result_string += "\n{: <12} {: <}".format(
+            str(round(100 * similarity)) + '%',
+            filenames[first] + '  ' + filenames[second])
+    return result_string
+
+
+def draw_heatmap(filenames, similar_pairs):
+    """Draw the similarity of all pcaps with clusters next to each other.
+
+    Args:
+        filenames (list): List of filenames.
+        similar_pairs (list): See get_similar_pairs.
+    """
+    pcap_count = len(filenames)
+    similarities = np.eye(pcap_count)
+    for similarity, first, second in similar_pairs:
+        similarities[first, second] = similarities[second, first] = similarity
+    order = get_cluster_order(similar_pairs, pcap_count)
+    plt.figure(figsize=(10, 8))
+    plt.imshow(similarities[np.ix_(order, order)], cmap='viridis',
+               vmin=0, vmax=1)
+    plt.colorbar(label='Estimated Jaccard similarity')
+    if pcap_count <= MAX_HEATMAP_LABELS:
+        labels = [os.path.basename(filenames[index]) for index in order]
+        plt.xticks(range(pcap_count), labels, rotation=90, fontsize=7)
+        plt.yticks(range(pcap_count), labels, fontsize=7)
+    plt.title('Traffic seen by the same pcaps')
+    plt.tight_layout()
+
+
+def output_similarity(filenames, options, output_fmts):
+    """Print the similar pairs of pcaps and draw their heatmap.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers and the number
+            of 'workers'.
+        output_fmts (list): 'txt' and/or image formats (see draw_graph).
+            Without any, the heatmap is shown on screen.
+    """
+    similar_pairs = get_similar_pairs(get_signatures(filenames, options))
+    similarity_text = make_similarity_text(filenames, similar_pairs)
+    print(similarity_text)
+    image_fmts = [fmt for fmt in output_fmts if fmt != 'txt']
+    if 'txt' in output_fmts:
+        with open('pcap_similarity.txt', 'w') as file:
+            file.write(similarity_text)
+        print("Text file successfully created!")
+    if image_fmts or not output_fmts:
+        draw_heatmap(filenames, similar_pairs)
+    for save_format in image_fmts:
+        plt.savefig('pcap_similarity.' + save_format, format=save_format)
+        print(save_format, "file successfully created in ", os.getcwd(),
+              "!")
+    if not output_fmts:
+        plt.show()
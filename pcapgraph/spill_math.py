@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Do set operations on pcaps that do not fit in memory.
+
+Every frame of every pcap is written to one of several bucket files on disk,
+chosen by its fingerprint. Identical frames always land in the same bucket,
+so each bucket can be loaded and evaluated on its own with the same rules as
+PcapMath. Only one bucket is in memory at a time.
+
+Bucket and result records are `<pcap index><timestamp><sequence><length>`
+`<source offset><source length><linktype>` followed by the frame bytes. The
+sequence number is the position of the frame across all pcaps, which breaks
+ties between the most common frames like collections.Counter would. The
+source fields say where the frame is in its pcap (see
+read_file.iter_frame_sources), so that results of stripped frames can be
+saved as the frames were captured, like PcapMath's.
+"""
+import heapq
+import math
+import os
+import re
+import struct
+import tempfile
+
+from pcapgraph.compressed_file import get_uncompressed_size
+from pcapgraph.frame_table import SOURCE_CHUNK_FRAMES
+from pcapgraph.frame_table import iter_chunks
+from pcapgraph.manipulate_frames import is_stripped
+from pcapgraph.manipulate_frames import strip_frame
+from pcapgraph.manipulate_frames import get_frame_fingerprint
+from pcapgraph.pcap_math import MOST_COMMON_FRAMES
+from pcapgraph.pcap_math import PcapMath
+from pcapgraph.planner import get_memory_budget
+from pcapgraph.read_file import FrameReader
+from pcapgraph.read_file import iter_frame_sources
+from pcapgraph.sampling import is_sampled
+from pcapgraph.read_file import format_timestamp
+from pcapgraph.set_result import SetResult
+
+# Bytes of memory per byte of pcap in a loaded bucket (hex str + dict).
+BUCKET_OVERHEAD = 4
+# Stay well below the open file limit of most systems.
+MAX_BUCKETS = 512
+RECORD_HEADER = struct.Struct('<HqQIqIH')
+SPILL_OPERATIONS = [
+    'difference', 'intersection', 'symmetric-difference', 'union'
+]
+
+
+def parse_size(size):
+    """Convert a size like 512M or 2G to bytes.
+
+    Args:
+        size (str): Number with optional K, M, G or T suffix (powers of 1024).
+    Returns:
+        (int): Size in bytes.
+    Raises:
+        SyntaxError: If size is not a valid size.
+    """
+    size_match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$',
+                          str(size), re.I)
+    if not size_match:
+        raise SyntaxError("\nERROR: " + str(size) + " is not a valid size "
+                          "(examples: 512M, 2G).")
+    multiplier = 1024**' KMGT'.index(size_match.group(2).upper() or ' ')
+    return int(float(size_match.group(1)) * multiplier)
+
+
+def write_record(file, pcap_index, timestamp, sequence, frame,
+                 source=(-1, 0, 0)):
+    """Append a frame record to a bucket or result file.
+
+    Args:
+        file (file): Binary file opened for writing.
+        pcap_index (int): Index of the pcap the frame is from.
+        timestamp (int): Timestamp of the frame in ns.
+        sequence (int): Position of the frame across all pcaps.
+        frame (bytes): Raw frame.
+        source (tuple): (<offset>, <length>, <linktype>) of the frame as it
+            was captured. Offset is -1 if it is unknown.
+    """
+    file.write(RECORD_HEADER.pack(pcap_index, timestamp, sequence,
+                                  len(frame), *source))
+    file.write(frame)
+
+
+def iter_records(filename):
+    """Yield the records of a bucket or result file.
+
+    Args:
+        filename (str): Path of file written by write_record.
+    Yields:
+        (tuple): (<pcap index>, <timestamp ns>, <sequence>, <frame bytes>,
+            <source>) where source is as in write_record.
+    """
+    with open(filename, 'rb') as file:
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            pcap_index, timestamp, sequence, frame_len, *source = \
+                RECORD_HEADER.unpack(header)
+            yield pcap_index, timestamp, sequence, file.read(frame_len), \
+                tuple(source)
+
+
+def load_bucket(bucket_name):
+    """Load a bucket and merge the records of identical frames.
+
+    Args:
+        bucket_name (str): Filename of bucket.
+    Returns:
+        (dict): {<frame>: [<pcap bitmask>, <timestamp>, <first sequence>,
+            <count>, (<pcap index>, *<source>)], ...} where source is as in
+            write_record.
+    """
+    bucket_frames = {}
+    for pcap_index, timestamp, sequence, frame, source in \
+            iter_records(bucket_name):
+        entry = bucket_frames.setdefault(frame, [0, 0, sequence, 0, None])
+        entry[0] |= 1 << pcap_index
+        # Like get_flat_frame_dict, the last timestamp wins.
+        entry[1] = timestamp
+        entry[3] += 1
+        # Like FrameTable.get_source_frames, the pivot's frame is saved.
+        if entry[4] is None or entry[4][0]:
+            entry[4] = (pcap_index, ) + source
+    return bucket_frames
+
+
+class SpilledFrames:
+    """Frames of a result that were spilled to disk.
+
+    Can be passed to save.save_pcap like a list of (frame, timestamp) pairs.
+    Frames are only read back from disk while iterating. If source_names
+    are set and the sources of all frames are known, frames are saved as
+    they were captured with original_linktype, like FrameSelection.
+    """
+
+    def __init__(self, filename, spill_tempdir=None, source_names=None):
+        """Open result file for writing.
+
+        Args:
+            filename (str): Path of the result file.
+            spill_tempdir (TemporaryDirectory): Directory of the file. It is
+                kept until the result is no longer used.
+            source_names (list): Names of the pcaps that frames are read
+                from as they were captured, or None to save them as they are.
+        """
+        self.filename = filename
+        self.spill_tempdir = spill_tempdir
+        self.source_names = source_names
+        self.source_linktypes = set()
+        self.file = open(filename, 'wb')
+        self.count = 0
+        self.time_bounds = ()
+
+    def append(self, timestamp, sequence, frame, source=None):
+        """Add a frame to the result.
+
+        Args:
+            timestamp (int): Timestamp of the frame in ns.
+            sequence (int): Position of the frame in the result.
+            frame (bytes): Raw frame.
+            source (tuple): (<pcap index>, <offset>, <length>, <linktype>)
+                of the frame as it was captured, or None if unknown.
+        """
+        pcap_index, *source = source or (0, -1, 0, 0)
+        write_record(self.file, pcap_index, timestamp, sequence, frame,
+                     source)
+        self.source_linktypes.add(source[2] if source[0] >= 0 else None)
+        self.count += 1
+        if self.time_bounds:
+            self.time_bounds = (min(self.time_bounds[0], timestamp),
+                                max(self.time_bounds[1], timestamp))
+        else:
+            self.time_bounds = (timestamp, timestamp)
+
+    def close(self):
+        """Finish writing the result file."""
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def get_time_bounds(self):
+        """Get the first and last timestamp without reading the file.
+
+        Returns:
+            (tuple): (<first ns>, <last ns>) or () if the result is empty.
+        """
+        return self.time_bounds
+
+    @property
+    def original_linktype(self):
+        """Linktype of the frames as captured, or None if not saved so."""
+        if not self.source_names or len(self.source_linktypes) != 1:
+            return None
+        return next(iter(self.source_linktypes))
+
+    def get_linktypes(self):
+        """Get the linktypes that the frames were captured with.
+
+        Returns:
+            (list): Sorted linktypes of the frames whose source is known.
+        """
+        return sorted(linktype for linktype in self.source_linktypes
+                      if linktype is not None)
+
+    def iter_linktype_records(self):
+        """Yield records as they are with the linktype of each frame.
+
+        Yields:
+            (tuple): (<timestamp ns>, <frame bytes>, <linktype>)
+        """
+        for _, timestamp, _, frame, (_, _, linktype) in \
+                iter_records(self.filename):
+            yield timestamp, frame, linktype
+
+    def __iter__(self):
+        """Yield frames as (<frame>, <timestamp>). save_pcap orders them."""
+        for _, timestamp, _, frame, _ in iter_records(self.filename):
+            yield frame.hex(), format_timestamp(timestamp)
+
+    def iter_records(self):
+        """Yield frames as (<timestamp ns>, <frame bytes>) like __iter__.
+
+        If original_linktype is set, frames are as they were captured.
+        """
+        if self.original_linktype is None:
+            for _, timestamp, _, frame, _ in iter_records(self.filename):
+                yield timestamp, frame
+            return
+        sources = (
+            (pcap_index, offset, length, timestamp)
+            for pcap_index, timestamp, _, _, (offset, length, _) in
+            iter_records(self.filename))
+        with FrameReader(self.source_names) as frame_reader:
+            for chunk in iter_chunks(sources, SOURCE_CHUNK_FRAMES):
+                # Captures are read front to back, then frames are put back
+                # in result order.
+                frames = {
+                    source[:2]: frame_reader.read(*source[:3])
+                    for source in sorted(chunk)
+                }
+                for source in chunk:
+                    yield source[3], frames[source[:2]]
+
+
+class SpillPcapMath(PcapMath):
+    """Do set operations like PcapMath with on-disk hash partitions.
+
+    Files are not read in __init__. All requested operations are evaluated
+    together, one bucket at a time, when get_set_results is called. Results
+    stay in a temporary directory until this object is deleted.
+    Bounded intersections need every frame of each pcap in order, so
+    planner.choose_engine only runs them with PcapMath.
+    """
+
+    def __init__(self, filenames, options):
+        """Prepare SpillPcapMath object. No files are read here.
+
+        Args:
+            filenames (list): List of filenames.
+            options (dict): Whether to strip L2 and L3 headers and the
+                'max-memory' budget in bytes (0/None for available memory).
+        """
+        # pylint: disable=super-init-not-called
+        self.filenames = filenames
+        self.exclude_empty = False
+        self.options = options
+        self.spill_dir = None
+        self.spill_tempdir = None
+        self.spill_results = {}
+        self.most_common_frames = {}
+        self.frame_counts = [0] * len(filenames)
+
+    def get_bucket_count(self):
+        """Get the number of buckets so that one bucket fits in memory.
+
+        Returns:
+            (int): Number of buckets.
+        """
+        max_memory = get_memory_budget(self.options) or 2**30
+        total_size = sum(
+            get_uncompressed_size(file) for file in self.filenames)
+        bucket_count = math.ceil(total_size * BUCKET_OVERHEAD / max_memory)
+        return min(max(bucket_count, 1), MAX_BUCKETS)
+
+    def get_set_results(self, args):
+        """Partition pcaps and evaluate all requested operations.
+
+        Args:
+            args (dict): Dict of all arguments (including set args).
+        Returns:
+            (list): SetResults of all operations, in the order of the flags.
+        """
+        operations = [op for op in SPILL_OPERATIONS if args['--' + op]]
+        if operations:
+            # Removed with its contents when this object is deleted.
+            self.spill_tempdir = tempfile.TemporaryDirectory(
+                prefix='pcapgraph-')
+            self.spill_dir = self.spill_tempdir.name
+            bucket_names = self.partition_pcaps()
+            self.spill_results = self.get_spill_results(
+                bucket_names, operations)
+        return super().get_set_results(args)
+
+    def partition_pcaps(self):
+        """Write every sampled frame of every pcap to its bucket.
+
+        Returns:
+            (list): Filenames of buckets.
+        """
+        bucket_count = self.get_bucket_count()
+        bucket_names = [
+            os.path.join(self.spill_dir, 'bucket' + str(bucket_num))
+            for bucket_num in range(bucket_count)
+        ]
+        buckets = [open(name, 'wb') for name in bucket_names]
+        sequence = 0
+        self.frame_counts = [0] * len(self.filenames)
+        try:
+            for pcap_index, filename in enumerate(self.filenames):
+                for timestamp, frame, linktype, offset in \
+                        iter_frame_sources(filename):
+                    frame_raw = strip_frame(frame.hex(), linktype,
+                                            self.options)
+                    if not is_sampled(frame_raw, self.options):
+                        continue
+                    bucket_num = \
+                        get_frame_fingerprint(frame_raw) % bucket_count
+                    write_record(buckets[bucket_num], pcap_index, timestamp,
+                                 sequence, bytes.fromhex(frame_raw),
+                                 (offset, len(frame), linktype))
+                    sequence += 1
+                    self.frame_counts[pcap_index] += 1
+        finally:
+            for bucket in buckets:
+                bucket.close()
+
+        return bucket_names
+
+    def get_spill_results(self, bucket_names, operations):
+        """Evaluate operations bucket by bucket.
+
+        Args:
+            bucket_names (list): Filenames of buckets.
+            operations (list): Operations in SPILL_OPERATIONS to evaluate.
+        Returns:
+            (dict): {(<operation>, <pcap index>): SpilledFrames, ...}
+        """
+        results = {}
+        most_common = []  # Heap of (count, -first sequence, frame)
+        source_names = self.filenames if is_stripped(self.options) else None
+        for bucket_name in bucket_names:
+            bucket_frames = load_bucket(bucket_name)
+            os.remove(bucket_name)
+            for frame, (pcap_mask, timestamp, sequence, count, source) in \
+                    bucket_frames.items():
+                if 'union' in operations and count > 1:
+                    heapq.heappush(most_common, (count, -sequence, frame))
+                    if len(most_common) > MOST_COMMON_FRAMES:
+                        heapq.heappop(most_common)
+                for result_key in self.get_result_keys(pcap_mask, operations):
+                    if result_key not in results:
+                        results[result_key] = SpilledFrames(
+                            os.path.join(self.spill_dir,
+                                         '-'.join(map(str, result_key))),
+                            self.spill_tempdir, source_names)
+                    results[result_key].append(timestamp, sequence, frame,
+                                               source)
+
+        for result in results.values():
+            result.close()
+        # In order of first appearance, like collections.Counter would be.
+        self.most_common_frames = {
+            frame.hex(): count
+            for count, _, frame in sorted(
+                most_common, key=lambda common: -common[1])
+        }
+        return results
+
+    def get_result_keys(self, pcap_mask, operations):
+        """Get the results that a frame seen by the pcaps in pcap_mask is in.
+
+        Args:
+            pcap_mask (int): Bitmask of the pcaps that have the frame.
+            operations (list): Operations in SPILL_OPERATIONS to evaluate.
+        Returns:
+            (list): [(<operation>, <pcap index>), ...]
+        """
+        result_keys = []
+        if 'union' in operations:
+            result_keys.append(('union', 0))
+        if pcap_mask == (1 << len(self.filenames)) - 1:
+            if 'intersection' in operations:
+                result_keys.append(('intersection', 0))
+        elif pcap_mask & (pcap_mask - 1) == 0:  # Seen by only one pcap
+            pcap_index = pcap_mask.bit_length() - 1
+            if 'symmetric-difference' in operations or \
+                    ('difference' in operations and pcap_index == 0):
+                result_keys.append(('difference', pcap_index))
+        return result_keys
+
+    def get_intermediate_tasks(self):
+        """Results are already spilled, so there is nothing to share."""
+        return {}
+
+    def get_union(self):
+        """Get the union and print the most common frames.
+
+        Returns:
+            (SetResult): Union of all pcaps.
+        """
+        self.print_10_most_common_frames(self.most_common_frames)
+        return SetResult('union.pcap',
+                         self.spill_results.get(('union', 0), []),
+                         self.options)
+
+    def get_intersection(self):
+        """Get the intersection.
+
+        Returns:
+            (SetResult): Intersection of all pcaps.
+        """
+        intersect_frames = self.spill_results.get(('intersection', 0), [])
+        self.print_same_percent(len(intersect_frames), self.frame_counts)
+        if not intersect_frames:
+            print('WARNING! Intersection between ', self.filenames,
+                  ' contains no packets!')
+        return SetResult('intersect.pcap', intersect_frames, self.options)
+
+    def get_difference(self, pivot_index=0):
+        """Get the difference with pivot_index as the minuend.
+
+        Args:
+            pivot_index [int]: Specify minuend by index of filename in list
+
+        Returns:
+            (SetResult): Difference or None if it is empty and excluded.
+        """
+        diff_frames = self.spill_results.get(('difference', pivot_index), [])
+        return self.get_difference_result(diff_frames, pivot_index)
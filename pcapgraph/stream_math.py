@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Do set operations in one pass over time-ordered packet captures.
+
+Packet captures taken at the same time see the same packet within a short
+time of each other. Instead of loading every capture like PcapMath, all
+captures are merged by timestamp (k-way merge) and only the frames seen in
+the last `max-skew` seconds are kept. Once a frame is older than that, every
+capture that will see it has seen it and its fate is decided:
+
+* seen by all captures: intersection
+* seen only by capture N: difference/symmetric difference of capture N
+
+Memory depends on the traffic within the skew window, not capture size:
+result frames are written to temporary files as soon as their fate is
+decided (see spill_math.SpilledFrames) and read back when they are saved.
+Like PcapMath, stripped frames are saved as the first pcap captured them
+(or as first seen if it lacks them). Frames that repeat further apart than
+the skew window are treated as separate frames, which is the only
+difference to PcapMath's results.
+"""
+import collections
+import heapq
+import os
+import tempfile
+
+from pcapgraph.manipulate_frames import is_stripped
+from pcapgraph.manipulate_frames import strip_frame
+from pcapgraph.manipulate_frames import get_frame_fingerprint
+from pcapgraph.pcap_math import PcapMath
+from pcapgraph.read_file import iter_frame_sources
+from pcapgraph.sampling import is_sampled
+from pcapgraph.set_result import SetResult
+from pcapgraph.spill_math import SpilledFrames
+
+# Default maximum clock skew between captures, in seconds.
+DEFAULT_MAX_SKEW = 2
+STREAM_OPERATIONS = [
+    'difference', 'intersection', 'symmetric-difference', 'union'
+]
+
+
+def iter_pcap_stream(filename, pcap_index, options):
+    """Yield the stripped, sampled frames of one pcap for the k-way merge.
+
+    Args:
+        filename (str): Name of packet capture.
+        pcap_index (int): Index of the packet capture in the merge.
+        options (dict): Whether to strip L2 and L3 headers and the 'sample'
+            rate.
+    Yields:
+        (tuple): (<timestamp ns>, <pcap index>, <frame>, <source>) where
+            source is (<pcap index>, <offset>, <length>, <linktype>) of the
+            frame as it was captured (see read_file.iter_frame_sources).
+    """
+    for timestamp, frame, linktype, offset in iter_frame_sources(filename):
+        frame_raw = strip_frame(frame.hex(), linktype, options)
+        if is_sampled(frame_raw, options):
+            yield timestamp, pcap_index, frame_raw, \
+                (pcap_index, offset, len(frame), linktype)
+
+
+def merge_pcap_streams(filenames, options):
+    """Merge the frames of all pcaps in timestamp order.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers.
+    Returns:
+        (iterator): (<timestamp ns>, <pcap index>, <frame>, <source>) in
+            time order, as in iter_pcap_stream.
+    """
+    streams = []
+    for pcap_index, filename in enumerate(filenames):
+        streams.append(iter_pcap_stream(filename, pcap_index, options))
+    return heapq.merge(*streams, key=lambda record: record[0])
+
+
+class StreamPcapMath(PcapMath):
+    """Do set operations like PcapMath in one streaming pass.
+
+    Files are not read in __init__. All requested operations are evaluated
+    together in a single pass when get_set_results is called.
+    Bounded intersections need the whole intersection before any frame can
+    be bounded, so planner.choose_engine only runs them with PcapMath.
+    """
+
+    def __init__(self, filenames, options):
+        """Prepare StreamPcapMath object. No files are read here.
+
+        Args:
+            filenames (list): List of filenames.
+            options (dict): Whether to strip L2 and L3 headers and the
+                'max-skew' between captures in seconds.
+        """
+        # pylint: disable=super-init-not-called
+        self.filenames = filenames
+        self.exclude_empty = False
+        self.options = options
+        self.frame_counts = [0] * len(filenames)
+        self.stream_results = {}
+        self.stream_tempdir = None
+
+    def get_set_results(self, args):
+        """Evaluate all requested set operations in one pass.
+
+        Args:
+            args (dict): Dict of all arguments (including set args).
+        Returns:
+            (list): SetResults of all operations, in the order of the flags.
+        """
+        operations = [op for op in STREAM_OPERATIONS if args['--' + op]]
+        self.stream_results = {}
+        if not operations:
+            return super().get_set_results(args)
+        # Removed with its contents when this object is deleted.
+        self.stream_tempdir = tempfile.TemporaryDirectory(prefix='pcapgraph-')
+        source_names = self.filenames if is_stripped(self.options) else None
+        for sequence, (operation, pcap_index, frame, timestamp, source) in \
+                enumerate(self.stream_set_operations(operations)):
+            key = (operation, pcap_index)
+            if key not in self.stream_results:
+                self.stream_results[key] = SpilledFrames(
+                    os.path.join(self.stream_tempdir.name,
+                                 '-'.join(map(str, key))),
+                    self.stream_tempdir, source_names)
+            self.stream_results[key].append(timestamp, sequence,
+                                            bytes.fromhex(frame), source)
+        for result_frames in self.stream_results.values():
+            result_frames.close()
+
+        return super().get_set_results(args)
+
+    def stream_set_operations(self, operations):
+        """Yield the result frames of operations as soon as they are known.
+
+        Frames are yielded when they leave the skew window, in the order
+        they were first seen. Union frames have the first timestamp they
+        were seen with.
+
+        Args:
+            operations (list): Operations in STREAM_OPERATIONS to evaluate.
+        Yields:
+            (tuple): (<operation>, <pcap index>, <frame>, <timestamp ns>,
+                <source>) pcap index is the minuend for differences and 0
+                otherwise. source is as in iter_pcap_stream, preferring the
+                first pcap's frame.
+        """
+        max_skew = int(
+            self.options.get('max-skew', DEFAULT_MAX_SKEW) * 10**9)
+        # {<fingerprint>: [<first ts>, <pcap bitmask>, <frame>, <pivot ts>,
+        #                  <source>]}
+        window = collections.OrderedDict()
+        self.frame_counts = [0] * len(self.filenames)
+        for timestamp, pcap_index, frame, source in \
+                merge_pcap_streams(self.filenames, self.options):
+            self.frame_counts[pcap_index] += 1
+            while window:
+                oldest_entry = next(iter(window.values()))
+                if timestamp - oldest_entry[0] <= max_skew:
+                    break
+                yield from self.get_window_results(
+                    window.popitem(last=False)[1], operations)
+
+            fingerprint = get_frame_fingerprint(frame)
+            entry = window.get(fingerprint)
+            if entry is None:
+                entry = [timestamp, 0, frame, timestamp, source]
+                window[fingerprint] = entry
+            elif pcap_index == 0 and not entry[1] & 1:
+                # Prefer the first pcap's timestamp and frame.
+                entry[3] = timestamp
+                entry[4] = source
+            entry[1] |= 1 << pcap_index
+
+        while window:
+            yield from self.get_window_results(
+                window.popitem(last=False)[1], operations)
+
+    def get_window_results(self, entry, operations):
+        """Yield the results of a frame that has left the skew window.
+
+        Args:
+            entry (list): [<first ts>, <pcap bitmask>, <frame>, <pivot ts>,
+                <source>]
+            operations (list): Operations in STREAM_OPERATIONS to evaluate.
+        Yields:
+            (tuple): (<operation>, <pcap index>, <frame>, <timestamp ns>,
+                <source>)
+        """
+        first_timestamp, pcap_mask, frame, pivot_timestamp, source = entry
+        all_pcaps_mask = (1 << len(self.filenames)) - 1
+        if 'union' in operations:
+            yield 'union', 0, frame, first_timestamp, source
+        if pcap_mask == all_pcaps_mask:
+            if 'intersection' in operations:
+                yield 'intersection', 0, frame, pivot_timestamp, source
+        elif pcap_mask & (pcap_mask - 1) == 0:  # Seen by only one pcap
+            pcap_index = pcap_mask.bit_length() - 1
+            if 'symmetric-difference' in operations or \
+                    ('difference' in operations and pcap_index == 0):
+                yield 'difference', pcap_index, frame, first_timestamp, \
+                    source
+
+    def get_intermediate_tasks(self):
+        """Results are already streamed, so there is nothing to share."""
+        return {}
+
+    def get_union(self):
+        """Get the streamed union.
+
+        Returns:
+            (SetResult): Union of all pcaps.
+        """
+        return SetResult('union.pcap',
+                         self.stream_results.get(('union', 0), []),
+                         self.options)
+
+    def get_intersection(self):
+        """Get the streamed intersection.
+
+        Returns:
+            (SetResult): Intersection of all pcaps.
+        """
+        intersect_frames = self.stream_results.get(('intersection', 0), [])
+        self.print_same_percent(len(intersect_frames), self.frame_counts)
+        if not intersect_frames:
+            print('WARNING! Intersection between ', self.filenames,
+                  ' contains no packets!')
+        return SetResult('intersect.pcap', intersect_frames, self.options)
+
+    def get_difference(self, pivot_index=0):
+        """Get the streamed difference with pivot_index as the minuend.
+
+        Args:
+            pivot_index [int]: Specify minuend by index of filename in list
+
+        Returns:
+            (SetResult): Difference or None if it is empty and excluded.
+        """
+        diff_frames = self.stream_results.get(('difference', pivot_index),
+                                              [])
+        return self.get_difference_result(diff_frames, pivot_index)
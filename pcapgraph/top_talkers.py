@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Find the frames, flows or hosts seen most often across pcaps.
+
+Frames are streamed once from every pcap into a Space-Saving summary that
+keeps TOP_TALKER_COUNTERS_PER_K counters per talker asked for, however many
+frames and distinct talkers there are. A talker that isn't counted takes
+the counter with the lowest count, inheriting that count as its maximum
+error. Every talker seen more than <frames> / <counters> times is kept, and
+a count is never more than its error too high.
+
+Talkers are counted by:
+
+* frame: the (stripped) frame, as in the union's most common frames
+* flow: IP protocol, source and destination address and port
+* mac: source MAC address (Ethernet)
+* ip: source IP address
+"""
+import heapq
+import ipaddress
+import itertools
+
+from pcapgraph.manipulate_frames import get_l2_header_len
+from pcapgraph.manipulate_frames import strip_frame
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import convert_to_pcaptext
+
+TOP_TALKER_COUNTERS_PER_K = 10
+MIN_TOP_TALKER_COUNTERS = 1000
+IP_PROTOCOLS = {1: 'ICMP', 6: 'TCP', 17: 'UDP', 58: 'ICMPv6', 132: 'SCTP'}
+# IP protocols that start with source and destination ports.
+PORT_PROTOCOLS = [6, 17, 132]
+
+
+class SpaceSaving:
+    """Count the most frequent keys of a stream in a fixed number of counters.
+    """
+
+    def __init__(self, capacity):
+        """Start without counters.
+
+        Args:
+            capacity (int): Maximum number of keys counted at once.
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, insertion, key). Counts only grow, so entries
+        # are checked against self.counts when popped.
+        self.heap = []
+        self.insertions = itertools.count()
+
+    def add(self, key):
+        """Count one occurrence of key.
+
+        Args:
+            key (str): Frame, flow or host.
+        """
+        if key in self.counts:
+            self.counts[key] += 1
+            return
+        error = 0
+        if len(self.counts) >= self.capacity:
+            error = self.pop_min()
+        self.counts[key] = error + 1
+        self.errors[key] = error
+        heapq.heappush(self.heap, (error + 1, next(self.insertions), key))
+
+    def pop_min(self):
+        """Remove the key with the lowest count.
+
+        Returns:
+            (int): Count of the removed key.
+        """
+        while True:
+            count, insertion, key = heapq.heappop(self.heap)
+            if self.counts[key] == count:
+                del self.counts[key]
+                del self.errors[key]
+                return count
+            heapq.heappush(self.heap, (self.counts[key], insertion, key))
+
+    def get_top(self, top_count):
+        """Get the keys with the highest counts.
+
+        Ties are in order of first count.
+
+        Args:
+            top_count (int): Number of keys.
+        Returns:
+            (list): [(<key>, <count>, <max overcount>), ...]
+        """
+        return [(key, self.counts[key], self.errors[key])
+                for key in heapq.nlargest(top_count, self.counts,
+                                          key=self.counts.__getitem__)]
+
+
+def get_talker_key(frame_raw, linktype, top_by):
+    """Get what a frame is counted as.
+
+    Args:
+        frame_raw (str): ASCII hex of the (stripped) frame.
+        linktype (int): pcap linktype of the frame.
+        top_by (str): One of frame, flow, mac, ip.
+    Returns:
+        (str): Key of the frame or '' if it has no such key.
+    """
+    if top_by == 'frame':
+        return frame_raw
+    if top_by == 'mac':
+        if linktype != 1:
+            return ''
+        return ':'.join(
+            frame_raw[pos:pos + 2] for pos in range(12, 24, 2))
+    five_tuple = get_five_tuple(frame_raw, linktype)
+    if not five_tuple:
+        return ''
+    protocol, src, src_port, dst, dst_port = five_tuple
+    if top_by == 'ip':
+        return src
+    protocol_name = IP_PROTOCOLS.get(protocol, str(protocol))
+    if src_port is not None:
+        return '{} {}:{} -> {}:{}'.format(protocol_name, src, src_port, dst,
+                                          dst_port)
+    return '{} {} -> {}'.format(protocol_name, src, dst)
+
+
+def get_five_tuple(frame_raw, linktype):
+    """Decode the IP protocol, addresses and ports of a frame.
+
+    Args:
+        frame_raw (str): ASCII hex of the frame.
+        linktype (int): pcap linktype of the frame.
+    Returns:
+        (tuple): (<protocol>, <source IP>, <source port>, <destination IP>,
+            <destination port>) with ports None if the protocol has none,
+            or () if the frame isn't IPv4 or IPv6.
+    """
+    l2_len = get_l2_header_len(frame_raw, linktype)
+    if l2_len is None:
+        return ()
+    ip_raw = frame_raw[l2_len:]
+    if ip_raw[:1] == '4' and len(ip_raw) >= 40:
+        header_len = int(ip_raw[1:2], 16) * 8
+        protocol = int(ip_raw[18:20], 16)
+        addresses = ip_raw[24:32], ip_raw[32:40]
+    elif ip_raw[:1] == '6' and len(ip_raw) >= 80:
+        header_len = 80
+        protocol = int(ip_raw[12:14], 16)
+        addresses = ip_raw[16:48], ip_raw[48:80]
+    else:
+        return ()
+    src, dst = [
+        str(ipaddress.ip_address(bytes.fromhex(address)))
+        for address in addresses
+    ]
+    ports = ip_raw[header_len:header_len + 8]
+    if protocol in PORT_PROTOCOLS and len(ports) == 8:
+        return protocol, src, int(ports[:4], 16), dst, int(ports[4:], 16)
+    return protocol, src, None, dst, None
+
+
+def get_top_talkers(filenames, options, top_count, top_by):
+    """Stream every frame of every pcap and find the top talkers.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers.
+        top_count (int): Number of talkers.
+        top_by (str): What to count frames as (frame, flow, mac or ip).
+    Returns:
+        (tuple): (<frames>, [(<talker>, <count>, <max overcount>), ...])
+    """
+    summary = SpaceSaving(
+        max(top_count * TOP_TALKER_COUNTERS_PER_K, MIN_TOP_TALKER_COUNTERS))
+    frame_count = 0
+    for filename in filenames:
+        for _, frame, linktype in iter_frames(filename):
+            frame_count += 1
+            frame_raw = frame.hex()
+            if top_by == 'frame':
+                frame_raw = strip_frame(frame_raw, linktype, options)
+            key = get_talker_key(frame_raw, linktype, top_by)
+            if key:
+                summary.add(key)
+    return frame_count, summary.get_top(top_count)
+
+
+def print_top_talkers(filenames, options, top_count, top_by):
+    """Print the top talkers of all pcaps with their counts.
+
+    Args:
+        filenames (list): List of filenames.
+        options (dict): Whether to strip L2 and L3 headers.
+        top_count (int): Number of talkers.
+        top_by (str): What to count frames as (frame, flow, mac or ip).
+    Raises:
+        SyntaxError: If top_count or top_by are not valid.
+    """
+    if top_by not in ['frame', 'flow', 'mac', 'ip'] or top_count < 1:
+        raise SyntaxError("\nERROR: --top-talkers needs a count of at least "
+                          "1 and --top-by one of frame, flow, mac, ip.")
+    frame_count, top_talkers = get_top_talkers(filenames, options, top_count,
+                                               top_by)
+    row_format = "{: <12} {: <12} {: <}"
+    print(row_format.format('\nCOUNT', 'MAX ERROR', 'TOP ' + top_by.upper()))
+    for talker, count, error in top_talkers:
+        if top_by == 'frame':
+            talker = '\n' + convert_to_pcaptext(talker)
+        print(row_format.format(str(count), str(error), talker))
+    print("Counted", frame_count, "frames of", len(filenames), "pcaps. "
+          "Counts are at most MAX ERROR too high.")
@@ -18,18 +18,41 @@ def setup_testenv():
 DEFAULT_CLI_ARGS = {
     '--anonymize': False,
     '--bounded-intersection': False,
+    '--cache': None,
+    '--cache-size': '1G',
+    '--compress': None,
     '--difference': False,
+    '--engine': 'auto',
+    '--estimate': False,
     '--exclude-empty': False,
+    '--export': None,
+    '--export-flows': False,
     '--help': False,
     '--intersection': False,
+    '--max-memory': None,
+    '--max-skew': '2',
     '--inverse-bounded': False,
+    '--multiset': False,
+    '--multiset-union': 'max',
     '--output': [],
     '--strip-l2': False,
+    '--state': None,
+    '--similarity': False,
+    '--overlap': False,
+    '--sample': '1',
+    '--top-by': 'frame',
+    '--top-talkers': None,
+    '--stream': False,
     '--strip-l3': False,
     '--symmetric-difference': False,
     '--union': False,
     '--verbose': False,
+    '--writer': 'native',
+    '--sink': '.',
+    '--split-interval': None,
+    '--split-size': None,
     '--version': False,
+    '--workers': '1',
     '-w': False,
     '<file>': [],
 }
@@ -113,6 +136,13 @@ Count: 3
 0050  26 27 28 29 2a 2b 2c 2d 2e 2f 30 31 32 33 34 35
 0060  36 37
 
+Count: 3
+0000  88 15 44 ab bf dd 24 77 03 51 13 44 08 00 45 00
+0010  00 38 21 34 00 00 40 11 b1 c1 0a 30 12 90 0a 80
+0020  80 80 d4 dc 00 35 00 24 b1 40 a3 eb 01 00 00 01
+0030  00 00 00 00 00 00 06 61 6d 61 7a 6f 6e 03 63 6f
+0040  6d 00 00 01 00 01
+
 To view the content of these packets, subtract the count lines,
 add and save to <textfile>, and then run
 
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test archive.py."""
+
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from pcapgraph import archive as archive_module
+from pcapgraph.archive import REWIND_BYTES
+from pcapgraph.archive import get_archive_members, get_archive_type
+from pcapgraph.archive import is_random_access, split_member
+from pcapgraph.compressed_file import get_uncompressed_size
+from pcapgraph.get_filenames import get_filenames
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import write_pcap
+from tests import setup_testenv
+
+
+class TestArchive(unittest.TestCase):
+    """Test archive.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Make a tar.gz, a tar and a zip of simul pcaps and a text file."""
+        setup_testenv()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.frames = {
+            name: list(iter_frames('examples/' + name))
+            for name in ['simul1.pcap', 'simul2.pcap', 'simul3.pcap']
+        }
+        members = []
+        for member, source in [('logs/simul1.pcap', 'examples/simul1.pcap'),
+                               ('logs/simul2.pcap.gz', 'examples/simul2.pcap'),
+                               ('notes.txt', None),
+                               ('simul3.pcap', 'examples/simul3.pcap')]:
+            data = b'Not a packet capture'
+            if source:
+                with open(source, 'rb') as capture:
+                    data = capture.read()
+            if member.endswith('.gz'):
+                data = gzip.compress(data)
+            members.append((member, data))
+        self.archives = {}
+        for archive_name, mode in [('bundle.tar.gz', 'w:gz'),
+                                   ('bundle.tar', 'w'),
+                                   ('bundle.zip', None)]:
+            name = os.path.join(self.temp_dir.name, archive_name)
+            self.archives[archive_name] = name
+            archive = tarfile.open(name, mode) if mode else \
+                zipfile.ZipFile(name, 'w')
+            with archive:
+                for member, data in members:
+                    add_member(archive, member, data)
+
+    def tearDown(self):
+        """Remove archives."""
+        self.temp_dir.cleanup()
+
+    def test_get_archive_type(self):
+        """Archives are recognized by their (decompressed) first bytes."""
+        self.assertEqual(get_archive_type(self.archives['bundle.tar.gz']),
+                         'tar')
+        self.assertEqual(get_archive_type(self.archives['bundle.tar']), 'tar')
+        self.assertEqual(get_archive_type(self.archives['bundle.zip']), 'zip')
+        self.assertEqual(get_archive_type('examples/simul1.pcap'), '')
+
+    def test_read_members(self):
+        """Captures in archives are found and read without extracting."""
+        for archive in self.archives.values():
+            members = get_archive_members(archive)
+            self.assertEqual(members, [
+                archive + '/logs/simul1.pcap',
+                archive + '/logs/simul2.pcap.gz', archive + '/simul3.pcap'
+            ])
+            # Out of order, so compressed tars are decompressed again.
+            for member in reversed(members):
+                name = os.path.basename(member).replace('.gz', '')
+                self.assertEqual(list(iter_frames(member)), self.frames[name])
+            self.assertEqual(get_uncompressed_size(members[0]),
+                             os.path.getsize('examples/simul1.pcap'))
+
+    def test_read_members_at_once(self):
+        """Members of a compressed tar read at once are decompressed once."""
+        name = os.path.join(self.temp_dir.name, 'large.tar.gz')
+        frames = {}
+        with tarfile.open(name, 'w:gz') as archive:
+            for member in ['a.pcap', 'b.pcap']:
+                # Larger than what TarStream can read again.
+                frames[member] = [
+                    (timestamp, member.encode() * 500, 1)
+                    for timestamp in range(REWIND_BYTES // 500)
+                ]
+                pcap = io.BytesIO()
+                write_pcap(pcap, [frame[:2] for frame in frames[member]], 1)
+                add_member(archive, member, pcap.getvalue())
+        open_capture = archive_module.open_capture
+        opened = []
+
+        def record_open(filename):
+            """Record each decompression of the tar."""
+            opened.append(filename)
+            return open_capture(filename)
+
+        archive_module.open_capture = record_open
+        try:
+            members = get_archive_members(name)
+            interleaved = list(zip(*[iter_frames(member)
+                                     for member in members]))
+        finally:
+            archive_module.open_capture = open_capture
+        self.assertEqual(interleaved,
+                         list(zip(frames['a.pcap'], frames['b.pcap'])))
+        # Besides checks of its first bytes, the tar is indexed, read up to
+        # the second member and copied to a temporary file, instead of being
+        # decompressed again for each read of the first member.
+        self.assertIsNotNone(archive_module.TAR_STREAMS[name].spill_file)
+        self.assertLess(opened.count(name), 10)
+
+    def test_split_member(self):
+        """Members are named like files in a directory."""
+        archive = self.archives['bundle.zip']
+        self.assertEqual(split_member(archive + '/logs/simul1.pcap'),
+                         (archive, 'logs/simul1.pcap'))
+        self.assertEqual(split_member('examples/simul1.pcap'),
+                         ('examples/simul1.pcap', ''))
+        self.assertTrue(is_random_access(archive + '/simul3.pcap'))
+        self.assertFalse(
+            is_random_access(self.archives['bundle.tar.gz'] + '/simul3.pcap'))
+
+    def test_get_filenames(self):
+        """Archives on the command line stand for their captures."""
+        archive = self.archives['bundle.tar']
+        self.assertEqual(
+            get_filenames([archive, 'examples/simul1.pcap']),
+            get_archive_members(archive) + ['examples/simul1.pcap'])
+
+
+def add_member(archive, member, data):
+    """Add bytes to a tar or zip as a member."""
+    if isinstance(archive, zipfile.ZipFile):
+        archive.writestr(member, data)
+        return
+    tar_info = tarfile.TarInfo(member)
+    tar_info.size = len(data)
+    archive.addfile(tar_info, io.BytesIO(data))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test compressed_file.py."""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pcapgraph.compressed_file import get_compression, get_uncompressed_size
+from pcapgraph.compressed_file import lz4, zstandard
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import save_pcap
+from tests import setup_testenv
+
+
+class TestCompressedFile(unittest.TestCase):
+    """Test compressed_file.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False, 'pcapng': False}
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.frames = list(iter_frames('examples/simul1.pcap'))
+
+    def tearDown(self):
+        """Remove compressed pcaps."""
+        self.temp_dir.cleanup()
+
+    def check_round_trip(self, compression, extension):
+        """Save simul1 compressed and read it back."""
+        name = os.path.join(self.temp_dir.name, 'simul1.pcap')
+        pcap_dict = [(frame.hex(), '%d.%09d' % divmod(timestamp, 10**9))
+                     for timestamp, frame, _ in self.frames]
+        save_pcap(pcap_dict=pcap_dict, name=name,
+                  options=dict(self.options, compress=compression))
+        self.assertEqual(get_compression(name + extension), compression)
+        self.assertEqual(list(iter_frames(name + extension)), self.frames)
+
+    def test_gzip(self):
+        """gzip pcaps are written and read as streams."""
+        self.check_round_trip('gzip', '.gz')
+
+    @unittest.skipIf(zstandard is None, "needs zstandard")
+    def test_zstd(self):
+        """zstd pcaps are written and read as streams."""
+        self.check_round_trip('zstd', '.zst')
+
+    @unittest.skipIf(lz4 is None, "needs lz4")
+    def test_lz4(self):
+        """lz4 pcaps are written and read as streams."""
+        self.check_round_trip('lz4', '.lz4')
+
+    def test_get_uncompressed_size(self):
+        """Compressed files are sized as if they were decompressed."""
+        name = os.path.join(self.temp_dir.name, 'simul1.pcapng')
+        with open('examples/simul1.pcap', 'rb') as capture, \
+                gzip.open(name, 'wb') as compressed:
+            shutil.copyfileobj(capture, compressed)
+        self.assertEqual(get_compression('examples/simul1.pcap'), '')
+        self.assertEqual(get_uncompressed_size(name),
+                         os.path.getsize('examples/simul1.pcap'))
+        self.assertEqual(get_uncompressed_size('examples/simul1.pcap'),
+                         os.path.getsize('examples/simul1.pcap'))
@@ -21,7 +21,8 @@ import pickle
 
 from pcapgraph.draw_graph import remove_or_open_files, set_xticks, \
     make_text_not_war, get_graph_vars_from_file, set_horiz_bar_colors, \
-    get_x_minmax
+    get_x_minmax, get_graph_vars_from_result
+from pcapgraph.set_result import SetResult
 from tests import setup_testenv, DEFAULT_CLI_ARGS
 
 
@@ -81,6 +82,18 @@ class TestManipulateFrames(unittest.TestCase):
         actual_result = get_graph_vars_from_file(input_filename)
         self.assertEqual(expected_result, actual_result)
 
+    def test_get_graph_vars_from_result(self):
+        """Unsaved set results are graphed from their timestamps."""
+        set_result = SetResult('union.pcap', {
+            'aa': '1537945792.655360000',
+            'bb': '1537945792.720895000'
+        }, {})
+        expected_result = {'pcap_start': 1537945792.65536,
+                           'pcap_end': 1537945792.720895}
+        actual_result = get_graph_vars_from_result(set_result)
+        self.assertEqual(expected_result, actual_result)
+        self.assertFalse(os.path.exists('union.pcap'))
+
     def test_generate_graph(self):
         """Do not test generate_graph as it needs a matplotlib.pyplot object.
 
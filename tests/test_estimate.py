@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test estimate.py."""
+
+import unittest
+
+import numpy as np
+
+from pcapgraph.estimate import HyperLogLog, BloomFilter, get_estimates
+from pcapgraph.manipulate_frames import get_frame_fingerprint
+from tests import setup_testenv
+
+
+class TestEstimate(unittest.TestCase):
+    """Test estimate.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False}
+        self.fingerprints = np.array(
+            [get_frame_fingerprint(str(num)) for num in range(100000)],
+            dtype=np.uint64)
+
+    def test_hyperloglog(self):
+        """Repeated fingerprints are counted once, within the error."""
+        sketch = HyperLogLog()
+        sketch.add(self.fingerprints)
+        sketch.add(self.fingerprints[:50000])
+        self.assertAlmostEqual(sketch.count(), 100000, delta=2000)
+        self.assertEqual(HyperLogLog().count(), 0)
+        other_sketch = HyperLogLog()
+        other_sketch.add(self.fingerprints[:10])
+        self.assertEqual(sketch.merge(other_sketch).count(), sketch.count())
+
+    def test_bloom_filter(self):
+        """Added fingerprints are always found, others rarely."""
+        bloom = BloomFilter()
+        bloom.add(self.fingerprints[:50000])
+        self.assertTrue(bloom.contains(self.fingerprints[:50000]).all())
+        self.assertLess(bloom.contains(self.fingerprints[50000:]).mean(),
+                        0.001)
+
+    def test_get_estimates(self):
+        """Estimates of the simul pcaps are within their error bounds."""
+        estimates = get_estimates([
+            'examples/simul1.pcap', 'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ], self.options)
+        # Exact sizes are those of examples/set_ops.
+        union, union_error = estimates['union']
+        self.assertLessEqual(abs(union - 394), union_error)
+        intersection, intersection_error = estimates['intersection']
+        self.assertLessEqual(abs(intersection - 72), intersection_error)
+        for (only, only_error), exact_only in zip(estimates['only'],
+                                                  [80, 0, 78]):
+            self.assertLessEqual(abs(only - exact_only), only_error)
+        self.assertEqual(estimates['frame_counts'], [232, 236, 234])
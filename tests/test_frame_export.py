@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test frame_export.py."""
+
+import csv
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from pcapgraph.frame_export import export_frames, get_membership_masks, \
+    pyarrow
+from pcapgraph.incremental_math import IncrementalPcapMath
+from tests import setup_testenv
+
+
+class TestFrameExport(unittest.TestCase):
+    """Test frame_export.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Compare the simul pcaps in a temporary state directory."""
+        setup_testenv()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.options = {
+            'strip-l2': True,
+            'strip-l3': False,
+            'pcapng': False,
+            'state': os.path.join(self.temp_dir.name, 'state')
+        }
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+        self.pcap_math = IncrementalPcapMath(self.filenames, self.options)
+
+    def tearDown(self):
+        """Remove the comparison and exports."""
+        self.temp_dir.cleanup()
+
+    def export(self, name, flows=False):
+        """Export the comparison to a file in the temporary directory."""
+        filename = os.path.join(self.temp_dir.name, name)
+        with redirect_stdout(io.StringIO()):
+            export_frames(self.pcap_math, filename, flows)
+        return filename
+
+    def test_export_csv(self):
+        """Every frame is a row with its membership and 5-tuple."""
+        with open(self.export('frames.csv', flows=True)) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(len(rows), len(self.pcap_math.frame_table))
+        self.assertEqual(rows[0]['capture'], 'examples/simul1.pcap')
+        # Frames in all 3 pcaps are the intersection, once per pcap.
+        self.assertEqual(
+            sum(row['membership'] == '7' for row in rows),
+            3 * len(self.pcap_math.get_intersection_frames()))
+        # Lengths and flows are of frames as captured, with Ethernet.
+        self.assertEqual(rows[1]['length'], '70')
+        self.assertEqual(
+            [rows[1][column] for column in
+             ['protocol', 'src_ip', 'src_port', 'dst_ip', 'dst_port']],
+            ['17', '10.48.18.144', '60002', '10.128.128.128', '53'])
+
+    @unittest.skipIf(pyarrow is None, "needs pyarrow")
+    def test_export_parquet(self):
+        """Parquet and Arrow exports have the same rows as CSV."""
+        import pyarrow.parquet
+        with open(self.export('frames.csv')) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        table = pyarrow.parquet.read_table(self.export('frames.parquet'))
+        self.assertEqual(table.column_names, list(rows[0]))
+        self.assertEqual(table.column('fingerprint').to_pylist(),
+                         [int(row['fingerprint']) for row in rows])
+        self.assertEqual(table.column('capture').to_pylist(),
+                         [row['capture'] for row in rows])
+        arrow_table = pyarrow.ipc.open_file(
+            self.export('frames.arrow')).read_all()
+        self.assertTrue(arrow_table.equals(table))
+
+    def test_get_membership_masks(self):
+        """Bit 1 << i is set for pcap i, beyond 64 pcaps bits stay packed."""
+        members = np.array([[True, False, True], [False, True, False]])
+        self.assertEqual(
+            get_membership_masks(np.packbits(members, axis=1), 3).tolist(),
+            [5, 2])
+        membership = np.packbits(np.ones((2, 65), dtype=bool), axis=1)
+        self.assertIs(get_membership_masks(membership, 65), membership)
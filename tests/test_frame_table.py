@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test frame_table.py."""
+
+import unittest
+
+import numpy as np
+
+from pcapgraph.frame_table import FrameTable, MergedFrames, shared_memory
+from tests import setup_testenv
+
+
+class TestFrameTable(unittest.TestCase):
+    """Test frame_table.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.sizes = {'payload': 3, 'frames': 2, 'pcaps': 1}
+
+    def fill_frame_table(self, frame_table):
+        """Put frames 'aabb' and 'cc' of one pcap in frame_table."""
+        frame_table.payload[:] = [0xaa, 0xbb, 0xcc]
+        frame_table.offsets[:] = [0, 2, 3]
+        frame_table.pcap_offsets[:] = [0, 2]
+
+    def test_frame_table(self):
+        """Frames are slices of the payload."""
+        frame_table = FrameTable(self.sizes)
+        self.fill_frame_table(frame_table)
+        self.assertEqual(len(frame_table), 2)
+        self.assertEqual(frame_table.get_frame(0), 'aabb')
+        self.assertEqual(frame_table.get_frame(1), 'cc')
+        self.assertListEqual(frame_table.get_pcap_indices().tolist(), [0, 0])
+
+    def test_merged_frames(self):
+        """Frames of 2 pcaps are merged by time with the pcaps that saw them.
+        """
+        frame_table = FrameTable({'payload': 3, 'frames': 3, 'pcaps': 2})
+        frame_table.payload[:] = [0xaa, 0xbb, 0xcc]
+        frame_table.offsets[:] = [0, 1, 2, 3]
+        frame_table.timestamps[:] = [30, 10, 20]
+        frame_table.pcap_offsets[:] = [0, 2, 3]
+        # Rows of frame 2 ('cc', in both pcaps) and frame 0 ('aa').
+        membership = np.packbits([[1, 1, 0, 0, 0, 0, 0, 0],
+                                  [1, 0, 0, 0, 0, 0, 0, 0]], axis=1)
+        merged_frames = MergedFrames(frame_table, np.array([2, 0]),
+                                     membership, ['dir/a.pcap', 'b.pcap'])
+        self.assertListEqual(list(merged_frames.iter_records()),
+                             [(20, b'\xcc'), (30, b'\xaa')])
+        self.assertListEqual(
+            list(merged_frames.iter_annotated_records()),
+            [(20, b'\xcc', 1, 'Seen in a.pcap, b.pcap'),
+             (30, b'\xaa', 0, 'Seen in a.pcap')])
+
+    @unittest.skipIf(shared_memory is None, "needs Python 3.8+")
+    def test_attach(self):
+        """Attached tables are read-only views of the same memory."""
+        frame_table = FrameTable(self.sizes, shared=True)
+        self.fill_frame_table(frame_table)
+        attached_table = FrameTable.attach(frame_table.get_handle())
+        self.assertEqual(attached_table.get_frame(0), 'aabb')
+        with self.assertRaises(ValueError):
+            attached_table.payload[0] = 0
+        frame_table.payload[0] = 0xdd
+        self.assertEqual(attached_table.get_frame(0), 'ddbb')
+        self.assertTrue(
+            np.array_equal(attached_table.offsets, frame_table.offsets))
+        attached_table.finalizer()
+        frame_table.release()
@@ -15,6 +15,11 @@
 """Test get_filenames.py."""
 
 import unittest
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
 
 import pcapgraph.get_filenames as gf
 from tests import setup_testenv, DEFAULT_CLI_ARGS
@@ -55,6 +60,24 @@ class TestGetFilenames(unittest.TestCase):
                            'tests/files/test_dir/test_dir.pcap']
         self.assertEqual(expected_result, pcap_filenames)
 
+    def test_get_archives_from_directories(self):
+        """Archives in directories are replaced by their packet captures."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copy('tests/files/test.pcap', temp_dir)
+            with zipfile.ZipFile(os.path.join(temp_dir, 'bundle.zip'),
+                                 'w') as zip_file:
+                zip_file.write('tests/files/in_order_packets.pcap',
+                               'in_order_packets.pcap')
+            with zipfile.ZipFile(os.path.join(temp_dir, 'notes.zip'),
+                                 'w') as zip_file:
+                zip_file.write('tests/files/test.txt', 'test.txt')
+            pcap_filenames = sorted(
+                gf.get_filenames_from_directories([temp_dir]))
+            self.assertEqual(pcap_filenames, [
+                temp_dir + '/bundle.zip/in_order_packets.pcap',
+                temp_dir + '/test.pcap'
+            ])
+
     def test_get_filenames(self):
         """Test get_filenames.
 
@@ -73,3 +96,45 @@ class TestGetFilenames(unittest.TestCase):
 
         expected_result = ['tests/files/test.pcap', 'tests/files/test.pcapng']
         self.assertEqual(expected_result, packet_captures)
+
+    def test_is_packet_capture(self):
+        """pcaps are found by their first bytes, other formats by name."""
+        with open('tests/files/test.pcap', 'rb') as pcap_file:
+            pcap = pcap_file.read()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = {
+                'trace.bin': gzip.compress(pcap),
+                'trace': pcap,
+                'notes.txt': b'not a capture',
+                'notes.bin.gz': gzip.compress(b'not a capture'),
+                'capture.snoop': b'not a pcap',
+            }
+            for name, contents in files.items():
+                with open(os.path.join(temp_dir, name), 'wb') as file:
+                    file.write(contents)
+            is_capture = [
+                gf.is_packet_capture(os.path.join(temp_dir, name))
+                for name in files
+            ]
+        self.assertEqual(is_capture, [True, True, False, False, True])
+
+    def test_get_capture_extension(self):
+        """Compressed pcaps have the extension of the pcap inside."""
+        with open('tests/files/test.pcap', 'rb') as pcap_file:
+            pcap = pcap_file.read()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = {
+                'b.pcapng.gz': gzip.compress(pcap),
+                'b.txt.gz': gzip.compress(pcap),
+                'b.pcap': pcap,
+                # Only compressed files lose their compression extension.
+                'c.pcap.gz': pcap,
+            }
+            for name, contents in files.items():
+                with open(os.path.join(temp_dir, name), 'wb') as file:
+                    file.write(contents)
+            extensions = [
+                gf.get_capture_extension(os.path.join(temp_dir, name))
+                for name in files
+            ]
+        self.assertEqual(extensions, ['.pcapng', '.txt', '.pcap', '.gz'])
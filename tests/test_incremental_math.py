@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test incremental_math.py."""
+
+import unittest
+import io
+import os
+import re
+import tempfile
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from pcapgraph.incremental_math import IncrementalPcapMath, ComparisonState
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import get_capture_records
+from pcapgraph.spill_math import SpillPcapMath
+from tests import setup_testenv, DEFAULT_CLI_ARGS, EXPECTED_UNION_STDOUT
+
+
+class TestIncrementalMath(unittest.TestCase):
+    """Test incremental_math.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars and an empty comparison directory."""
+        setup_testenv()
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.options = {
+            'strip-l2': False,
+            'strip-l3': False,
+            'pcapng': False,
+            'state': self.state_dir.name
+        }
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+
+    def tearDown(self):
+        """Remove the comparison."""
+        self.state_dir.cleanup()
+
+    def assert_same_index(self, state, expected_state):
+        """Assert that two comparisons have the same index."""
+        self.assertTrue(
+            np.array_equal(state.fingerprints, expected_state.fingerprints))
+        self.assertTrue(np.array_equal(state.counts, expected_state.counts))
+        self.assertTrue(
+            np.array_equal(state.membership, expected_state.membership))
+
+    def test_update(self):
+        """Only new pcaps are read and the index matches a fresh one."""
+        state = ComparisonState(self.state_dir.name, self.options)
+        self.assertEqual(state.update(self.filenames[:2]), self.filenames[:2])
+        state = ComparisonState(self.state_dir.name, self.options)
+        self.assertEqual(state.update(self.filenames), self.filenames[2:])
+        with tempfile.TemporaryDirectory() as fresh_dir:
+            fresh_state = ComparisonState(fresh_dir, self.options)
+            fresh_state.update(self.filenames)
+            self.assert_same_index(state, fresh_state)
+        # Removing a pcap doesn't read anything.
+        self.assertEqual(state.update(self.filenames[:2]), [])
+        with tempfile.TemporaryDirectory() as fresh_dir:
+            fresh_state = ComparisonState(fresh_dir, self.options)
+            fresh_state.update(self.filenames[:2])
+            self.assert_same_index(state, fresh_state)
+        # Saves are renamed into place and removed pcaps' files deleted.
+        self.assertEqual(
+            sorted(os.listdir(self.state_dir.name)),
+            sorted(['comparison.json', 'index.npz'] +
+                   [capture['file'] for capture in state.captures]))
+
+    def test_get_membership_index(self):
+        """The index is assembled without loading any saved frames."""
+        IncrementalPcapMath(self.filenames[1:], self.options)
+        incremental_obj = IncrementalPcapMath(self.filenames, self.options)
+        _, last_frames, membership = incremental_obj.get_membership_index()
+        self.assertIsNone(incremental_obj.capture_table)
+        self.assertEqual(len(last_frames), len(membership))
+        self.assertEqual(incremental_obj.frame_table.pcap_offsets.tolist(),
+                         incremental_obj.get_pcap_offsets().tolist())
+
+    def test_load_selected_frames(self):
+        """-i after adding a pcap only loads the frames of the new pcap."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        IncrementalPcapMath(self.filenames[:2], self.options)
+        incremental_obj = IncrementalPcapMath(self.filenames, self.options)
+        self.assertEqual(incremental_obj.added_filenames, self.filenames[2:])
+        load_capture = incremental_obj.state.load_capture
+        loaded = []
+
+        def record_load(filename, fields):
+            """Record which pcaps had their frames loaded."""
+            if 'payload' in fields:
+                loaded.append(filename)
+            return load_capture(filename, fields)
+
+        incremental_obj.state.load_capture = record_load
+        with redirect_stdout(io.StringIO()):
+            intersection = incremental_obj.get_set_results(args)[0]
+        self.assertEqual(loaded, self.filenames[2:])
+        self.assertEqual(
+            sorted(intersection.get_frame_pairs()),
+            sorted(SpillPcapMath(self.filenames, self.options)
+                   .get_set_results(args)[0].get_frame_pairs()))
+
+    def test_get_set_results(self):
+        """Results of an updated comparison match the spill engine's."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--symmetric-difference'] = True
+        args['--intersection'] = True
+        args['--union'] = True
+        IncrementalPcapMath(self.filenames[1:], self.options)
+        incremental_obj = IncrementalPcapMath(self.filenames, self.options)
+        self.assertEqual(incremental_obj.added_filenames, self.filenames[:1])
+        spill_obj = SpillPcapMath(self.filenames, self.options)
+        f_stream = io.StringIO()
+        with redirect_stdout(f_stream):
+            results = incremental_obj.get_set_results(args)
+            expected_results = spill_obj.get_set_results(args)
+        generated_stdout = re.sub(r' +$', '', f_stream.getvalue(), flags=re.M)
+        self.assertIn(EXPECTED_UNION_STDOUT, generated_stdout)
+        self.assertEqual(len(results), len(expected_results))
+        for result, expected_result in zip(results, expected_results):
+            self.assertEqual(result.name, expected_result.name)
+            self.assertEqual(
+                sorted(result.get_frame_pairs()),
+                sorted(expected_result.get_frame_pairs()))
+
+    def test_save_original_frames(self):
+        """With -2, results are saved as the pivot pcap captured them."""
+        options = dict(self.options, **{'strip-l2': True})
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        incremental_obj = IncrementalPcapMath(self.filenames, options)
+        with redirect_stdout(io.StringIO()):
+            intersection = incremental_obj.get_set_results(args)[0]
+        records, _, linktype = get_capture_records(intersection.frames,
+                                                   options)
+        self.assertEqual(linktype, 1)
+        pivot_frames = {
+            frame for _, frame, _ in iter_frames(self.filenames[0])
+        }
+        records = list(records)
+        self.assertEqual(len(records), len(intersection.frames))
+        self.assertTrue(all(frame in pivot_frames for _, frame in records))
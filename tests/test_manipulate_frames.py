@@ -14,14 +14,20 @@
 # limitations under the License.
 """Test manipulate_frames"""
 
-import unittest
+import os
 import pickle
+import tempfile
+import unittest
 
 from tests import setup_testenv, DEFAULT_CLI_ARGS, SINGLE_FRAME_JSON, \
     EXPECTED_PCAP_JSON_LIST, EXPECTED_STRIPPED_PCAP
 from pcapgraph.manipulate_frames import parse_pcaps, get_pcap_frame_dict, \
     get_homogenized_packet, get_pcap_as_json, get_frame_from_json, \
-    get_frame_list_by_pcap, get_packet_count, get_flat_frame_dict, strip_layers
+    get_frame_list_by_pcap, get_packet_count, get_flat_frame_dict, \
+    strip_layers, get_frame_count_table, strip_frame, get_frame_fingerprint, \
+    get_frame_table, strip_pcap_json
+from pcapgraph.incremental_math import read_capture
+from pcapgraph.save_file import write_pcap
 
 
 class TestManipulateFrames(unittest.TestCase):
@@ -115,6 +121,46 @@ class TestManipulateFrames(unittest.TestCase):
 
         self.assertListEqual(actual_frame_list, expected_frame_list)
 
+    def test_get_frame_count_table(self):
+        """Test get_frame_count_table
+
+        Takes: FrameTable
+        Returns: (first frames, frame ids, pcap ids, counts, frame order)
+            Repeated frames are counted instead of being collapsed.
+        """
+        pcaps_json_dict = {
+            'triple': [SINGLE_FRAME_JSON] * 3,
+            'single': [SINGLE_FRAME_JSON],
+            'other': self.pcaps_json_list[1],
+        }
+        frame_table = get_frame_table(pcaps_json_dict)
+        first_frames, frame_ids, pcap_ids, counts, frame_order = \
+            get_frame_count_table(frame_table)
+        self.assertListEqual(first_frames.tolist(), [0, 4])
+        self.assertListEqual(frame_ids.tolist(), [0, 0, 1])
+        self.assertListEqual(pcap_ids.tolist(), [0, 1, 2])
+        self.assertListEqual(counts.tolist(), [3, 1, 1])
+        self.assertListEqual(frame_order.tolist(), [0, 1, 2, 3, 4])
+
+    def test_get_frame_table(self):
+        """Test get_frame_table
+
+        Takes: {'PCAP NAME': [{PACKET DICT}, ...], ...}
+        Returns: FrameTable with every frame in capture order.
+        """
+        pcaps_json_dict = {
+            'triple': [SINGLE_FRAME_JSON] * 3,
+            'other': self.pcaps_json_list[1],
+        }
+        frame_table = get_frame_table(pcaps_json_dict)
+        frame = get_frame_from_json(SINGLE_FRAME_JSON)
+        self.assertEqual(len(frame_table), 3 + len(self.pcaps_json_list[1]))
+        self.assertEqual(frame_table.get_frame(2), frame)
+        self.assertEqual(frame_table.fingerprints[0],
+                         get_frame_fingerprint(frame))
+        self.assertEqual(frame_table.pcap_offsets[1], 3)
+        self.assertEqual(frame_table.timestamps[0], 1537945792655360000)
+
     def test_get_pcap_frame_dict(self):
         """Test get_pcap_frame_dict
 
@@ -171,6 +217,52 @@ class TestManipulateFrames(unittest.TestCase):
         del actual_stripped[filename][0]['_index']
         self.assertDictEqual(actual_stripped, expected_stripped)
 
+    def test_strip_frame(self):
+        """Stripping a raw frame should match stripping its tshark JSON."""
+        filename = 'tests/files/test.pcap'
+        frame_raw = get_frame_from_json(self.pcaps_json_list[1][0])
+        for options in [{'strip-l2': True, 'strip-l3': False},
+                        {'strip-l2': False, 'strip-l3': True}]:
+            stripped_json = strip_layers([filename], options)[filename][0]
+            self.assertEqual(get_frame_from_json(stripped_json),
+                             strip_frame(frame_raw, 1, options))
+
+    def test_strip_vlan_and_sll_frames(self):
+        """tshark's JSON and frames read directly are stripped alike."""
+        ip_raw = '452000542bbc00007901e8fd080808080a301290000082a563110001' \
+                 'f930ab5b00000000a9e80d0000000000101112131415161718191a1b'
+        vlan_frame = '247703511344881544abbfdd' + '8100' + '0064' + \
+            '88a8' + '00c8' + '0800' + ip_raw
+        sll_frame = '0000' + '0001' + '0006' + '881544abbfdd0000' + \
+            '0800' + ip_raw
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for linktype, frame_raw in [(1, vlan_frame), (113, sll_frame)]:
+                filename = os.path.join(temp_dir, str(linktype) + '.pcap')
+                with open(filename, 'wb') as pcap_file:
+                    write_pcap(pcap_file, [(0, bytes.fromhex(frame_raw))],
+                               linktype)
+                for options in [{'strip-l2': True, 'strip-l3': False},
+                                {'strip-l2': False, 'strip-l3': True}]:
+                    pcap_json = [{'_source': {'layers': {
+                        'frame_raw': frame_raw,
+                        'frame': {'frame.number': '1'}
+                    }}}]
+                    strip_pcap_json(filename, pcap_json, options)
+                    native_frame = \
+                        read_capture(filename, options)['payload'].tobytes()
+                    self.assertEqual(get_frame_from_json(pcap_json[0]),
+                                     native_frame.hex())
+                    self.assertEqual(get_frame_from_json(pcap_json[0]),
+                                     strip_frame(ip_raw, 101, options))
+
+    def test_get_frame_fingerprint(self):
+        """Fingerprints are 64 bit and only equal for equal frames."""
+        frame_raw = get_frame_from_json(SINGLE_FRAME_JSON)
+        fingerprint = get_frame_fingerprint(frame_raw)
+        self.assertLess(fingerprint, 2**64)
+        self.assertEqual(fingerprint, get_frame_fingerprint(frame_raw))
+        self.assertNotEqual(fingerprint, get_frame_fingerprint(frame_raw[2:]))
+
     def test_get_homogenized_packet(self):
         """test get_homogenized_packet.
 
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test output_sink.py."""
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+
+from pcapgraph.output_sink import get_sink, OutputSink, StreamSink, \
+    WiresharkSink
+from pcapgraph.read_file import iter_frames
+from pcapgraph.set_result import SetResult
+from tests import setup_testenv
+
+
+class TestOutputSink(unittest.TestCase):
+    """Test output_sink.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False, 'pcapng': False}
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove saved pcaps."""
+        self.temp_dir.cleanup()
+
+    def get_set_results(self, options):
+        """Get a union and an intersection of one frame each."""
+        return [
+            SetResult('union.pcap', {'aabb': '1.000000002'}, options),
+            SetResult('intersect.pcap', {'cc': '3.0'}, options)
+        ]
+
+    @unittest.skipIf(not hasattr(os, 'mkfifo'), "needs named pipes")
+    def test_get_sink(self):
+        """Sinks are chosen by what --sink is."""
+        fifo = os.path.join(self.temp_dir.name, 'fifo')
+        os.mkfifo(fifo)
+        self.assertIsInstance(get_sink('wireshark'), WiresharkSink)
+        self.assertIsInstance(get_sink(fifo), StreamSink)
+        self.assertEqual(type(get_sink(self.temp_dir.name)), OutputSink)
+        with self.assertRaises(SyntaxError):
+            get_sink(os.path.join(self.temp_dir.name, 'missing'))
+
+    def test_directory_sink(self):
+        """Results are saved in the directory."""
+        set_results = self.get_set_results(self.options)
+        get_sink(self.temp_dir.name).write_results(set_results)
+        self.assertEqual(
+            list(iter_frames(os.path.join(self.temp_dir.name,
+                                          'intersect.pcap'))),
+            [(3000000000, b'\xcc', 1)])
+        self.assertTrue(set_results[0].saved)
+
+    def test_stdout_sink(self):
+        """Several results are written to stdout as pcapng sections."""
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with redirect_stdout(stdout):
+            sink = get_sink('-')
+        with self.assertRaises(SyntaxError):
+            sink.write_results(self.get_set_results(self.options))
+        sink.write_results(
+            self.get_set_results(dict(self.options, pcapng=True)))
+        pcapng = os.path.join(self.temp_dir.name, 'stdout.pcapng')
+        with open(pcapng, 'wb') as pcapng_file:
+            pcapng_file.write(stdout.buffer.getvalue())
+        self.assertEqual(list(iter_frames(pcapng)),
+                         [(1000000002, b'\xaa\xbb', 1),
+                          (3000000000, b'\xcc', 1)])
+
+    @unittest.skipIf(not hasattr(os, 'mkfifo'), "needs named pipes")
+    def test_fifo_sink(self):
+        """A result is written to a named pipe without saving it."""
+        fifo = os.path.join(self.temp_dir.name, 'fifo')
+        os.mkfifo(fifo)
+        set_results = self.get_set_results(self.options)[:1]
+        writer = threading.Thread(
+            target=get_sink(fifo).write_results, args=(set_results, ))
+        writer.start()
+        pcap = os.path.join(self.temp_dir.name, 'fifo.pcap')
+        with open(fifo, 'rb') as pipe, open(pcap, 'wb') as pcap_file:
+            pcap_file.write(pipe.read())
+        writer.join()
+        self.assertEqual(list(iter_frames(pcap)),
+                         [(1000000002, b'\xaa\xbb', 1)])
+        self.assertFalse(set_results[0].saved)
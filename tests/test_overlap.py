@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test overlap.py."""
+
+import csv
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pcapgraph.overlap import get_overlap_ratios, make_overlap_text, \
+    write_overlap_csv
+from tests import setup_testenv
+
+
+class TestOverlap(unittest.TestCase):
+    """Test overlap.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.filenames = ['a.pcap', 'b.pcap', 'c.pcap', 'empty.pcap']
+        self.options = {'sample': 1}
+        self.overlap_counts = np.array([[4, 2, 4, 0], [2, 2, 2, 0],
+                                        [4, 2, 8, 0], [0, 0, 0, 0]])
+
+    def test_get_overlap_ratios(self):
+        """Containment is per row pcap and empty pcaps have no overlap."""
+        jaccard, containment = get_overlap_ratios(self.overlap_counts)
+        self.assertEqual(jaccard[0, 1], 0.5)
+        self.assertEqual(jaccard[0, 2], 0.5)
+        self.assertEqual(containment[0, 2], 1.0)
+        self.assertEqual(containment[2, 0], 0.5)
+        self.assertEqual(jaccard[3, 3], 0)
+        self.assertEqual(containment[3].tolist(), [0, 0, 0, 0])
+
+    def test_make_overlap_text(self):
+        """Each pcap's frames and each pair are listed once."""
+        overlap_text = make_overlap_text(self.filenames, self.overlap_counts,
+                                         self.options)
+        self.assertIn('\n8          c.pcap', overlap_text)
+        self.assertIn(
+            '\n4          50%        100%       50%        a.pcap  c.pcap',
+            overlap_text)
+        self.assertEqual(overlap_text.count('pcap  '), 6)
+
+    def test_write_overlap_csv(self):
+        """Every ordered pair of pcaps is a row."""
+        with tempfile.TemporaryDirectory() as tempdir:
+            csv_name = os.path.join(tempdir, 'pcap_overlap.csv')
+            write_overlap_csv(self.filenames, self.overlap_counts,
+                              self.options, csv_name)
+            with open(csv_name, newline='') as csv_file:
+                rows = list(csv.reader(csv_file))
+        self.assertEqual(len(rows), 1 + 4 * 4)
+        self.assertEqual(rows[3], ['a.pcap', 'c.pcap', '4', '50.0', '100.0'])
+        self.assertEqual(rows[9], ['c.pcap', 'a.pcap', '4', '50.0', '50.0'])
+
+    def test_sampled_overlap(self):
+        """Percentages of a sample come with their confidence interval."""
+        self.options['sample'] = 64
+        overlap_text = make_overlap_text(self.filenames, self.overlap_counts,
+                                         self.options)
+        self.assertIn('50% (15-85%)', overlap_text)
+        with tempfile.TemporaryDirectory() as tempdir:
+            csv_name = os.path.join(tempdir, 'pcap_overlap.csv')
+            write_overlap_csv(self.filenames, self.overlap_counts,
+                              self.options, csv_name)
+            with open(csv_name, newline='') as csv_file:
+                rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0][3:6], [
+            'jaccard_percent', 'jaccard_percent_low', 'jaccard_percent_high'
+        ])
+        self.assertEqual(len(rows[3]), 9)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test parallel_math.py."""
+
+import unittest
+
+import numpy as np
+
+import pcapgraph.parallel_math as parallel
+from pcapgraph.manipulate_frames import get_frame_table
+from tests import setup_testenv
+
+
+def get_frame_json(frame_raw):
+    """Get the parts of a tshark frame JSON that frame tables use."""
+    return {
+        '_source': {
+            'layers': {
+                'frame_raw': frame_raw,
+                'frame': {'frame.time_epoch': '1537945792.655360000'}
+            }
+        }
+    }
+
+
+class TestParallelMath(unittest.TestCase):
+    """Test parallel_math.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        frame_list_by_pcap = [['aa', 'bb', 'cc', 'aa'], ['bb', 'dd'],
+                              ['bb', 'cc']]
+        self.frame_table = get_frame_table({
+            str(index): [get_frame_json(frame) for frame in frame_list]
+            for index, frame_list in enumerate(frame_list_by_pcap)
+        })
+
+    def get_frames_only_in(self, membership_index, pcap_indices):
+        """Get the set of frames in exactly the pcaps at pcap_indices."""
+        _, last_frames, membership = membership_index
+        member_rows = parallel.get_member_rows(membership, 3, pcap_indices)
+        return {
+            self.frame_table.get_frame(frame_num)
+            for frame_num in last_frames[member_rows].tolist()
+        }
+
+    def test_index_shard(self):
+        """Every set operation is a selection of membership rows."""
+        membership_index = parallel.index_shard(self.frame_table.get_handle())
+        self.assertEqual(len(membership_index[0]), 4)
+        self.assertEqual(
+            self.get_frames_only_in(membership_index, [0, 1, 2]), {'bb'})
+        self.assertEqual(
+            self.get_frames_only_in(membership_index, [0]), {'aa'})
+        self.assertEqual(
+            self.get_frames_only_in(membership_index, [1]), {'dd'})
+        self.assertEqual(
+            self.get_frames_only_in(membership_index, [0, 2]), {'cc'})
+        self.assertEqual(self.get_frames_only_in(membership_index, [2]), set())
+
+    def test_get_membership_index(self):
+        """Sharded indexes should have the same rows as one index."""
+        serial_index = parallel.get_membership_index(self.frame_table)
+        handle = self.frame_table.get_handle()
+        shard_frames = parallel.get_shard_frames(self.frame_table, 3)
+        self.assertEqual(sum(map(len, shard_frames)), len(self.frame_table))
+        shard_indexes = [
+            parallel.index_shard(handle, frame_nums)
+            for frame_nums in shard_frames
+        ]
+        sharded_index = [
+            np.concatenate([index[part] for index in shard_indexes])
+            for part in range(3)
+        ]
+        order = np.argsort(sharded_index[0])
+        for serial_part, sharded_part in zip(serial_index, sharded_index):
+            self.assertTrue(np.array_equal(serial_part, sharded_part[order]))
+
+    def test_get_overlap_counts(self):
+        """Pairs count the unique frames that both pcaps have."""
+        _, _, membership = parallel.get_membership_index(self.frame_table)
+        self.assertEqual(
+            parallel.get_overlap_counts(membership, 3).tolist(),
+            [[3, 1, 2], [1, 2, 1], [2, 1, 2]])
+        empty_membership = np.zeros((0, 1), dtype=np.uint8)
+        self.assertEqual(
+            parallel.get_overlap_counts(empty_membership, 2).tolist(),
+            [[0, 0], [0, 0]])
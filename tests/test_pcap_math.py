@@ -19,9 +19,13 @@ import filecmp
 import os
 import io
 import re
+import tempfile
 from contextlib import redirect_stdout
 
 from pcapgraph.pcap_math import PcapMath
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import save_pcap, write_pcap
+from pcapgraph.spill_math import SpillPcapMath
 from tests import setup_testenv, DEFAULT_CLI_ARGS, EXPECTED_UNION_STDOUT
 
 
@@ -58,6 +62,18 @@ class TestPcapMath(unittest.TestCase):
         excluded_filenames = exclude_set_obj.parse_set_args(args)
         self.assertEqual(filenames, excluded_filenames)
 
+    def test_get_set_results(self):
+        """Set results are not saved until an output asks for them."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        args['--inverse-bounded'] = True
+        set_results = self.set_obj.get_set_results(args)
+        result_names = [set_result.name for set_result in set_results]
+        self.assertEqual(result_names[0], 'intersect.pcap')
+        self.assertEqual(len(set_results[0]), 72)
+        for result_name in result_names:
+            self.assertFalse(os.path.exists(result_name))
+
     def test_union_pcap(self):
         """Test union_pcap using the pcaps in examples."""
         # These 4 lines will save generated_stdout from union()
@@ -74,6 +90,39 @@ class TestPcapMath(unittest.TestCase):
             filecmp.cmp('union.pcap', 'examples/set_ops/union.pcap'))
         os.remove('union.pcap')
 
+    def test_union_mixed_linktypes(self):
+        """A union of pcaps with different linktypes keeps each linktype."""
+        ip_frame = bytes.fromhex('450000140001000040000000c0a80001c0a80002')
+        eth_frame = bytes(12) + b'\x08\x00' + ip_frame
+        expected = [(1, eth_frame, 1), (2, ip_frame, 101),
+                    (3, eth_frame + b'\0', 1), (4, ip_frame + b'\0', 101)]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filenames = [os.path.join(temp_dir, 'eth.pcap'),
+                         os.path.join(temp_dir, 'ip.pcap')]
+            for pcap_index, (filename, frame, linktype) in enumerate(
+                    zip(filenames, [eth_frame, ip_frame], [1, 101])):
+                with open(filename, 'wb') as pcap_file:
+                    write_pcap(pcap_file,
+                               [(1 + pcap_index, frame),
+                                (3 + pcap_index, frame + b'\0')], linktype)
+            name = os.path.join(temp_dir, 'union.pcap')
+            for engine in [PcapMath, SpillPcapMath]:
+                union = engine(filenames, self.options)
+                with redirect_stdout(io.StringIO()):
+                    union = union.get_set_results(
+                        dict(DEFAULT_CLI_ARGS, **{
+                            '--union': True,
+                            '--difference': False,
+                            '--intersection': False,
+                            '--symmetric-difference': False
+                        }))[0]
+                # Classic pcap has one linktype.
+                with self.assertRaises(SyntaxError):
+                    save_pcap(union.frames, name, self.options)
+                save_pcap(union.frames, name,
+                          dict(self.options, pcapng=True))
+                self.assertEqual(list(iter_frames(name + 'ng')), expected)
+
     def test_intersect_pcap(self):
         """Test union_pcap using the pcaps in examples."""
         # This will generate intersect.pcap in tests/
@@ -114,6 +163,26 @@ class TestPcapMath(unittest.TestCase):
         os.remove('symdiff_simul2.pcap')
         os.remove('symdiff_simul3.pcap')
 
+    def test_multiset(self):
+        """Test that multiset operations keep repeated frames.
+
+        A 'sum' union keeps every frame of every pcap and a multiset
+        intersection has as many frames as the min count of each frame.
+        """
+        options = dict(self.options, multiset='sum')
+        multiset_obj = PcapMath(self.set_obj.filenames, options)
+        frame_total = sum(
+            len(pcap) for pcap in multiset_obj.pcap_json_dict.values())
+        union_frames = multiset_obj.get_multiset_frames(
+            multiset_obj.get_frame_counts('sum'))
+        self.assertEqual(frame_total, len(union_frames))
+
+        min_counts = multiset_obj.get_frame_counts('min')
+        intersect_frames = multiset_obj.get_multiset_frames(min_counts)
+        self.assertEqual(int(min_counts.sum()), len(intersect_frames))
+        self.assertTrue(set(dict(intersect_frames)).issubset(
+            dict(union_frames)))
+
     def test_get_minmax_common_frames(self):
         """Test get_minmax_common against expected frame outputs"""
         min_frame = '881544abbfdd2477035113440800450000547baf40004001922a0a3' \
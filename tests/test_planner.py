@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test planner.py."""
+
+import unittest
+
+from pcapgraph.planner import estimate_frame_count, choose_engine
+from tests import setup_testenv, DEFAULT_CLI_ARGS
+
+
+class TestPlanner(unittest.TestCase):
+    """Test planner.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.args = dict(DEFAULT_CLI_ARGS)
+        self.options = {'strip-l2': False, 'strip-l3': False, 'pcapng': False}
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+
+    def test_estimate_frame_count(self):
+        """Estimates should be close to the real frame count."""
+        frame_count, _ = estimate_frame_count('examples/simul1.pcap')
+        self.assertAlmostEqual(frame_count, 232, delta=232 // 10)
+        # Small pcaps are counted exactly.
+        self.assertEqual(estimate_frame_count('tests/files/test.pcap'),
+                         (1, 98))
+        self.assertEqual(estimate_frame_count('tests/files/empty.pcap'),
+                         (0, 0))
+
+    def test_choose_engine(self):
+        """Spill only if pcaps don't fit and use memory where required."""
+        # Graphing alone needs no engine. Other tests change the defaults.
+        for flag in ['--difference', '--intersection', '--union',
+                     '--symmetric-difference', '--bounded-intersection',
+                     '--inverse-bounded']:
+            self.args[flag] = False
+        self.assertIsNone(
+            choose_engine(self.filenames, self.args, self.options)[0])
+        self.args['--union'] = True
+        self.options['max-memory'] = 2**40
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'memory')
+        self.options['max-memory'] = 100000
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'spill')
+        self.args['--bounded-intersection'] = True
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'memory')
+        # Overrides are used as is unless they cannot do the operation.
+        self.args['--engine'] = 'stream'
+        with self.assertRaises(SyntaxError):
+            choose_engine(self.filenames, self.args, self.options)
+        self.args['--bounded-intersection'] = False
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'stream')
+        self.args['--overlap'] = True
+        with self.assertRaises(SyntaxError):
+            choose_engine(self.filenames, self.args, self.options)
+        self.args['--engine'] = 'auto'
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'memory')
+        # A saved comparison is always updated incrementally.
+        self.args['--state'] = 'comparison'
+        self.assertEqual(
+            choose_engine(self.filenames, self.args, self.options)[0],
+            'incremental')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test read_file.py."""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+from pcapgraph import read_file
+from pcapgraph.read_file import iter_frames, get_capture_format, \
+    get_linktype, format_timestamp, parse_timestamp, iter_frame_sources, \
+    FrameReader
+from tests import setup_testenv
+
+
+class TestReadFile(unittest.TestCase):
+    """Test read_file.py"""
+
+    def setUp(self):
+        """Setup env."""
+        setup_testenv()
+        self.test_packet = "247703511344881544abbfdd0800452000542bbc00007901" \
+                           "e8fd080808080a301290000082a563110001f930ab5b0000" \
+                           "0000a9e80d0000000000101112131415161718191a1b1c1d" \
+                           "1e1f202122232425262728292a2b2c2d2e2f303132333435" \
+                           "3637"
+
+    def test_iter_frames(self):
+        """Read frames from pcap and pcapng files without tshark."""
+        frames = list(iter_frames('tests/files/test.pcap'))
+        self.assertEqual(len(frames), 1)
+        timestamp, frame, linktype = frames[0]
+        self.assertEqual(format_timestamp(timestamp), '1537945792.667334000')
+        self.assertEqual(frame.hex(), self.test_packet)
+        self.assertEqual(linktype, 1)
+        # simul1.pcap is a pcapng with nanosecond timestamps.
+        self.assertEqual(len(list(iter_frames('examples/simul1.pcap'))), 232)
+        self.assertEqual(list(iter_frames('tests/files/empty.pcap')), [])
+
+    def test_read_frame_sources(self):
+        """Frames are read again by the offsets of iter_frame_sources."""
+        for filename in ['tests/files/test.pcap', 'examples/simul1.pcap']:
+            sources = list(iter_frame_sources(filename))
+            with FrameReader([filename]) as frame_reader:
+                # Backwards, so captures are read out of order.
+                for _, frame, _, offset in reversed(sources):
+                    self.assertEqual(
+                        frame_reader.read(0, offset, len(frame)), frame)
+
+    def test_read_compressed_frame_sources(self):
+        """A compressed capture is decompressed once to be read backwards."""
+        with open('examples/simul1.pcap', 'rb') as pcap_file:
+            pcap = pcap_file.read()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'simul1.pcap.gz')
+            with open(filename, 'wb') as gzip_file:
+                gzip_file.write(gzip.compress(pcap))
+            sources = list(iter_frame_sources(filename))
+            open_capture = read_file.open_capture
+            opened = []
+
+            def record_open(name):
+                """Record each decompression of the capture."""
+                opened.append(name)
+                return open_capture(name)
+
+            read_file.open_capture = record_open
+            try:
+                with FrameReader([filename]) as frame_reader:
+                    for _, frame, _, offset in reversed(sources):
+                        self.assertEqual(
+                            frame_reader.read(0, offset, len(frame)), frame)
+            finally:
+                read_file.open_capture = open_capture
+        # Once to read the last frame and once to copy it to a temp file.
+        self.assertEqual(opened, [filename, filename])
+
+    def test_get_capture_format(self):
+        """Detect capture formats by magic bytes."""
+        self.assertEqual(get_capture_format(b'\xd4\xc3\xb2\xa1'), 'pcap')
+        self.assertEqual(get_capture_format(b'\xa1\xb2\x3c\x4d'), 'pcap')
+        self.assertEqual(get_capture_format(b'\n\r\r\n'), 'pcapng')
+        self.assertEqual(get_capture_format(b'text'), '')
+
+    def test_get_linktype(self):
+        """Ethernet captures have linktype 1."""
+        self.assertEqual(get_linktype('examples/simul1.pcap'), 1)
+
+    def test_parse_timestamp(self):
+        """Parse tshark timestamps of any precision to ns."""
+        self.assertEqual(parse_timestamp('1537945792.667334000'),
+                         1537945792667334000)
+        self.assertEqual(parse_timestamp('1537945792.6'), 1537945792600000000)
+        self.assertEqual(parse_timestamp('1537945792'), 1537945792000000000)
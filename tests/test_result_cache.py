@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test result_cache.py."""
+
+import unittest
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+
+from pcapgraph.result_cache import ResultCache, get_cache_key
+from pcapgraph.save_file import get_capture_records
+from pcapgraph.set_result import SetResult
+from tests import setup_testenv, DEFAULT_CLI_ARGS
+
+
+class TestResultCache(unittest.TestCase):
+    """Test result_cache.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars and an empty cache."""
+        setup_testenv()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.cache_dir.name, 2**20)
+        self.options = {
+            'strip-l2': False,
+            'strip-l3': False,
+            'pcapng': False,
+            'max-skew': 2
+        }
+        self.frames = {
+            'aabb': '1537945792.655360000',
+            'ccdd': '1537945792.720895000'
+        }
+
+    def tearDown(self):
+        """Remove the cache."""
+        self.cache_dir.cleanup()
+
+    def test_get_cache_key(self):
+        """Keys depend on contents, flags, options and the engine."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--union'] = True
+        filenames = ['examples/simul1.pcap', 'examples/simul2.pcap']
+        key = get_cache_key(filenames, args, self.options, 'memory')
+        self.assertEqual(
+            key, get_cache_key(filenames, args, self.options, 'memory'))
+        for engine in ['spill', 'stream', 'incremental']:
+            self.assertNotEqual(
+                key, get_cache_key(filenames, args, self.options, engine))
+        self.assertNotEqual(
+            key,
+            get_cache_key(filenames[::-1], args, self.options, 'memory'))
+        args['--intersection'] = True
+        self.assertNotEqual(
+            key, get_cache_key(filenames, args, self.options, 'memory'))
+
+    def test_load(self):
+        """Stored results and their pcaps are loaded as they were."""
+        set_result = SetResult('union.pcap', self.frames, self.options)
+        self.cache.store('key', [set_result], 'printed\n')
+        f_stream = io.StringIO()
+        with redirect_stdout(f_stream):
+            cached_results = self.cache.load('key', self.options)
+        self.assertEqual(f_stream.getvalue(), 'printed\n')
+        self.assertEqual(cached_results[0].name, 'union.pcap')
+        self.assertEqual(
+            list(cached_results[0].get_frame_pairs()),
+            sorted(self.frames.items()))
+        self.assertFalse(cached_results[0].cached_pcap)
+
+        # Pcaps are added once they are saved.
+        with open('union.pcap', 'w') as pcap:
+            pcap.write('pcap')
+        set_result.saved = True
+        self.cache.store('key', [set_result])
+        os.remove('union.pcap')
+        with redirect_stdout(io.StringIO()):
+            cached_results = self.cache.load('key', self.options)
+        cached_results[0].save()
+        with open('union.pcap') as pcap:
+            self.assertEqual(pcap.read(), 'pcap')
+        os.remove('union.pcap')
+
+    def test_load_saved_records(self):
+        """Cached results keep the linktype, interfaces and comments."""
+
+        class AnnotatedFrames(list):
+            """Frames saved as captured with their pcaps, like MergedFrames."""
+            source_names = ['a.pcap', 'b.pcap']
+            original_linktype = 113
+
+            def iter_annotated_records(self):
+                """Yield the records."""
+                return iter(self)
+
+        options = dict(self.options, pcapng=True)
+        records = [(1, b'\xaa\xbb', 1, 'Seen in b.pcap'),
+                   (2, b'\xcc', 0, 'Seen in a.pcap, b.pcap')]
+        self.cache.store(
+            'key',
+            [SetResult('union.pcap', AnnotatedFrames(records), options)])
+        with redirect_stdout(io.StringIO()):
+            cached_results = self.cache.load('key', options)
+        cached_records, interface_names, linktype = get_capture_records(
+            cached_results[0].frames, options)
+        self.assertEqual(list(cached_records), records)
+        self.assertEqual(list(interface_names), ['a.pcap', 'b.pcap'])
+        self.assertEqual(linktype, 113)
+
+    def test_damaged_entry(self):
+        """Entries whose files changed are not used."""
+        self.cache.store(
+            'key', [SetResult('union.pcap', self.frames, self.options)])
+        with open(os.path.join(self.cache_dir.name, 'key', '0.npz'),
+                  'ab') as frames:
+            frames.write(b'\x00')
+        self.assertIsNone(self.cache.load('key', self.options))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.cache_dir.name, 'key')))
+
+    def test_evict(self):
+        """The least recently used entries are removed first."""
+        set_results = [SetResult('union.pcap', self.frames, self.options)]
+        self.cache.store('old', set_results)
+        entry_size = sum(
+            entry.stat().st_size for entry in os.scandir(
+                os.path.join(self.cache_dir.name, 'old')))
+        os.utime(
+            os.path.join(self.cache_dir.name, 'old', 'entry.json'), (0, 0))
+        self.cache.max_size = entry_size * 3 // 2
+        self.cache.store('new', set_results)
+        self.assertEqual(os.listdir(self.cache_dir.name), ['new'])
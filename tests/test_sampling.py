@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test sampling.py."""
+
+import unittest
+
+from pcapgraph.read_file import iter_frames
+from pcapgraph.sampling import parse_sample_rate, is_sampled, \
+    get_confidence_interval
+from pcapgraph.spill_math import SpillPcapMath
+from tests import setup_testenv, DEFAULT_CLI_ARGS
+
+
+class TestSampling(unittest.TestCase):
+    """Test sampling.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {
+            'strip-l2': False,
+            'strip-l3': False,
+            'pcapng': False,
+            'sample': 4
+        }
+        self.filenames = ['examples/simul1.pcap', 'examples/simul2.pcap']
+
+    def test_parse_sample_rate(self):
+        """Rates are 1/N or N."""
+        self.assertEqual(parse_sample_rate('1/64'), 64)
+        self.assertEqual(parse_sample_rate('8'), 8)
+        for sample in ['2/64', '1/0', '0.5', '1/x']:
+            with self.assertRaises(SyntaxError):
+                parse_sample_rate(sample)
+
+    def test_is_sampled(self):
+        """About 1/N of frames are kept, and all if N is 1."""
+        frames = [format(num, '08x') for num in range(40000)]
+        sampled = [
+            frame for frame in frames if is_sampled(frame, self.options)
+        ]
+        self.assertAlmostEqual(len(sampled), 10000, delta=400)
+        self.assertTrue(all(is_sampled(frame, {}) for frame in frames[:100]))
+
+    def test_get_confidence_interval(self):
+        """Intervals contain the proportion and narrow with more frames."""
+        low, high = get_confidence_interval(30, 100)
+        self.assertTrue(low < 0.3 < high)
+        wide_low, wide_high = get_confidence_interval(3, 10)
+        self.assertTrue(wide_low < low and high < wide_high)
+        self.assertEqual(get_confidence_interval(0, 0), (0.0, 1.0))
+
+    def test_sampled_intersection(self):
+        """A sampled intersection is the intersection of sampled frames."""
+        pcap_frames = [{frame.hex()
+                        for _, frame, _ in iter_frames(filename)
+                        if is_sampled(frame.hex(), self.options)}
+                       for filename in self.filenames]
+        args = dict(DEFAULT_CLI_ARGS)
+        for flag in ['--difference', '--symmetric-difference', '--union']:
+            args[flag] = False
+        args['--intersection'] = True
+        spill_math = SpillPcapMath(self.filenames, self.options)
+        intersection = spill_math.get_set_results(args)[0]
+        self.assertEqual(
+            {frame for frame, _ in intersection.get_frame_pairs()},
+            pcap_frames[0] & pcap_frames[1])
+        self.assertLess(len(intersection), 152 // 2)
@@ -16,10 +16,14 @@
 
 import unittest
 import filecmp
-import shutil
+import json
 import os
+import tempfile
 
-from pcapgraph.save_file import convert_to_pcaptext, reorder_packets, save_pcap
+from pcapgraph.read_file import iter_frames
+from pcapgraph.save_file import convert_to_pcaptext, save_pcap
+from pcapgraph.save_file import iter_pcaptext_chunks
+from pcapgraph.save_file import iter_sorted_records
 from tests import setup_testenv
 
 
@@ -50,22 +54,107 @@ class TestSaveFile(unittest.TestCase):
         expected = self.result_packet
         self.assertEqual(expected, actual)
 
-    def test_reorder_packets(self):
-        """Reorder packets in tempfile inplace and compare with expected."""
-        out_of_order = 'tests/files/out_of_order_packets.pcap'
-        temp_out_of_order = 'tests/files/out_of_order_temp.pcap'
-        in_order = 'tests/files/in_order_packets.pcap'
-
-        shutil.copyfile(out_of_order, temp_out_of_order)
-        self.assertTrue(filecmp.cmp(temp_out_of_order, out_of_order))
-        reorder_packets(temp_out_of_order)
-
-        self.assertTrue(filecmp.cmp(temp_out_of_order, in_order))
-        os.remove(temp_out_of_order)
+    def test_iter_pcaptext_chunks(self):
+        """Chunks have a timestamp per frame and hex offsets past 0x90."""
+        records = [(1537945792667334763, bytes.fromhex(self.test_packet)),
+                   (1, bytes(range(200)))]
+        pcap_text = b''.join(iter_pcaptext_chunks(records)).decode()
+        expected_start = '1537945792.667334763\n' + self.result_packet + \
+            '0.000000001\n'
+        self.assertTrue(pcap_text.startswith(expected_start))
+        self.assertIn('\n00a0  a0 a1 a2', pcap_text)
+        self.assertTrue(pcap_text.endswith('00c0  c0 c1 c2 c3 c4 c5 c6 c7'
+                                           + ' ' * 8 + '\n'))
 
     def test_save_pcap(self):
         """test save_pacp."""
         pcap_dict = {self.test_packet: '1537945792.667334763'}
         save_pcap(pcap_dict=pcap_dict, name='test.pcap', options=self.options)
+        self.assertEqual(list(iter_frames('test.pcap')),
+                         [(1537945792667334763,
+                           bytes.fromhex(self.test_packet), 1)])
+        os.remove('test.pcap')
+
+    def test_save_pcapng(self):
+        """Save pcapng with ns timestamps and frames sorted by time."""
+        options = dict(self.options, pcapng=True, linktype=101)
+        pcap_dict = {
+            self.test_packet[28:]: '1537945792.667334763',
+            self.test_packet[28:-2]: '1537945792.000000001'
+        }
+        save_pcap(pcap_dict=pcap_dict, name='test.pcap', options=options)
+        self.assertEqual(list(iter_frames('test.pcapng')),
+                         [(1537945792000000001,
+                           bytes.fromhex(self.test_packet[28:-2]), 101),
+                          (1537945792667334763,
+                           bytes.fromhex(self.test_packet[28:]), 101)])
+        os.remove('test.pcapng')
+
+    def test_iter_sorted_records(self):
+        """Runs sorted on disk merge like one stable sort in memory."""
+        records = [(timestamp % 7, bytes([index]) * 10)
+                   for index, timestamp in enumerate(range(50, 0, -3))]
+        expected = sorted(records, key=lambda record: record[0])
+        self.assertEqual(list(iter_sorted_records(records)), expected)
+        self.assertEqual(list(iter_sorted_records(records, run_bytes=25)),
+                         expected)
+
+    def test_save_annotated_pcapng(self):
+        """Annotated records are saved on the interface of their pcap."""
+
+        class AnnotatedFrames(list):
+            """Frames with the pcaps that saw them, like MergedFrames."""
+            source_names = ['a.pcap', 'b.pcap']
+
+            def iter_annotated_records(self):
+                """Yield the records."""
+                return iter(self)
+
+        frame = bytes.fromhex(self.test_packet)
+        pcap_dict = AnnotatedFrames([(1, frame, 1, 'Seen in b.pcap'),
+                                     (2, frame, 0, '')])
+        options = dict(self.options, pcapng=True)
+        save_pcap(pcap_dict=pcap_dict, name='test.pcap', options=options)
+        self.assertEqual(list(iter_frames('test.pcapng')),
+                         [(1, frame, 1), (2, frame, 1)])
+        with open('test.pcapng', 'rb') as pcapng_file:
+            pcapng = pcapng_file.read()
+        self.assertIn(b'Seen in b.pcap', pcapng)
+        self.assertIn(b'b.pcap\0\0', pcapng)
+        os.remove('test.pcapng')
+
+    def test_save_split_pcap(self):
+        """Parts end before the size limit or at the end of an interval."""
+        frame = bytes.fromhex(self.test_packet)
+        frame_pairs = [(self.test_packet, '%d.0' % second)
+                       for second in [0, 1, 2, 3, 10, 11]]
+        record_bytes = 16 + len(frame)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            name = os.path.join(temp_dir, 'union.pcap')
+            options = dict(self.options, **{
+                'split-size': 3 * record_bytes,
+                'split-interval': 5 * 10**9
+            })
+            save_pcap(pcap_dict=frame_pairs, name=name, options=options)
+            with open(os.path.join(temp_dir, 'union_index.json')) as index:
+                self.assertEqual(json.load(index), [
+                    {'file': 'union_00001.pcap', 'first': '0.000000000',
+                     'last': '2.000000000', 'frames': 3},
+                    {'file': 'union_00002.pcap', 'first': '3.000000000',
+                     'last': '3.000000000', 'frames': 1},
+                    {'file': 'union_00003.pcap', 'first': '10.000000000',
+                     'last': '11.000000000', 'frames': 2},
+                ])
+            self.assertEqual(
+                list(iter_frames(os.path.join(temp_dir,
+                                              'union_00003.pcap'))),
+                [(10**10, frame, 1), (11 * 10**9, frame, 1)])
+            self.assertFalse(os.path.exists(name))
+
+    def test_save_pcap_text2pcap(self):
+        """Save with text2pcap like before the native writer."""
+        pcap_dict = {self.test_packet: '1537945792.667334763'}
+        options = dict(self.options, writer='text2pcap')
+        save_pcap(pcap_dict=pcap_dict, name='test.pcap', options=options)
         self.assertTrue(filecmp.cmp('test.pcap', 'tests/files/test.pcap'))
         os.remove('test.pcap')
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test scheduler.py."""
+
+import threading
+import unittest
+
+from pcapgraph.scheduler import get_needed_tasks
+from pcapgraph.scheduler import run_graph
+
+
+class TestScheduler(unittest.TestCase):
+    """Test scheduler.py."""
+
+    def setUp(self):
+        """Set up a diamond of tasks that records its calls."""
+        self.calls = []
+        self.lock = threading.Lock()
+        self.tasks = {
+            'index': (self.get_task('index'), []),
+            'intersection': (self.get_task('intersection'), ['index']),
+            'complements': (self.get_task('complements'), ['index']),
+            'bounded':
+            (self.get_task('bounded'), ['intersection', 'complements']),
+            'count-table': (self.get_task('count-table'), []),
+        }
+
+    def get_task(self, name):
+        """Get a task that records that it ran and returns its name."""
+
+        def task():
+            with self.lock:
+                self.calls.append(name)
+            return name
+
+        return task
+
+    def test_get_needed_tasks(self):
+        """Only targets and their dependencies are needed."""
+        self.assertEqual(
+            get_needed_tasks(self.tasks, ['intersection']),
+            {'index', 'intersection'})
+
+    def test_run_graph(self):
+        """Every needed task runs once, after its dependencies."""
+        results = run_graph(self.tasks, ['bounded', 'intersection'])
+        self.assertEqual(
+            results, {
+                'index': 'index',
+                'intersection': 'intersection',
+                'complements': 'complements',
+                'bounded': 'bounded'
+            })
+        # GIL-bound tasks run in the same order every time.
+        self.assertEqual(self.calls,
+                         ['index', 'complements', 'intersection', 'bounded'])
+
+    def test_run_graph_threads(self):
+        """GIL-bound tasks run in this thread, I/O-bound ones on threads."""
+        threads = {}
+
+        def get_thread_task(name):
+            def task():
+                threads[name] = threading.get_ident()
+                return name
+            return task
+
+        tasks = {
+            'index': (get_thread_task('index'), []),
+            'load': (get_thread_task('load'), [], True),
+            'intersection':
+            (get_thread_task('intersection'), ['index', 'load']),
+        }
+        results = run_graph(tasks, ['intersection'])
+        self.assertEqual(set(results), {'index', 'load', 'intersection'})
+        self.assertEqual(threads['index'], threading.get_ident())
+        self.assertEqual(threads['intersection'], threading.get_ident())
+        self.assertNotEqual(threads['load'], threading.get_ident())
+
+    def test_run_graph_cycle(self):
+        """Cyclic dependencies can never run."""
+        self.tasks['index'] = (self.get_task('index'), ['bounded'])
+        with self.assertRaises(ValueError):
+            run_graph(self.tasks, ['bounded'])
+        self.assertEqual(self.calls, [])
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test set_result.py."""
+
+import os
+import tempfile
+import unittest
+
+from pcapgraph.read_file import iter_frames
+from pcapgraph.set_result import SetResult, save_results
+from tests import setup_testenv
+
+
+class TestSetResult(unittest.TestCase):
+    """Test set_result.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False, 'pcapng': False}
+
+    def test_get_time_bounds(self):
+        """Time bounds come from the frames without saving them."""
+        frame_dict = SetResult('union.pcap', {
+            'aa': '1537945792.720895000',
+            'bb': '1537945792.655360000'
+        }, self.options)
+        self.assertEqual(frame_dict.get_time_bounds(),
+                         (1537945792655360000, 1537945792720895000))
+        frame_pairs = SetResult('union.pcap', [('aa', '2.5'), ('aa', '1.0')],
+                                self.options)
+        self.assertEqual(len(frame_pairs), 2)
+        self.assertEqual(frame_pairs.get_time_bounds(),
+                         (1000000000, 2500000000))
+        self.assertEqual(
+            SetResult('union.pcap', {}, self.options).get_time_bounds(), ())
+        self.assertFalse(frame_pairs.saved)
+
+    def test_save_results(self):
+        """Results are saved on a pool of threads under their own names."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            set_results = [
+                SetResult('symdiff_simul' + str(index) + '.pcap',
+                          {'%02x' % index: '%d.0' % index}, self.options)
+                for index in range(1, 9)
+            ]
+            filenames = save_results(set_results, temp_dir, workers=4)
+            self.assertEqual(filenames, [
+                os.path.join(temp_dir, set_result.name)
+                for set_result in set_results
+            ])
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             sorted(set_result.name
+                                    for set_result in set_results))
+            self.assertEqual(list(iter_frames(filenames[2])),
+                             [(3000000000, b'\x03', 1)])
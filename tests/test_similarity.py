@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test similarity.py."""
+
+import unittest
+
+from pcapgraph.similarity import get_signatures, get_similar_pairs, \
+    get_cluster_order
+from tests import setup_testenv
+
+
+class TestSimilarity(unittest.TestCase):
+    """Test similarity.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False, 'workers': 1}
+        self.filenames = [
+            'examples/simul1.pcap',
+            'tests/files/test.pcap',
+            'examples/simul2.pcap',
+            'tests/files/empty.pcap',
+            'examples/simul1.pcap',
+        ]
+
+    def test_get_similar_pairs(self):
+        """Similar pcaps are found and pcaps without frames are not."""
+        signatures = get_signatures(self.filenames, self.options)
+        similar_pairs = get_similar_pairs(signatures)
+        self.assertEqual(similar_pairs[0], (1.0, 0, 4))
+        # simul1 and simul2 have ~45% of their frames in common.
+        self.assertEqual([pair[1:] for pair in similar_pairs[1:]],
+                         [(0, 2), (2, 4)])
+        self.assertAlmostEqual(similar_pairs[1][0], 0.45, delta=0.1)
+        self.assertEqual(
+            get_cluster_order(similar_pairs, len(self.filenames)),
+            [0, 2, 4, 1, 3])
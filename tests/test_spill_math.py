@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test spill_math.py."""
+
+import unittest
+import filecmp
+import os
+import io
+import re
+from contextlib import redirect_stdout
+
+from pcapgraph.spill_math import SpillPcapMath, parse_size
+from tests import setup_testenv, DEFAULT_CLI_ARGS, EXPECTED_UNION_STDOUT
+
+
+class TestSpillMath(unittest.TestCase):
+    """Test spill_math.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Make sure that tshark is in PATH."""
+        setup_testenv()
+        # Small enough that the simul pcaps are split into several buckets.
+        self.options = {
+            'strip-l2': False,
+            'strip-l3': False,
+            'pcapng': False,
+            'max-memory': 100000
+        }
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+
+    def test_parse_size(self):
+        """Sizes are powers of 1024."""
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(parse_size('2K'), 2048)
+        self.assertEqual(parse_size('1.5G'), 1610612736)
+        with self.assertRaises(SyntaxError):
+            parse_size('lots')
+
+    def test_union_pcap(self):
+        """Spilled union should be identical to the in-memory union."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--union'] = True
+        spill_obj = SpillPcapMath(self.filenames, self.options)
+        self.assertGreater(spill_obj.get_bucket_count(), 1)
+        f_stream = io.StringIO()
+        with redirect_stdout(f_stream):
+            spill_obj.parse_set_args(args)
+        generated_stdout = f_stream.getvalue()
+        generated_stdout = re.sub(r' +$', '', generated_stdout, flags=re.M)
+
+        self.assertEqual(EXPECTED_UNION_STDOUT, generated_stdout)
+        self.assertTrue(
+            filecmp.cmp('union.pcap', 'examples/set_ops/union.pcap'))
+        os.remove('union.pcap')
+
+    def test_intersect_pcap(self):
+        """Spilled intersection should be identical to the in-memory one."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        spill_obj = SpillPcapMath(self.filenames, self.options)
+        spill_obj.parse_set_args(args)
+        self.assertTrue(
+            filecmp.cmp('intersect.pcap', 'examples/set_ops/intersect.pcap'))
+        os.remove('intersect.pcap')
+
+    def test_stripped_intersect_pcap(self):
+        """Stripped frames should be saved as the first pcap captured them."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        options = dict(self.options, **{'strip-l2': True})
+        spill_obj = SpillPcapMath(self.filenames, options)
+        spill_obj.parse_set_args(args)
+        self.assertTrue(
+            filecmp.cmp('intersect.pcap', 'examples/set_ops/intersect.pcap'))
+        os.remove('intersect.pcap')
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test stream_math.py."""
+
+import unittest
+import filecmp
+import os
+
+from pcapgraph.stream_math import StreamPcapMath
+from tests import setup_testenv, DEFAULT_CLI_ARGS
+
+
+class TestStreamMath(unittest.TestCase):
+    """Test stream_math.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Make sure that tshark is in PATH."""
+        setup_testenv()
+        self.options = {
+            'strip-l2': False,
+            'strip-l3': False,
+            'pcapng': False,
+            'max-skew': 2
+        }
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+
+    def test_stream_set_operations(self):
+        """Streamed results should have the frames of PcapMath's results."""
+        stream_obj = StreamPcapMath(self.filenames, self.options)
+        results = {}
+        for operation, pcap_index, frame, _, _ in \
+                stream_obj.stream_set_operations(['intersection', 'union']):
+            results.setdefault((operation, pcap_index), []).append(frame)
+        self.assertEqual(len(results[('intersection', 0)]), 72)
+        self.assertEqual(len(results[('union', 0)]), 394)
+        self.assertEqual(stream_obj.frame_counts, [232, 236, 234])
+
+    def test_parse_set_args(self):
+        """Streamed intersection should save the same pcap as PcapMath."""
+        args = dict(DEFAULT_CLI_ARGS)
+        args['--intersection'] = True
+        stream_obj = StreamPcapMath(self.filenames, self.options)
+        filenames = stream_obj.parse_set_args(args)
+        self.assertEqual(filenames, self.filenames + ['intersect.pcap'])
+        self.assertTrue(
+            filecmp.cmp('intersect.pcap', 'examples/set_ops/intersect.pcap'))
+        os.remove('intersect.pcap')
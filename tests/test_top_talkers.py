@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test top_talkers.py."""
+
+import itertools
+import unittest
+
+from pcapgraph.read_file import iter_frames
+from pcapgraph.top_talkers import SpaceSaving, get_talker_key, \
+    get_top_talkers
+from tests import setup_testenv
+
+
+class TestTopTalkers(unittest.TestCase):
+    """Test top_talkers.py. Expected to be run from project root."""
+
+    def setUp(self):
+        """Set up vars."""
+        setup_testenv()
+        self.options = {'strip-l2': False, 'strip-l3': False}
+        self.filenames = [
+            'examples/simul1.pcap',
+            'examples/simul2.pcap',
+            'examples/simul3.pcap'
+        ]
+
+    def test_space_saving(self):
+        """Heavy hitters are kept and counts are within their error."""
+        summary = SpaceSaving(10)
+        heavy_keys = ['storm'] * 500 + ['loop'] * 300
+        light_keys = [str(num) for num in range(1000)]
+        keys = [key for pair in itertools.zip_longest(heavy_keys, light_keys)
+                for key in pair if key]
+        for key in keys:
+            summary.add(key)
+        top = summary.get_top(2)
+        self.assertEqual([talker for talker, _, _ in top], ['storm', 'loop'])
+        for talker, count, error in top:
+            self.assertTrue(count - error <= keys.count(talker) <= count)
+        self.assertEqual(len(summary.counts), 10)
+        self.assertEqual(len(summary.heap), 10)
+
+    def test_get_talker_key(self):
+        """Flows, MACs and IPs are read from the frame's headers."""
+        _, frame, linktype = next(iter_frames(self.filenames[0]))
+        self.assertEqual(
+            get_talker_key(frame.hex(), linktype, 'flow'),
+            'ICMP 10.48.18.144 -> 8.8.8.8')
+        self.assertEqual(
+            get_talker_key(frame.hex(), linktype, 'mac'), '24:77:03:51:13:44')
+        self.assertEqual(
+            get_talker_key(frame.hex(), linktype, 'ip'), '10.48.18.144')
+        self.assertEqual(get_talker_key('0800', 1, 'ip'), '')
+
+    def test_get_top_talkers(self):
+        """Counts are exact while there are enough counters."""
+        frame_count, top_talkers = get_top_talkers(self.filenames,
+                                                   self.options, 2, 'ip')
+        self.assertEqual(frame_count, 702)
+        self.assertEqual(top_talkers, [('10.48.18.144', 351, 0),
+                                       ('10.128.128.128', 176, 0)])